@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Asset, Transaction, DividendEvent, DividendPayment
+from .models import Asset, AssetDividendCursor, DailyPrice, DividendSyncCursor, Quote, Transaction, DividendEvent, DividendPayment
 
 
 @admin.register(Asset)
@@ -11,6 +11,34 @@ class AssetAdmin(admin.ModelAdmin):
     search_fields = ("ticker", "name", "price_symbol")
 
 
+@admin.register(Quote)
+class QuoteAdmin(admin.ModelAdmin):
+    list_display = ("symbol", "price", "asof", "source", "fetched_at")
+    search_fields = ("symbol",)
+    ordering = ("symbol",)
+
+
+@admin.register(DailyPrice)
+class DailyPriceAdmin(admin.ModelAdmin):
+    list_display = ("symbol", "date", "close")
+    search_fields = ("symbol",)
+    ordering = ("symbol", "-date")
+
+
+@admin.register(DividendSyncCursor)
+class DividendSyncCursorAdmin(admin.ModelAdmin):
+    list_display = ("symbol", "last_ex_date", "last_fetched_at")
+    search_fields = ("symbol",)
+    ordering = ("symbol",)
+
+
+@admin.register(AssetDividendCursor)
+class AssetDividendCursorAdmin(admin.ModelAdmin):
+    list_display = ("asset", "symbol", "last_ex_date", "synced_at")
+    search_fields = ("symbol", "asset__ticker")
+    ordering = ("symbol",)
+
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ("asset", "type", "quantity", "price", "date")
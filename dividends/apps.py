@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DividendsConfig(AppConfig):
     name = "dividends"
+
+    def ready(self):
+        from dividends import signals  # noqa: F401
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from dividends.models import Asset
+from dividends.services.dashboard_cache import invalidate_dashboards
+from dividends.services.forecast_year import invalidate_forecasts
+from dividends.services.positions import rebuild_positions
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruit les positions matérialisées (AssetPosition, timeline incluse) depuis les transactions "
+        "et invalide les caches de prévision. Obligatoire après un import en masse : loaddata (raw=True), "
+        "bulk_create, bulk_update et QuerySet.update ne déclenchent pas les signaux de dividends/signals.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user-id", type=int, default=None)
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        qs = Asset.objects.order_by("id")
+        if opts["user_id"]:
+            qs = qs.filter(user_id=opts["user_id"])
+
+        ids = list(qs.values_list("id", flat=True))
+        size = max(1, opts["chunk_size"])
+        done = 0
+        for i in range(0, len(ids), size):
+            done += rebuild_positions(ids[i : i + size])
+
+        # les écritures sans signaux n'ont pas non plus invalidé les prévisions / fragments en cache
+        invalidate_forecasts(ids)
+        invalidate_dashboards(qs.values_list("user_id", flat=True).distinct())
+
+        self.stdout.write(self.style.SUCCESS(f"Done. positions={done}"))
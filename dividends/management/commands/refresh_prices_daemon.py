@@ -0,0 +1,252 @@
+import heapq
+import signal
+import time
+from collections import defaultdict
+from datetime import datetime, time as dtime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from dividends.models import Asset, AssetPosition, Quote
+from dividends.services.fetch_pipeline import FetchConfig, StageTimings, breaker_for, fetch_concurrent
+from dividends.services.market_data import get_provider
+from dividends.services.positions import refresh_stale_positions
+from dividends.services.quotes import store_quotes
+
+
+def _hhmm(s: str) -> dtime:
+    h, m = s.split(":")
+    return dtime(int(h), int(m))
+
+
+# Séances par place (Asset.exchange), sinon par devise ; complétées / remplacées par
+# DIVIDENDS_MARKET_CALENDARS. Inconnu : DIVIDENDS_MARKET_TZ / DIVIDENDS_MARKET_HOURS.
+MARKET_CALENDARS = {
+    "XPAR": ("Europe/Paris", "09:00", "17:35"),
+    "EPA": ("Europe/Paris", "09:00", "17:35"),
+    "XAMS": ("Europe/Amsterdam", "09:00", "17:35"),
+    "XBRU": ("Europe/Brussels", "09:00", "17:35"),
+    "XETRA": ("Europe/Berlin", "09:00", "17:30"),
+    "XETR": ("Europe/Berlin", "09:00", "17:30"),
+    "XLON": ("Europe/London", "08:00", "16:35"),
+    "LSE": ("Europe/London", "08:00", "16:35"),
+    "XSWX": ("Europe/Zurich", "09:00", "17:30"),
+    "NASDAQ": ("America/New_York", "09:30", "16:00"),
+    "XNAS": ("America/New_York", "09:30", "16:00"),
+    "NYSE": ("America/New_York", "09:30", "16:00"),
+    "XNYS": ("America/New_York", "09:30", "16:00"),
+    "EUR": ("Europe/Paris", "09:00", "17:35"),
+    "GBP": ("Europe/London", "08:00", "16:35"),
+    "GBX": ("Europe/London", "08:00", "16:35"),
+    "CHF": ("Europe/Zurich", "09:00", "17:30"),
+    "USD": ("America/New_York", "09:30", "16:00"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Rafraîchit les cours en continu : symboles détenus, par priorité "
+        "staleness (âge de la quote) x nb d'users qui détiennent une position non nulle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=10, help="Symboles rafraîchis par cycle.")
+        parser.add_argument("--interval", type=float, default=30, help="Pause entre cycles, marché ouvert (s).")
+        parser.add_argument(
+            "--closed-interval", type=float, default=900, help="Pause entre cycles, marché fermé (s)."
+        )
+        parser.add_argument("--min-age", type=float, default=60, help="Âge minimal d'une quote avant refresh (s).")
+        parser.add_argument("--rescan", type=float, default=300, help="Recalcul des détenteurs toutes les N s.")
+        parser.add_argument(
+            "--retry-base",
+            type=float,
+            default=60,
+            help="Attente après un 1er échec d'un symbole, doublée à chaque échec consécutif (s).",
+        )
+        parser.add_argument("--retry-max", type=float, default=6 * 3600, help="Attente maximale après échecs (s).")
+        parser.add_argument("--once", action="store_true", help="Un seul cycle (cron / debug).")
+        parser.add_argument("--max-cycles", type=int, default=0, help="Arrêt après N cycles (0 = infini).")
+        parser.add_argument("--replay", default=None, help="Rejoue les réponses enregistrées dans ce dossier.")
+        parser.add_argument("--record", default=None, help="Enregistre les réponses du provider dans ce dossier.")
+
+    # =========================
+    # Calendrier de marché, par place ou devise (lun-ven)
+    # =========================
+    def _calendars(self):
+        default_hours = getattr(settings, "DIVIDENDS_MARKET_HOURS", ("09:00", "17:35"))
+        default = (getattr(settings, "DIVIDENDS_MARKET_TZ", "Europe/Paris"), *default_hours)
+        table = {**MARKET_CALENDARS, **getattr(settings, "DIVIDENDS_MARKET_CALENDARS", {})}
+        self._markets = {
+            key.upper(): (ZoneInfo(tz), _hhmm(open_s), _hhmm(close_s))
+            for key, (tz, open_s, close_s) in [*table.items(), ("", default)]
+        }
+
+    def _market_key(self, exchange: str, currency: str) -> str:
+        for key in ((exchange or "").strip().upper(), (currency or "").strip().upper()):
+            if key and key in self._markets:
+                return key
+        return ""
+
+    def _is_open(self, market: str, now: datetime) -> bool:
+        tz, t_open, t_close = self._markets[market]
+        local = now.astimezone(tz)
+        return local.weekday() < 5 and t_open <= local.time() < t_close
+
+    def _last_close(self, market: str, now: datetime) -> datetime:
+        """Dernière clôture (jour ouvré) <= now."""
+        tz, _t_open, t_close = self._markets[market]
+        d = now.astimezone(tz).date()
+        while True:
+            close = datetime.combine(d, t_close, tzinfo=tz)
+            if d.weekday() < 5 and close <= now:
+                return close
+            d -= timedelta(days=1)
+
+    # =========================
+    # État : symbole -> (détenteurs, place de cotation, dernier fetch)
+    # =========================
+    def _scan(self):
+        holders = defaultdict(set)
+        markets = {}
+
+        # quantités lues sur AssetPosition : positions écrites sans signaux reconstruites d'abord
+        refresh_stale_positions(
+            {
+                aid: (n or 0, m)
+                for aid, n, m in Asset.objects.filter(is_active=True).values_list(
+                    "id", "position__tx_count", "position__tx_max_id"
+                )
+            }
+        )
+        rows = AssetPosition.objects.filter(quantity__gt=0, asset__is_active=True).values_list(
+            "asset__price_symbol", "asset__ticker", "asset__user_id", "asset__exchange", "asset__currency"
+        )
+        for price_symbol, ticker, user_id, exchange, currency in rows:
+            sym = (price_symbol or ticker or "").strip()
+            if sym:
+                holders[sym].add(user_id)
+                markets.setdefault(sym, self._market_key(exchange, currency))
+
+        fetched = dict(Quote.objects.filter(symbol__in=list(holders)).values_list("symbol", "fetched_at"))
+        # symboles jamais passés par Quote : on retombe sur Asset.last_price_asof
+        missing = [s for s in holders if s not in fetched]
+        if missing:
+            for sym, asof in (
+                Asset.objects.filter(price_symbol__in=missing)
+                .values("price_symbol")
+                .annotate(asof=Max("last_price_asof"))
+                .values_list("price_symbol", "asof")
+            ):
+                if asof:
+                    fetched[sym] = asof
+
+        return {s: len(u) for s, u in holders.items()}, markets, fetched
+
+    def handle(self, *args, **opts):
+        provider = get_provider(replay=opts["replay"], record=opts["record"], chunk_size=max(1, opts["batch"]))
+        breaker = breaker_for(provider.name)
+        cfg = FetchConfig.from_settings(workers=1)
+        epoch = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+        stop = {"flag": False}
+
+        def _stop(*_a):
+            stop["flag"] = True
+
+        try:
+            signal.signal(signal.SIGTERM, _stop)
+        except ValueError:  # pas dans le thread principal
+            pass
+
+        self._calendars()
+        holders, markets, fetched = {}, {}, {}
+        # échecs consécutifs par symbole -> pas de nouvel essai avant retry_at (backoff exponentiel)
+        failures, retry_at = defaultdict(int), {}
+        scanned_at = 0.0
+        cycles = refreshed = fail = 0
+        timings = StageTimings()
+
+        try:
+            while not stop["flag"]:
+                if time.monotonic() - scanned_at >= opts["rescan"] or not holders:
+                    with timings.stage("scan"):
+                        holders, markets, fetched = self._scan()
+                    scanned_at = time.monotonic()
+
+                now = timezone.now()
+                # état de chaque place une fois par cycle
+                open_now = {m: self._is_open(m, now) for m in set(markets.values())}
+                is_open = any(open_now.values())
+                min_age = timedelta(seconds=opts["min_age"])
+                cutoffs = {
+                    # place fermée : seuls les cours antérieurs à sa dernière clôture valent un appel
+                    m: now - min_age if o else self._last_close(m, now)
+                    for m, o in open_now.items()
+                }
+
+                def score(sym):
+                    age = (now - fetched.get(sym, epoch)).total_seconds()
+                    return age * holders[sym]
+
+                mono = time.monotonic()
+                due = [
+                    s
+                    for s in holders
+                    if fetched.get(s, epoch) < cutoffs[markets[s]] and retry_at.get(s, 0.0) <= mono
+                ]
+                batch = heapq.nlargest(max(1, opts["batch"]), due, key=score)
+
+                def failed(sym):
+                    failures[sym] += 1
+                    delay = min(opts["retry_base"] * 2 ** (failures[sym] - 1), opts["retry_max"])
+                    retry_at[sym] = time.monotonic() + delay
+
+                if batch:
+                    fetched_batch = fetch_concurrent(provider.quotes, [tuple(batch)], cfg, breaker, timings)
+                    for chunk, quotes, err in fetched_batch:
+                        if err is not None:
+                            fail += len(chunk)
+                            for sym in chunk:
+                                failed(sym)
+                            self.stdout.write(self.style.WARNING(f"FAIL {len(chunk)} symbols ({err})"))
+                            continue
+                        with timings.stage("write"):
+                            store_quotes(quotes.values())
+                        for sym in chunk:
+                            if sym in quotes:
+                                fetched[sym] = timezone.now()
+                                failures.pop(sym, None)
+                                retry_at.pop(sym, None)
+                                refreshed += 1
+                            else:
+                                fail += 1
+                                failed(sym)
+                                wait = retry_at[sym] - time.monotonic()
+                                msg = f"FAIL {sym} x{failures[sym]} (retry in {wait:.0f}s)"
+                                self.stdout.write(self.style.WARNING(msg))
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"{'OPEN' if is_open else 'CLOSED'} batch {len(batch)}/{len(due)} due "
+                            f"(top: {batch[0]} x{holders[batch[0]]})"
+                        )
+                    )
+
+                cycles += 1
+                if opts["once"] or (opts["max_cycles"] and cycles >= opts["max_cycles"]):
+                    break
+
+                # backoff hors séance : les cours ne bougent plus jusqu'à l'ouverture
+                pause = opts["interval"] if is_open else opts["closed_interval"]
+                end = time.monotonic() + pause
+                while not stop["flag"] and time.monotonic() < end:
+                    time.sleep(min(1.0, end - time.monotonic()))
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(f"Timings: {timings.report()}")
+        self.stdout.write(
+            f"Done. provider={provider.name} cycles={cycles} refreshed={refreshed} FAIL={fail} symbols={len(holders)}"
+        )
@@ -1,32 +1,76 @@
+import hashlib
+import time
+from collections import defaultdict
+from datetime import date, timedelta
 from decimal import Decimal
+
 from django.core.management.base import BaseCommand
-from django.db import IntegrityError, transaction
-from dividends.models import Asset, DividendEvent
-import yfinance as yf
+from django.utils import timezone
+from dividends.models import Asset, AssetDividendCursor, DividendEvent, DividendSyncCursor
+from dividends.services.dashboard_cache import invalidate_dashboards
+from dividends.services.fetch_pipeline import FetchConfig, StageTimings, breaker_for, fetch_concurrent
+from dividends.services.forecast_year import invalidate_forecasts
+from dividends.services.market_data import get_provider
+
+Q6 = Decimal("0.000001")  # amount_per_share: 6 décimales en base
 
 
 class Command(BaseCommand):
-    help = "Sync declared dividends (per share) from yfinance. Idempotent + safe on duplicates."
+    help = "Sync declared dividends (per share) from the market-data provider. Idempotent + safe on duplicates."
 
     def add_arguments(self, parser):
         parser.add_argument("--years", type=int, default=5)
         parser.add_argument("--limit", type=int, default=500)
         parser.add_argument("--user-id", type=int, default=None)
         parser.add_argument("--autofill-symbol", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--chunk-size", type=int, default=50, help="Symboles par appel provider.")
+        parser.add_argument("--replay", default=None, help="Rejoue les réponses enregistrées dans ce dossier.")
+        parser.add_argument("--record", default=None, help="Enregistre les réponses du provider dans ce dossier.")
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Fetchs concurrents (défaut: DIVIDENDS_FETCH_WORKERS)."
+        )
+        parser.add_argument(
+            "--rate", type=float, default=None, help="Appels provider / seconde (défaut: DIVIDENDS_FETCH_RATE)."
+        )
+        parser.add_argument(
+            "--min-interval-hours",
+            type=float,
+            default=None,
+            help="Saute les symboles récupérés depuis moins de N heures "
+            "(défaut: DIVIDENDS_DIVIDEND_SYNC_MIN_INTERVAL_HOURS).",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Ignore les curseurs (symboles et assets) : re-télécharge et re-vérifie tout l'historique.",
+        )
 
     def handle(self, *args, **opts):
         years = opts["years"]
         limit = opts["limit"]
         user_id = opts["user_id"]
         autofill = opts["autofill_symbol"]
+        full = opts["full"]
+        hours = opts["min_interval_hours"]
+        min_interval = DividendSyncCursor.min_interval() if hours is None else timedelta(hours=hours)
+        now = timezone.now()
+        # ✅ fenêtre calée sur l'année civile : l'empreinte de l'historique ne glisse pas chaque jour
+        since = date(timezone.localdate().year - years, 1, 1)
+        chunk_size = max(1, opts["chunk_size"])
+        provider = get_provider(replay=opts["replay"], record=opts["record"], chunk_size=chunk_size)
+        cfg = FetchConfig.from_settings(workers=opts["workers"], rate=opts["rate"])
 
         qs = Asset.objects.filter(is_active=True).order_by("id")
         if user_id:
             qs = qs.filter(user_id=user_id)
-        qs = qs[:limit]
+        qs = qs.only("id", "ticker", "price_symbol", "currency", "created_at")[:limit]
 
-        ok = created = fail = no_div = skipped = dup = 0
+        ok = fail = no_div = skipped = fresh = unchanged = 0
 
+        # ✅ symbole -> assets (plusieurs users peuvent détenir le même symbole : 1 seul download)
+        assets_by_symbol = defaultdict(list)
+        to_fill = []
         for a in qs:
             sym = (a.price_symbol or a.ticker or "").strip()
             if not sym:
@@ -36,60 +80,183 @@ class Command(BaseCommand):
 
             if autofill and not (a.price_symbol or "").strip():
                 a.price_symbol = sym
-                a.save(update_fields=["price_symbol"])
-
-            try:
-                t = yf.Ticker(sym)
-                s = t.dividends
-            except Exception as e:
-                fail += 1
-                self.stdout.write(self.style.WARNING(f"FAIL {a.ticker} (sym='{sym}') ({e})"))
-                continue
+                to_fill.append(a)
+
+            assets_by_symbol[sym].append(a)
+
+        if to_fill:
+            Asset.objects.bulk_update(to_fill, ["price_symbol"])
+
+        cursors = {} if full else DividendSyncCursor.objects.in_bulk(list(assets_by_symbol), field_name="symbol")
+        asset_cursors = (
+            {}
+            if full
+            else AssetDividendCursor.objects.in_bulk([a.id for assets in assets_by_symbol.values() for a in assets])
+        )
+        new_cursors = []
+        new_asset_cursors = []
 
-            if s is None or getattr(s, "empty", True):
-                no_div += 1
-                self.stdout.write(f"NO  {a.ticker} (sym='{sym}')")
-                ok += 1
+        def backfilled_after(a, sym):
+            # dernière ex-date déjà traitée pour CET asset ; None -> historique complet
+            acur = asset_cursors.get(a.id)
+            return acur.last_ex_date if acur is not None and acur.symbol == sym else None
+
+        def all_caught_up(sym, assets, cur):
+            # le curseur partagé ne vaut que si chaque asset a suivi le dernier passage sur ce symbole
+            # (asset nouveau, symbole changé, exclu d'un run par --user-id / --limit / is_active -> non)
+            if cur is None:
+                return False
+            for a in assets:
+                acur = asset_cursors.get(a.id)
+                if acur is None or acur.symbol != sym or acur.synced_at < cur.last_fetched_at:
+                    return False
+            return True
+
+        # 1) symboles à (re)télécharger (les autres ont été vus dans l'intervalle minimal)
+        to_fetch = []
+        for sym, assets in sorted(assets_by_symbol.items()):
+            cur = cursors.get(sym)
+            if all_caught_up(sym, assets, cur) and cur.last_fetched_at > now - min_interval:
+                fresh += len(assets)
                 continue
+            to_fetch.append(sym)
+
+        # ✅ candidats construits en mémoire, écrits en bulk à la fin
+        candidates = {}  # (asset_id, ex_date, amount) -> DividendEvent
+        per_symbol = defaultdict(int)
+
+        # 2) téléchargement concurrent (provider.dividends par paquets) ; le thread courant
+        #    traite les réponses au fil de l'eau et reste le seul à écrire en base
+        timings = StageTimings()
+        chunks = [tuple(to_fetch[i : i + chunk_size]) for i in range(0, len(to_fetch), chunk_size)]
+        fetched = fetch_concurrent(
+            lambda c: provider.dividends(c, since), chunks, cfg, breaker_for(provider.name), timings
+        )
+        for chunk, series, err in fetched:
+            if err is not None:
+                self.stdout.write(self.style.WARNING(f"FAIL {len(chunk)} symbols ({chunk[0]}..) ({err})"))
+                series = {}
+
+            with timings.stage("process"):
+                for sym in chunk:
+                    assets = assets_by_symbol[sym]
+                    cur = cursors.get(sym)
+                    raw = series.get(sym)
+                    if raw is None:
+                        fail += len(assets)
+                        self.stdout.write(self.style.WARNING(f"FAIL {sym} ({len(assets)} assets)"))
+                        continue
+
+                    ok += len(assets)
+                    rows = [(d, amt.quantize(Q6)) for d, amt in raw]
 
-            s = s.tail(years * 10)
-
-            add = 0
-            dup_local = 0
-
-            for dt, amt in s.items():
-                ex_date = dt.date()
-
-                try:
-                    amount = Decimal(str(amt))
-                except Exception:
-                    continue
-
-                # ⚠️ IMPORTANT: wrap atomic + handle race duplicates
-                try:
-                    with transaction.atomic():
-                        _obj, was_created = DividendEvent.objects.get_or_create(
-                            asset=a,
-                            ex_date=ex_date,
-                            amount_per_share=amount,
-                            defaults={
-                                "currency": (getattr(a, "currency", None) or "EUR"),
-                                "source": "yfinance",
-                                "status": "declared",
-                            },
+                    fingerprint = hashlib.sha1(
+                        ";".join(f"{d.isoformat()}={amt}" for d, amt in rows).encode()
+                    ).hexdigest()
+                    rows_last = max((d for d, _amt in rows), default=None)
+                    last_ex = rows_last
+                    if cur is not None and cur.last_ex_date and (last_ex is None or cur.last_ex_date > last_ex):
+                        last_ex = cur.last_ex_date
+                    new_cursors.append(
+                        DividendSyncCursor(
+                            symbol=sym, last_ex_date=last_ex, last_fetched_at=now, fingerprint=fingerprint
                         )
-                        if was_created:
-                            add += 1
-                except IntegrityError:
-                    # Un autre run a créé la ligne entre-temps -> on ignore
-                    dup_local += 1
-                    continue
-
-            ok += 1
-            created += add
-            dup += dup_local
-            self.stdout.write(self.style.SUCCESS(f"OK  {a.ticker} (sym='{sym}') +{add} dup={dup_local}"))
+                    )
+
+                    caught_up = all_caught_up(sym, assets, cur)
+                    for a in assets:
+                        kept = backfilled_after(a, sym)
+                        new_asset_cursors.append(
+                            AssetDividendCursor(
+                                asset_id=a.id,
+                                symbol=sym,
+                                last_ex_date=max((d for d in (kept, rows_last) if d), default=None),
+                                synced_at=now,
+                            )
+                        )
+
+                    if not rows:
+                        no_div += len(assets)
+                        self.stdout.write(f"NO  {sym} ({len(assets)} assets)")
+                        continue
+
+                    if caught_up and cur.fingerprint == fingerprint:
+                        # historique identique au dernier passage, et tous les assets l'ont reçu
+                        unchanged += len(assets)
+                        continue
+
+                    for a in assets:
+                        # curseur propre à l'asset : absent ou autre symbole -> backfill complet
+                        after = backfilled_after(a, sym)
+                        currency = getattr(a, "currency", None) or "EUR"
+                        for ex_date, amount in rows:
+                            if after is not None and ex_date <= after:
+                                continue
+                            key = (a.id, ex_date, amount)
+                            if key in candidates:
+                                continue
+                            candidates[key] = DividendEvent(
+                                asset_id=a.id,
+                                ex_date=ex_date,
+                                amount_per_share=amount,
+                                currency=currency,
+                                source=provider.name,
+                                status="declared",
+                            )
+                            per_symbol[sym] += 1
+
+        # ✅ une seule requête pour les clés déjà en base
+        existing = set()
+        if candidates:
+            t0 = time.monotonic()
+            min_ex = min(k[1] for k in candidates)
+            existing = {
+                (aid, ex_date, amount.quantize(Q6))
+                for aid, ex_date, amount in DividendEvent.objects.filter(
+                    asset_id__in={k[0] for k in candidates}, ex_date__gte=min_ex
+                ).values_list("asset_id", "ex_date", "amount_per_share")
+            }
+            timings.add("lookup", time.monotonic() - t0)
+
+        new = [obj for key, obj in candidates.items() if key not in existing]
+        dup = len(candidates) - len(new)
+
+        with timings.stage("write"):
+            # ignore_conflicts : un run concurrent qui insère la même clé n'échoue pas
+            DividendEvent.objects.bulk_create(new, batch_size=max(1, opts["batch_size"]), ignore_conflicts=True)
+
+            # curseurs avancés seulement après l'écriture des events (un run interrompu refait le travail)
+            DividendSyncCursor.objects.bulk_create(
+                new_cursors,
+                batch_size=max(1, opts["batch_size"]),
+                update_conflicts=True,
+                unique_fields=["symbol"],
+                update_fields=["last_ex_date", "last_fetched_at", "fingerprint"],
+            )
+            AssetDividendCursor.objects.bulk_create(
+                new_asset_cursors,
+                batch_size=max(1, opts["batch_size"]),
+                update_conflicts=True,
+                unique_fields=["asset"],
+                update_fields=["symbol", "last_ex_date", "synced_at"],
+            )
+
+        # bulk_create ne déclenche pas les signaux -> invalidation explicite des caches (projection + dashboard)
+        if new:
+            touched = {obj.asset_id for obj in new}
+            invalidate_forecasts(touched)
+            invalidate_dashboards(Asset.objects.filter(id__in=touched).values_list("user_id", flat=True))
+
+        created_by_symbol = defaultdict(int)
+        sym_by_asset = {a.id: sym for sym, assets in assets_by_symbol.items() for a in assets}
+        for obj in new:
+            created_by_symbol[sym_by_asset[obj.asset_id]] += 1
+        for sym in sorted(per_symbol):
+            add = created_by_symbol[sym]
+            self.stdout.write(self.style.SUCCESS(f"OK  {sym} +{add} dup={per_symbol[sym] - add}"))
 
+        self.stdout.write(f"Timings: {timings.report()} workers={cfg.workers} rate={cfg.rate}/s")
         self.stdout.write(
-            f"Done. OK={ok} created={created} dup={dup} NO={no_div} FAIL={fail} SKIP={skipped}"
-        )
\ No newline at end of file
+            f"Done. provider={provider.name} OK={ok} symbols={len(assets_by_symbol)} created={len(new)} dup={dup} "
+            f"NO={no_div} FRESH={fresh} UNCHANGED={unchanged} FAIL={fail} SKIP={skipped}"
+        )
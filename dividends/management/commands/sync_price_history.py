@@ -0,0 +1,74 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from dividends.models import Asset, DailyPrice
+from dividends.services.price_history import last_stored_dates
+from dividends.services.market_data import get_provider
+
+Q6 = Decimal("0.000001")  # close: 6 décimales en base
+
+
+class Command(BaseCommand):
+    help = "Backfill puis sync incrémental des clôtures journalières (DailyPrice) par symbole."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--years", type=int, default=5, help="Profondeur du backfill initial.")
+        parser.add_argument("--user-id", type=int, default=None)
+        parser.add_argument("--chunk-size", type=int, default=50)
+        parser.add_argument("--batch-size", type=int, default=1000, help="Taille des bulk_create.")
+        parser.add_argument("--replay", default=None, help="Rejoue les réponses enregistrées dans ce dossier.")
+        parser.add_argument("--record", default=None, help="Enregistre les réponses du provider dans ce dossier.")
+
+    def handle(self, *args, **opts):
+        qs = Asset.objects.filter(is_active=True)
+        if opts["user_id"]:
+            qs = qs.filter(user_id=opts["user_id"])
+
+        symbols = sorted(
+            {(ps or t or "").strip() for ps, t in qs.values_list("price_symbol", "ticker")} - {""}
+        )
+        if not symbols:
+            self.stdout.write("Done. symbols=0")
+            return
+
+        provider = get_provider(replay=opts["replay"], record=opts["record"], chunk_size=opts["chunk_size"])
+        today = timezone.localdate()
+        backfill_start = today - timedelta(days=365 * opts["years"])
+        last = last_stored_dates(symbols)
+
+        # on regroupe les symboles par date de départ pour garder des téléchargements multi-symboles
+        # ✅ le dernier jour stocké est re-téléchargé et écrasé : une barre prise en séance
+        #    (cours partiel du jour) est remplacée par la clôture au passage suivant
+        by_start = defaultdict(list)
+        for sym in symbols:
+            by_start[last.get(sym, backfill_start)].append(sym)
+
+        created = fail = 0
+        for start in sorted(by_start):
+            chunk_syms = by_start[start]
+            series = provider.daily_closes(chunk_syms, start)
+
+            rows = []
+            for sym in chunk_syms:
+                pts = series.get(sym)
+                if not pts:
+                    fail += 1
+                    self.stdout.write(self.style.WARNING(f"NO  {sym} (depuis {start})"))
+                    continue
+                rows.extend(DailyPrice(symbol=sym, date=d, close=px.quantize(Q6)) for d, px in pts)
+                self.stdout.write(self.style.SUCCESS(f"OK  {sym} +{len(pts)} (depuis {start})"))
+
+            DailyPrice.objects.bulk_create(
+                rows,
+                batch_size=opts["batch_size"],
+                update_conflicts=True,
+                unique_fields=["symbol", "date"],
+                update_fields=["close"],
+            )
+            created += len(rows)
+
+        self.stdout.write(f"Done. symbols={len(symbols)} rows={created} NO={fail}")
@@ -1,6 +1,10 @@
+from collections import defaultdict
+
 from django.core.management.base import BaseCommand
 from dividends.models import Asset
-from dividends.services.prices import update_asset_price
+from dividends.services.fetch_pipeline import BatchedWriter, FetchConfig, StageTimings, breaker_for, fetch_concurrent
+from dividends.services.market_data import get_provider
+from dividends.services.quotes import fresh_symbols, store_quotes, update_asset_price
 
 
 class Command(BaseCommand):
@@ -9,11 +13,37 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--user-id", type=int, default=None)
         parser.add_argument("--limit", type=int, default=500)
+        parser.add_argument(
+            "--batched",
+            action="store_true",
+            help="Regroupe les assets par price_symbol et télécharge chaque symbole une seule fois.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=50)
+        parser.add_argument("--force", action="store_true", help="Ignore le TTL des quotes (mode --batched).")
+        parser.add_argument("--replay", default=None, help="Rejoue les réponses enregistrées (sans réseau).")
+        parser.add_argument("--record", default=None, help="Enregistre les réponses du provider.")
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Fetchs concurrents (défaut: DIVIDENDS_FETCH_WORKERS)."
+        )
+        parser.add_argument(
+            "--rate", type=float, default=None, help="Appels provider / seconde (défaut: DIVIDENDS_FETCH_RATE)."
+        )
+        parser.add_argument("--batch-size", type=int, default=500, help="Quotes par écriture (mode --batched).")
 
     def handle(self, *args, **options):
         qs = Asset.objects.filter(is_active=True).order_by("id")
         if options["user_id"]:
             qs = qs.filter(user_id=options["user_id"])
+
+        # ✅ les deux modes passent par le provider : --record / --replay valent aussi sans --batched
+        chunk_size = max(1, options["chunk_size"])
+        provider = get_provider(replay=options["replay"], record=options["record"], chunk_size=chunk_size)
+
+        if options["batched"]:
+            # pas de --limit ici : le coût dépend du nombre de symboles distincts, pas d'assets
+            cfg = FetchConfig.from_settings(workers=options["workers"], rate=options["rate"])
+            return self._handle_batched(qs, provider, chunk_size, options["force"], cfg, options["batch_size"])
+
         qs = qs[: options["limit"]]
 
         ok = 0
@@ -32,11 +62,59 @@ class Command(BaseCommand):
             if not (a.price_symbol or "").strip():
                 a.price_symbol = symbol  # pas besoin de save() pour ce run
 
-            if update_asset_price(a):
+            q = update_asset_price(a, provider)
+            if q:
                 ok += 1
-                self.stdout.write(self.style.SUCCESS(f"OK  {symbol} -> {a.last_price}"))
+                self.stdout.write(self.style.SUCCESS(f"OK  {symbol} -> {q.price}"))
             else:
                 fail += 1
                 self.stdout.write(self.style.WARNING(f"FAIL {a.ticker} (symbol='{symbol}')"))
 
-        self.stdout.write(f"Done. OK={ok} FAIL={fail}")
\ No newline at end of file
+        self.stdout.write(f"Done. provider={provider.name} OK={ok} FAIL={fail}")
+
+    def _handle_batched(self, qs, provider, chunk_size: int, force: bool, cfg: FetchConfig, batch_size: int):
+        # symbole -> nb d'assets (tous users confondus) ; seule la quote partagée est écrite
+        assets_by_symbol = defaultdict(int)
+        skipped = 0
+        for aid, price_symbol, ticker in qs.values_list("id", "price_symbol", "ticker"):
+            symbol = (price_symbol or ticker or "").strip()
+            if not symbol:
+                skipped += 1
+                self.stdout.write(self.style.WARNING(f"SKIP Asset#{aid} (no price_symbol/ticker)"))
+                continue
+            assets_by_symbol[symbol] += 1
+
+        fresh = set() if force else fresh_symbols(assets_by_symbol)
+        symbols = sorted(set(assets_by_symbol) - fresh)
+        ok = fail = 0
+
+        timings = StageTimings()
+        writer = BatchedWriter(store_quotes, batch_size, timings)  # seul point d'écriture DB
+        chunks = [tuple(symbols[i : i + chunk_size]) for i in range(0, len(symbols), chunk_size)]
+
+        for chunk, quotes, err in fetch_concurrent(provider.quotes, chunks, cfg, breaker_for(provider.name), timings):
+            with timings.stage("process"):
+                if err is not None:
+                    fail += len(chunk)
+                    self.stdout.write(self.style.WARNING(f"FAIL {len(chunk)} symbols ({chunk[0]}..) ({err})"))
+                    continue
+
+                for symbol in chunk:
+                    q = quotes.get(symbol)
+                    if not q:
+                        fail += 1
+                        self.stdout.write(self.style.WARNING(f"FAIL {symbol}"))
+                        continue
+
+                    ok += 1
+                    self.stdout.write(
+                        self.style.SUCCESS(f"OK  {symbol} -> {q.price} ({assets_by_symbol[symbol]} assets)")
+                    )
+
+                writer.add(quotes.values())
+
+        writer.flush()
+        self.stdout.write(f"Timings: {timings.report()} workers={cfg.workers} rate={cfg.rate}/s")
+        self.stdout.write(
+            f"Done. provider={provider.name} symbols={len(assets_by_symbol)} OK={ok} FAIL={fail} FRESH={len(fresh)} SKIP={skipped}"
+        )
@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-17 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dividends", "0011_remove_transaction_dividends_t_date_7727bb_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Quote",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=30, unique=True)),
+                ("price", models.DecimalField(decimal_places=6, max_digits=18)),
+                ("asof", models.DateTimeField()),
+                ("source", models.CharField(blank=True, default="", max_length=32)),
+                ("fetched_at", models.DateTimeField()),
+            ],
+            options={
+                "ordering": ["symbol"],
+                "indexes": [
+                    models.Index(
+                        fields=["fetched_at"], name="dividends_q_fetched_de535b_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-17 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dividends", "0012_quote"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyPrice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=30)),
+                ("date", models.DateField()),
+                ("close", models.DecimalField(decimal_places=6, max_digits=18)),
+            ],
+            options={
+                "ordering": ["symbol", "date"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("symbol", "date"), name="dailyprice_symbol_date_uniq"
+                    )
+                ],
+            },
+        ),
+    ]
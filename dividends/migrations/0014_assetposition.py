@@ -0,0 +1,113 @@
+# Generated by Django 6.0 on 2026-10-17 01:22
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def build_positions(apps, schema_editor):
+    # Copie figée de services.pnl.AvcoState.apply (la seule implémentation du rejeu PMP côté code).
+    # Volontairement dupliquée : une migration doit rejouer l'historique tel qu'il était à ce
+    # schéma ; importer le service la ferait dépendre du code (et des modèles) courants.
+    # Ne pas la faire évoluer avec AvcoState : `manage.py rebuild_positions` recalcule ensuite.
+    Transaction = apps.get_model("dividends", "Transaction")
+    AssetPosition = apps.get_model("dividends", "AssetPosition")
+
+    states = {}
+    for t in Transaction.objects.order_by("asset_id", "date", "id").iterator():
+        st = states.setdefault(
+            t.asset_id,
+            {
+                "qty": Decimal("0"),
+                "cost": Decimal("0"),
+                "realized": Decimal("0"),
+                "last": None,
+                "n": 0,
+            },
+        )
+        st["n"] += 1
+        st["last"] = t.date if st["last"] is None or t.date > st["last"] else st["last"]
+
+        q, px, f = Decimal(t.quantity or 0), Decimal(t.price or 0), Decimal(t.fees or 0)
+        if q <= 0:
+            continue
+        if t.type == "BUY":
+            st["qty"] += q
+            st["cost"] += q * px + f
+        elif t.type == "SELL" and st["qty"] > 0:
+            avg = st["cost"] / st["qty"]
+            sell = min(q, st["qty"])
+            st["realized"] += (px - avg) * sell - f
+            st["qty"] -= sell
+            st["cost"] -= sell * avg
+            if st["qty"] <= 0:
+                st["qty"], st["cost"] = Decimal("0"), Decimal("0")
+
+    AssetPosition.objects.bulk_create(
+        [
+            AssetPosition(
+                asset_id=aid,
+                quantity=st["qty"],
+                cost_basis=st["cost"],
+                avg_cost=(st["cost"] / st["qty"]) if st["qty"] > 0 else Decimal("0"),
+                realized_pnl=st["realized"],
+                last_tx_date=st["last"],
+                tx_count=st["n"],
+            )
+            for aid, st in states.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dividends", "0013_dailyprice"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AssetPosition",
+            fields=[
+                (
+                    "asset",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="position",
+                        serialize=False,
+                        to="dividends.asset",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.DecimalField(
+                        decimal_places=6, default=Decimal("0"), max_digits=20
+                    ),
+                ),
+                (
+                    "cost_basis",
+                    models.DecimalField(
+                        decimal_places=10, default=Decimal("0"), max_digits=28
+                    ),
+                ),
+                (
+                    "avg_cost",
+                    models.DecimalField(
+                        decimal_places=10, default=Decimal("0"), max_digits=28
+                    ),
+                ),
+                (
+                    "realized_pnl",
+                    models.DecimalField(
+                        decimal_places=10, default=Decimal("0"), max_digits=28
+                    ),
+                ),
+                ("last_tx_date", models.DateField(blank=True, null=True)),
+                ("tx_count", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(build_positions, migrations.RunPython.noop),
+    ]
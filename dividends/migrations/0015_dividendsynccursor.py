@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dividends", "0014_assetposition"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DividendSyncCursor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=30, unique=True)),
+                ("last_ex_date", models.DateField(blank=True, null=True)),
+                ("last_fetched_at", models.DateTimeField()),
+                (
+                    "fingerprint",
+                    models.CharField(blank=True, default="", max_length=40),
+                ),
+            ],
+            options={
+                "ordering": ["symbol"],
+            },
+        ),
+    ]
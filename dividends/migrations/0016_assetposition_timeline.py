@@ -0,0 +1,68 @@
+# Generated by Django 6.0 on 2026-10-17 14:05
+
+import sys
+from array import array
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def build_timelines(apps, schema_editor):
+    # Copie figée de la règle de services.holdings._step / Timeline (un point par jour).
+    # Volontairement dupliquée, comme dans 0014 : une migration ne dépend pas du code courant ;
+    # `manage.py rebuild_positions` recalcule ensuite avec l'implémentation à jour.
+    Transaction = apps.get_model("dividends", "Transaction")
+    AssetPosition = apps.get_model("dividends", "AssetPosition")
+
+    timelines = {}
+    for aid, d, typ, q in (
+        Transaction.objects.order_by("asset_id", "date", "id")
+        .values_list("asset_id", "date", "type", "quantity")
+        .iterator()
+    ):
+        days, q6 = timelines.setdefault(aid, (array("i"), array("q")))
+        qty = q6[-1] if q6 else 0
+        delta = int(Decimal(q or 0).scaleb(6))
+        if typ == "BUY":
+            qty += delta
+        elif typ == "SELL":
+            qty -= delta
+        qty = max(qty, 0)
+        o = d.toordinal()
+        if days and days[-1] == o:
+            q6[-1] = qty
+        else:
+            days.append(o)
+            q6.append(qty)
+
+    rows = []
+    for pos in AssetPosition.objects.filter(asset_id__in=list(timelines)):
+        days, q6 = timelines[pos.asset_id]
+        if sys.byteorder == "big":
+            days.byteswap()
+            q6.byteswap()
+        pos.timeline_days = days.tobytes()
+        pos.timeline_q6 = q6.tobytes()
+        rows.append(pos)
+    AssetPosition.objects.bulk_update(rows, ["timeline_days", "timeline_q6"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dividends", "0015_dividendsynccursor"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="assetposition",
+            name="timeline_days",
+            field=models.BinaryField(default=b""),
+        ),
+        migrations.AddField(
+            model_name="assetposition",
+            name="timeline_q6",
+            field=models.BinaryField(default=b""),
+        ),
+        migrations.RunPython(build_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0 on 2026-10-17 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dividends", "0016_assetposition_timeline"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AssetDividendCursor",
+            fields=[
+                (
+                    "asset",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="dividend_cursor",
+                        serialize=False,
+                        to="dividends.asset",
+                    ),
+                ),
+                ("symbol", models.CharField(max_length=30)),
+                ("last_ex_date", models.DateField(blank=True, null=True)),
+                ("synced_at", models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 18:10
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def stamp_positions(apps, schema_editor):
+    # tx_max_id n'est posé que sur les positions qui correspondent encore aux transactions
+    # (même nombre, même dernière date) ; les autres restent périmées jusqu'à rebuild_positions
+    Transaction = apps.get_model("dividends", "Transaction")
+    AssetPosition = apps.get_model("dividends", "AssetPosition")
+
+    stats = {
+        aid: (n, last, m)
+        for aid, n, last, m in Transaction.objects.order_by()
+        .values("asset_id")
+        .annotate(n=Count("id"), last=Max("date"), m=Max("id"))
+        .values_list("asset_id", "n", "last", "m")
+    }
+
+    rows = []
+    for pos in AssetPosition.objects.filter(asset_id__in=list(stats)):
+        n, last, m = stats[pos.asset_id]
+        if (pos.tx_count, pos.last_tx_date) == (n, last):
+            pos.tx_max_id = m
+            rows.append(pos)
+    AssetPosition.objects.bulk_update(rows, ["tx_max_id"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dividends", "0017_assetdividendcursor"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="assetposition",
+            name="tx_max_id",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(stamp_positions, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+from datetime import timedelta
 from decimal import Decimal
 
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
 
@@ -68,6 +70,98 @@ class Asset(models.Model):
         super().save(*args, **kwargs)
 
 
+class Quote(models.Model):
+    """
+    Dernier cours partagé par instrument (une ligne par price_symbol, tous users confondus).
+    Asset.last_price reste un fallback pour les symboles jamais synchronisés.
+    """
+
+    symbol = models.CharField(max_length=30, unique=True)  # = Asset.price_symbol
+    price = models.DecimalField(max_digits=18, decimal_places=6)
+    asof = models.DateTimeField()  # date du cours côté provider
+    source = models.CharField(max_length=32, blank=True, default="")
+    fetched_at = models.DateTimeField()  # dernier refresh réussi (sert au TTL)
+
+    class Meta:
+        ordering = ["symbol"]
+        indexes = [
+            models.Index(fields=["fetched_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.price} ({self.asof:%Y-%m-%d %H:%M})"
+
+    @staticmethod
+    def ttl() -> timedelta:
+        # au-delà, sync_prices --batched re-télécharge le symbole
+        return timedelta(seconds=getattr(settings, "DIVIDENDS_QUOTE_TTL_SECONDS", 6 * 3600))
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.fetched_at >= timezone.now() - self.ttl()
+
+
+class DailyPrice(models.Model):
+    """
+    Historique de clôtures journalières par symbole (partagé entre users).
+    Alimenté par `manage.py sync_price_history` (backfill puis incrémental).
+    """
+
+    symbol = models.CharField(max_length=30)  # = Asset.price_symbol
+    date = models.DateField()
+    close = models.DecimalField(max_digits=18, decimal_places=6)
+
+    class Meta:
+        ordering = ["symbol", "date"]
+        constraints = [
+            models.UniqueConstraint(fields=["symbol", "date"], name="dailyprice_symbol_date_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.date} {self.close}"
+
+
+class DividendSyncCursor(models.Model):
+    """
+    Curseur de synchro des dividendes par symbole (partagé entre users).
+    `sync_dividends_declared` saute les symboles récupérés depuis moins de l'intervalle minimal
+    (si tous leurs assets sont à jour) ; l'avancement du backfill est suivi par asset
+    (AssetDividendCursor).
+    """
+
+    symbol = models.CharField(max_length=30, unique=True)  # = Asset.price_symbol
+    last_ex_date = models.DateField(null=True, blank=True)  # dernière ex-date vue chez le provider
+    last_fetched_at = models.DateTimeField()  # dernier download réussi
+    fingerprint = models.CharField(max_length=40, blank=True, default="")  # sha1 de l'historique reçu
+
+    class Meta:
+        ordering = ["symbol"]
+
+    def __str__(self):
+        return f"{self.symbol} ≤{self.last_ex_date or '—'} ({self.last_fetched_at:%Y-%m-%d %H:%M})"
+
+    @staticmethod
+    def min_interval() -> timedelta:
+        return timedelta(hours=getattr(settings, "DIVIDENDS_DIVIDEND_SYNC_MIN_INTERVAL_HOURS", 20))
+
+
+class AssetDividendCursor(models.Model):
+    """
+    Avancement du backfill des dividendes d'UN asset.
+    `sync_dividends_declared` n'insère pour cet asset que les ex-dates > last_ex_date, et seulement
+    si le curseur porte son price_symbol actuel ; sinon (asset nouveau, symbole changé) : historique
+    complet. Un asset exclu d'un run (--user-id, --limit, is_active=False) garde un curseur en retard.
+    """
+
+    asset = models.OneToOneField(Asset, on_delete=models.CASCADE, primary_key=True, related_name="dividend_cursor")
+    symbol = models.CharField(max_length=30)  # symbole synchronisé (≠ price_symbol -> backfill complet)
+    last_ex_date = models.DateField(null=True, blank=True)  # dernière ex-date insérée / vérifiée
+    synced_at = models.DateTimeField()  # dernier passage réussi sur cet asset
+
+    def __str__(self):
+        return f"{self.asset_id} {self.symbol} ≤{self.last_ex_date or '—'}"
+
+
 class Transaction(models.Model):
     BUY = "BUY"
     SELL = "SELL"
@@ -112,6 +206,36 @@ class Transaction(models.Model):
         return f"{self.asset.ticker} {self.type} {self.quantity} @ {self.price} ({self.date})"
 
 
+class AssetPosition(models.Model):
+    """
+    Position matérialisée par asset (PMP / AVCO), tenue à jour par signaux sur Transaction.
+    Reconstruction complète : `manage.py rebuild_positions` (obligatoire après un import en masse :
+    bulk_create / QuerySet.update / loaddata ne déclenchent pas les signaux). Les lecteurs comparent
+    le stamp tx_count / tx_max_id aux transactions et rejouent une position périmée.
+    """
+
+    asset = models.OneToOneField(Asset, on_delete=models.CASCADE, primary_key=True, related_name="position")
+
+    quantity = models.DecimalField(max_digits=20, decimal_places=6, default=Decimal("0"))
+    cost_basis = models.DecimalField(max_digits=28, decimal_places=10, default=Decimal("0"))  # qty * PMP
+    avg_cost = models.DecimalField(max_digits=28, decimal_places=10, default=Decimal("0"))  # PMP
+    realized_pnl = models.DecimalField(max_digits=28, decimal_places=10, default=Decimal("0"))
+
+    last_tx_date = models.DateField(null=True, blank=True)
+    tx_count = models.PositiveIntegerField(default=0)
+    tx_max_id = models.BigIntegerField(null=True, blank=True)  # plus grand Transaction.id appliqué
+
+    # ✅ timeline des quantités (services.holdings.Timeline) : int32 ordinaux des jours / int64 micro-actions,
+    # tableaux parallèles little-endian ; lue par la prévision et les dividendes attendus à la place de Transaction
+    timeline_days = models.BinaryField(default=b"")
+    timeline_q6 = models.BinaryField(default=b"")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.asset_id} qty={self.quantity} pmp={self.avg_cost}"
+
+
 class DividendEvent(models.Model):
     STATUS = [
         ("estimated", "Estimé"),
@@ -0,0 +1,120 @@
+# dividends/services/aggregate.py
+"""
+Agrégat annuel des events projetés, construit en UN seul parcours :
+
+- matrice ticker x 12 mois (centimes, int), dans l'ordre de première apparition
+- reçu par ticker / par mois (le "regular" = total - reçu)
+- buckets par jour (events + total du jour)
+
+L'histogramme, le heatmap (totaux + lignes) et la grille du calendrier en sont
+dérivés sans re-parcourir les events ; l'agrégat est mis en cache par
+(user, année, croissance, jour) -> le calendrier se rend sans reprojection.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from dividends.services.calendar_view import grid_from_days
+from dividends.services.dashboard_cache import cached_fragment
+from dividends.services.forecast_year import ForecastEvent, build_year_events, histogram_months
+from dividends.services.money import from_cents, to_cents
+
+
+@dataclass(slots=True)
+class YearAggregate:
+    year: int
+    tickers: List[str] = field(default_factory=list)  # ordre de première apparition
+    cells: List[List[int]] = field(default_factory=list)  # [ticker][mois 0..11] en centimes
+    ticker_received: List[int] = field(default_factory=list)
+    month_received: List[int] = field(default_factory=lambda: [0] * 12)
+    days: Dict[date, List[ForecastEvent]] = field(default_factory=dict)
+    day_cents: Dict[date, int] = field(default_factory=dict)
+
+    # =========================
+    # Dérivés
+    # =========================
+    def month_totals(self) -> List[int]:
+        return [sum(row[m] for row in self.cells) for m in range(12)]
+
+    def month_total(self, month: int) -> Decimal:
+        return from_cents(sum(row[month - 1] for row in self.cells))
+
+    def histogram(self) -> Tuple[List[dict], Decimal, Decimal]:
+        """Même sortie que year_histogram(events, year)."""
+        total = self.month_totals()
+        return histogram_months(
+            [from_cents(v) for v in total],
+            [from_cents(v) for v in self.month_received],
+            [from_cents(t - r) for t, r in zip(total, self.month_received)],
+        )
+
+    def by_ticker(self) -> Tuple[Dict[str, dict], int, int, int]:
+        """Entrées de _breakdown_from_totals (centimes), même forme que YearArrays.by_ticker()."""
+        out: Dict[str, dict] = {}
+        for t, row, rec in zip(self.tickers, self.cells, self.ticker_received):
+            row_total = sum(row)
+            out[t] = {
+                "total": row_total,
+                "received": rec,
+                "regular": row_total - rec,
+                "by_month": {m + 1: v for m, v in enumerate(row) if v},
+            }
+        total = sum(sum(row) for row in self.cells)
+        received = sum(self.month_received)
+        return out, total, received, total - received
+
+    def month_grid(self, month: int):
+        """Grille du calendrier (semaines x 7 jours) à partir des buckets par jour."""
+        # seuls les jours du mois portent des events (les jours débordants restent vides)
+        days = {d: evs for d, evs in self.days.items() if d.month == month}
+        return grid_from_days(self.year, month, days, {d: self.day_cents[d] for d in days})
+
+
+def aggregate_events(events: List[ForecastEvent], year: int) -> YearAggregate:
+    """Un seul parcours des events : matrice, reçus et buckets jour."""
+    agg = YearAggregate(year=year)
+    row_by_ticker: Dict[str, int] = {}
+
+    for e in events:
+        d = e.display_date
+        if not d or d.year != year:
+            continue
+
+        ticker = e.ticker or "—"
+        i = row_by_ticker.get(ticker)
+        if i is None:
+            i = row_by_ticker[ticker] = len(agg.tickers)
+            agg.tickers.append(ticker)
+            agg.cells.append([0] * 12)
+            agg.ticker_received.append(0)
+
+        amt = to_cents(e.estimated_amount)
+        m = d.month - 1
+        agg.cells[i][m] += amt
+        if (e.status or "").lower() == "received":
+            agg.ticker_received[i] += amt
+            agg.month_received[m] += amt
+
+        agg.days.setdefault(d, []).append(e)
+        agg.day_cents[d] = agg.day_cents.get(d, 0) + amt
+
+    return agg
+
+
+def year_aggregate(user, year: int, growth_pct: Decimal = Decimal("0")) -> YearAggregate:
+    """Agrégat de l'année (cache par user / année / croissance / jour, versionné par les signaux)."""
+    ttl = getattr(settings, "DIVIDENDS_FORECAST_CACHE_TTL", 300)
+    g = format(growth_pct.normalize(), "f")
+    return cached_fragment(
+        "aggregate",
+        user.pk,
+        (year, g, timezone.localdate().isoformat()),
+        ttl,
+        lambda: aggregate_events(build_year_events(user, year, growth_pct=growth_pct), year),
+    )
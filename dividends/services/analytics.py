@@ -1,21 +1,47 @@
 from decimal import Decimal
-from django.db.models import Prefetch
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 
 from dividends.models import Asset, Transaction
+from dividends.services.quotes import resolved_price, with_quotes
+
+
+Q6 = Decimal("0.000001")
+# SQLite agrège les décimaux en flottant : BUY 0.1 + 0.2 - SELL 0.3 -> 5.5e-17, pas 0.
+# On ne garde que les quantités qui restent > 0 une fois arrondies à 6 décimales.
+QTY_EPS = Q6 / 2
+QTY_FIELD = DecimalField(max_digits=20, decimal_places=6)
+PRICE_FIELD = DecimalField(max_digits=18, decimal_places=6)
+VALUE_FIELD = DecimalField(max_digits=38, decimal_places=12)
 
 
 def _d(x) -> Decimal:
     return x if isinstance(x, Decimal) else Decimal(str(x))
 
 
-def current_quantity(asset: Asset) -> Decimal:
-    qty = Decimal("0")
-    for t in asset.transactions.all():
-        if t.type == Transaction.BUY:
-            qty += _d(t.quantity)
-        elif t.type == Transaction.SELL:
-            qty -= _d(t.quantity)
-    return qty
+def _net_quantity() -> Coalesce:
+    """
+    Quantité nette par asset (BUY - SELL), agrégée en SQL.
+    Sous-requête corrélée (pas de GROUP BY sur Asset) : la valeur qui en dérive
+    reste une expression de ligne, utilisable dans une fenêtre SUM(...) OVER ().
+    """
+    net = (
+        Transaction.objects.filter(asset=OuterRef("pk"))
+        .order_by()
+        .values("asset")
+        .annotate(
+            q=Sum(
+                Case(
+                    When(type=Transaction.BUY, then=F("quantity")),
+                    When(type=Transaction.SELL, then=-F("quantity")),
+                    default=Value(Decimal("0")),
+                    output_field=QTY_FIELD,
+                )
+            )
+        )
+        .values("q")
+    )
+    return Coalesce(Subquery(net, output_field=QTY_FIELD), Value(Decimal("0")), output_field=QTY_FIELD)
 
 
 def portfolio_allocation(user):
@@ -24,12 +50,19 @@ def portfolio_allocation(user):
     - rows: [{asset, qty, price, value, weight}]
     - total_value
     - top1, top3 (weights)
-    - missing_prices: assets avec qty>0 mais pas de last_price
+    - missing_prices: assets avec qty>0 mais ni quote partagée ni last_price
+
+    ✅ Quantités, prix (quote partagée, fallback last_price) et valeur calculés en base :
+    une seule requête, une ligne par asset (pas de chargement des transactions).
+    ✅ Poids calculés en Decimal à partir des valeurs recalculées (SQLite rend des flottants).
     """
     assets = (
-        Asset.objects.filter(user=user, is_active=True)
-        .prefetch_related("transactions")
-        .order_by("id")
+        with_quotes(Asset.objects.filter(user=user, is_active=True))
+        .annotate(qty=_net_quantity())
+        .filter(qty__gt=QTY_EPS)
+        .annotate(price=Coalesce(F("quote_price"), F("last_price"), output_field=PRICE_FIELD))
+        .annotate(value=ExpressionWrapper(F("qty") * F("price"), output_field=VALUE_FIELD))
+        .order_by(F("value").desc(nulls_last=True), "id")
     )
 
     rows = []
@@ -37,29 +70,27 @@ def portfolio_allocation(user):
     total_value = Decimal("0")
 
     for a in assets:
-        qty = current_quantity(a)
-        if qty <= 0:
-            continue
-
-        price = a.last_price  # DecimalField
-        if price is None:
+        if a.price is None:
             missing_prices.append(a)
             continue
 
-        value = qty * _d(price)
+        # tri fait en SQL ; valeur recalculée en Decimal (SQLite agrège en flottant)
+        qty = _d(a.qty).quantize(Q6)
+        price = _d(resolved_price(a))  # annotations déjà chargées : pas de requête
+        value = qty * price
         total_value += value
 
         rows.append({
             "asset": a,
             "qty": qty,
-            "price": _d(price),
+            "price": price,
             "value": value,
         })
 
-    # weights + tri
+    # ordre SQL approximatif (flottants) : on retrie sur la valeur exacte, tri stable -> id
     rows.sort(key=lambda r: r["value"], reverse=True)
     for r in rows:
-        r["weight"] = (r["value"] / total_value) if total_value > 0 else Decimal("0")
+        r["weight"] = (r["value"] / total_value).quantize(Q6) if total_value else Decimal("0")
 
     top1 = rows[0]["weight"] if rows else Decimal("0")
     top3 = sum([r["weight"] for r in rows[:3]], Decimal("0"))
@@ -70,4 +101,4 @@ def portfolio_allocation(user):
         "top1": top1,
         "top3": top3,
         "missing_prices": missing_prices,
-    }
\ No newline at end of file
+    }
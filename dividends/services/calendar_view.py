@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 from datetime import date, timedelta
-from decimal import Decimal
-from typing import List
+from typing import Dict, List
+
+from dividends.services.money import from_cents, to_cents
 
 
 def month_grid(year: int, month: int, events: List):
@@ -10,6 +11,20 @@ def month_grid(year: int, month: int, events: List):
     events: list d'objets ayant .display_date et .estimated_amount
     Retourne grid[weeks][days] avec total_estimated + events
     """
+    by_day = {}
+    cents = {}
+    for e in events:
+        by_day.setdefault(e.display_date, []).append(e)
+        cents[e.display_date] = cents.get(e.display_date, 0) + to_cents(e.estimated_amount)
+
+    return grid_from_days(year, month, by_day, cents)
+
+
+def grid_from_days(year: int, month: int, by_day: Dict[date, List], day_cents: Dict[date, int]):
+    """
+    Grille à partir d'events déjà regroupés par jour (cf. services/aggregate.py).
+    day_cents: total du jour en centimes.
+    """
     first = date(year, month, 1)
     next_month = date(year + (month == 12), 1 if month == 12 else month + 1, 1)
     last = next_month - timedelta(days=1)
@@ -17,26 +32,20 @@ def month_grid(year: int, month: int, events: List):
     start = first - timedelta(days=first.weekday())
     end = last + timedelta(days=(6 - last.weekday()))
 
-    by_day = {}
-    for e in events:
-        by_day.setdefault(e.display_date, []).append(e)
-
     weeks = []
     cur = start
     while cur <= end:
         week = []
         for _ in range(7):
-            day_events = by_day.get(cur, [])
-            total = sum((ev.estimated_amount for ev in day_events), Decimal("0.00"))
             week.append(
                 {
                     "d": cur,
                     "in_month": cur.month == month,
-                    "events": day_events,
-                    "total_estimated": total,
+                    "events": by_day.get(cur, []),
+                    "total_estimated": from_cents(day_cents.get(cur, 0)),
                 }
             )
             cur += timedelta(days=1)
         weeks.append(week)
 
-    return weeks
\ No newline at end of file
+    return weeks
@@ -0,0 +1,55 @@
+# dividends/services/dashboard_cache.py
+"""
+Cache des fragments du dashboard (perf + donut, prévision, formulaires univers).
+
+Chaque fragment a sa propre clé : naviguer en année / croissance ne recalcule que
+la prévision. Toutes les clés d'un user portent une version, changée par les signaux
+(Transaction / DividendEvent / Asset) -> pas d'état périmé après une écriture.
+Les cours (Quote) ne bumpent pas la version : le fragment perf a un TTL court.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def _cache():
+    return caches[getattr(settings, "DIVIDENDS_CACHE_ALIAS", "default")]
+
+
+def _user_version_key(user_id: int) -> str:
+    return f"dividends:dash:ver:{user_id}"
+
+
+def invalidate_dashboards(user_ids: Iterable[int]) -> None:
+    token = time.time_ns()
+    _cache().set_many({_user_version_key(uid): token for uid in set(user_ids) if uid}, timeout=None)
+
+
+def _user_version(user_id: int) -> int:
+    cache = _cache()
+    key = _user_version_key(user_id)
+    ver = cache.get(key)
+    if ver is None:
+        # absente (1er accès ou éviction) : nouvelle version -> anciennes entrées inaccessibles
+        ver = time.time_ns()
+        cache.set(key, ver, timeout=None)
+    return ver
+
+
+def cached_fragment(name: str, user_id: int, parts: tuple, ttl: int, build: Callable[[], Any]) -> Any:
+    """Retourne build() mis en cache sous (fragment, user, parts, version du user)."""
+    cache = _cache()
+    suffix = ":".join(str(p) for p in parts)
+    key = f"dividends:dash:{name}:{user_id}:{suffix}:{_user_version(user_id)}"
+
+    hit = cache.get(key)
+    if hit is not None:
+        return hit
+
+    value = build()
+    cache.set(key, value, timeout=ttl)
+    return value
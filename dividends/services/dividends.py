@@ -3,7 +3,7 @@ from django.db.models import Sum
 from django.db.models.functions import Coalesce
 
 from dividends.models import DividendEvent, DividendPayment
-from dividends.services.holdings import quantity_at_date
+from dividends.services.holdings import shares_for_events
 
 
 def expected_dividends_year(user, year):
@@ -12,16 +12,15 @@ def expected_dividends_year(user, year):
     """
     total = Decimal("0")
 
-    events = (
+    events = list(
         DividendEvent.objects
         .filter(asset__user=user, pay_date__year=year)
         .exclude(status="received")
-        .select_related("asset")
         .order_by("pay_date")
     )
 
-    for ev in events:
-        qty = quantity_at_date(ev.asset, ev.ex_date)
+    # ✅ 2 requêtes (events + timeline des transactions), puis recherche binaire par event
+    for ev, qty in zip(events, shares_for_events(events)):
         total += (qty or Decimal("0")) * (ev.amount_per_share or Decimal("0"))
 
     return total
@@ -49,15 +48,13 @@ def next_dividend_events(user, limit=5):
         .exclude(status="received")
         .order_by("pay_date")[:limit]
     )
-    
-from decimal import Decimal
-from dividends.services.holdings import quantity_at_date
+
 
 def upcoming_events_with_estimates(user, limit=10):
     """
     Retourne une liste de dicts avec qty détenue à l'ex-date et montant estimé.
     """
-    events = (
+    events = list(
         DividendEvent.objects
         .filter(asset__user=user)
         .exclude(status="received")
@@ -66,8 +63,8 @@ def upcoming_events_with_estimates(user, limit=10):
     )
 
     rows = []
-    for ev in events:
-        qty = quantity_at_date(ev.asset, ev.ex_date) or Decimal("0")
+    for ev, qty in zip(events, shares_for_events(events)):
+        qty = qty or Decimal("0")
         est = qty * (ev.amount_per_share or Decimal("0"))
         rows.append({
             "event": ev,
@@ -75,4 +72,4 @@ def upcoming_events_with_estimates(user, limit=10):
             "estimated_amount": est,
         })
 
-    return rows
\ No newline at end of file
+    return rows
@@ -4,7 +4,8 @@ from dataclasses import dataclass
 from datetime import date, timedelta
 from decimal import Decimal
 
-from dividends.models import DividendEvent, Transaction
+from dividends.models import DividendEvent
+from dividends.services.holdings import quantity_at_date, shares_for_events
 
 
 def _d(x) -> Decimal:
@@ -12,15 +13,8 @@ def _d(x) -> Decimal:
 
 
 def shares_held_on(asset, on_date: date) -> Decimal:
-    qty = Decimal("0")
-    qs = asset.transactions.filter(date__lte=on_date).order_by("date", "id")
-    for t in qs:
-        typ = (t.type or "").lower()
-        if typ == "buy":
-            qty += _d(t.quantity)
-        elif typ == "sell":
-            qty -= _d(t.quantity)
-    return max(qty, Decimal("0"))
+    # lookup unitaire ; pour une liste d'events, passer par shares_for_events (timeline partagée)
+    return quantity_at_date(asset, on_date)
 
 
 @dataclass
@@ -31,7 +25,7 @@ class ExpectedDividend:
 
 
 def expected_dividends(user, start: date, end: date):
-    events = (
+    events = list(
         DividendEvent.objects.filter(asset__user=user, ex_date__gte=start, ex_date__lte=end)
         .select_related("asset")
         .order_by("ex_date")
@@ -40,8 +34,8 @@ def expected_dividends(user, start: date, end: date):
     out: list[ExpectedDividend] = []
     total = Decimal("0")
 
-    for ev in events:
-        sh = shares_held_on(ev.asset, ev.ex_date)
+    # ✅ 2 requêtes (events + timeline des transactions), puis recherche binaire par event
+    for ev, sh in zip(events, shares_for_events(events)):
         if sh <= 0:
             continue
         amt = sh * _d(ev.amount_per_share)
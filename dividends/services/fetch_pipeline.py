@@ -0,0 +1,250 @@
+# dividends/services/fetch_pipeline.py
+"""
+Étage de fetch concurrent pour les commandes de sync (prix / dividendes).
+
+- pool de threads borné (les workers n'appellent que le provider, jamais la DB)
+- token bucket : plafonne le nombre d'appels provider par seconde
+- retry avec backoff exponentiel + jitter sur exception
+- circuit breaker par provider : après N échecs consécutifs, fail-fast pendant un cooldown
+- les résultats reviennent au thread appelant, seul à écrire en base (writer unique, par lots)
+- timings par étage (wait / fetch / process / write) pour dimensionner la concurrence
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from django.conf import settings
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+# =========================
+# Rate limit / breaker / retry
+# =========================
+class TokenBucket:
+    """rate: jetons par seconde (<= 0 : illimité) ; burst: capacité du seau."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Bloque jusqu'à obtenir un jeton ; retourne le temps attendu (s)."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """closed -> open après `threshold` échecs consécutifs ; half-open (1 seul essai) après `cooldown` s."""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False  # half-open : un essai en cours
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self.probing and time.monotonic() - self.opened_at >= self.cooldown:
+                self.probing = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                # échec de l'essai half-open : on repart pour un cooldown complet
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(provider_name: str) -> CircuitBreaker:
+    """Un breaker par provider, partagé par toutes les syncs du process."""
+    with _breakers_lock:
+        if provider_name not in _breakers:
+            _breakers[provider_name] = CircuitBreaker(
+                threshold=getattr(settings, "DIVIDENDS_FETCH_BREAKER_THRESHOLD", 5),
+                cooldown=getattr(settings, "DIVIDENDS_FETCH_BREAKER_COOLDOWN", 60.0),
+            )
+        return _breakers[provider_name]
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Full jitter : uniforme dans [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2**attempt)))
+
+
+# =========================
+# Timings
+# =========================
+@dataclass
+class StageTimings:
+    totals: Dict[str, float] = field(default_factory=dict)
+    counts: Dict[str, int] = field(default_factory=dict)
+    started: float = field(default_factory=time.monotonic)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - t0)
+
+    def report(self) -> str:
+        # somme des durées par étage (les étages des workers se chevauchent : fetch > wall si parallèle)
+        wall = time.monotonic() - self.started
+        parts = [f"{k}={self.totals[k]:.2f}s/{self.counts[k]}" for k in sorted(self.totals)]
+        return f"wall={wall:.2f}s " + " ".join(parts)
+
+
+# =========================
+# Pipeline
+# =========================
+@dataclass
+class FetchConfig:
+    workers: int = 4
+    rate: float = 2.0  # appels provider / seconde (<= 0 : illimité)
+    retries: int = 3
+    backoff: float = 0.5
+
+    @classmethod
+    def from_settings(cls, workers: Optional[int] = None, rate: Optional[float] = None) -> "FetchConfig":
+        return cls(
+            workers=workers if workers is not None else getattr(settings, "DIVIDENDS_FETCH_WORKERS", 4),
+            rate=rate if rate is not None else getattr(settings, "DIVIDENDS_FETCH_RATE", 2.0),
+            retries=getattr(settings, "DIVIDENDS_FETCH_RETRIES", 3),
+            backoff=getattr(settings, "DIVIDENDS_FETCH_BACKOFF", 0.5),
+        )
+
+
+def _fetch_one(
+    fetch: Callable[[T], R],
+    item: T,
+    cfg: FetchConfig,
+    bucket: TokenBucket,
+    breaker: CircuitBreaker,
+    timings: StageTimings,
+) -> R:
+    for attempt in range(cfg.retries + 1):
+        if not breaker.allow():
+            raise CircuitOpen("circuit ouvert")
+
+        timings.add("wait", bucket.acquire())
+        t0 = time.monotonic()
+        try:
+            out = fetch(item)
+        except Exception:
+            timings.add("fetch", time.monotonic() - t0)
+            breaker.failure()
+            if attempt >= cfg.retries:
+                raise
+            time.sleep(backoff_delay(attempt, cfg.backoff))
+            continue
+        timings.add("fetch", time.monotonic() - t0)
+        breaker.success()
+        return out
+
+    raise AssertionError("unreachable")
+
+
+def fetch_concurrent(
+    fetch: Callable[[T], R],
+    items: Sequence[T],
+    cfg: FetchConfig,
+    breaker: CircuitBreaker,
+    timings: StageTimings,
+) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+    """
+    Appelle fetch(item) pour chaque item sur un pool de `cfg.workers` threads.
+    Produit (item, résultat, None) ou (item, None, exception) dans l'ordre d'achèvement ;
+    le consommateur (thread appelant) fait le traitement et les écritures DB.
+    """
+    if not items:
+        return
+    bucket = TokenBucket(cfg.rate, burst=max(1, cfg.workers))
+    workers = max(1, min(cfg.workers, len(items)))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="md-fetch") as pool:
+        futures = {pool.submit(_fetch_one, fetch, item, cfg, bucket, breaker, timings): item for item in items}
+        for fut in as_completed(futures):
+            item = futures[fut]
+            try:
+                yield item, fut.result(), None
+            except Exception as e:
+                yield item, None, e
+
+
+class BatchedWriter:
+    """Accumule des lignes et les écrit par lots via `flush_fn` (appelé depuis un seul thread)."""
+
+    def __init__(self, flush_fn: Callable[[List], object], batch_size: int, timings: StageTimings):
+        self.flush_fn = flush_fn
+        self.batch_size = max(1, batch_size)
+        self.timings = timings
+        self.pending: List = []
+        self.written = 0
+
+    def add(self, rows: Iterable) -> None:
+        self.pending.extend(rows)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        with self.timings.stage("write"):
+            self.flush_fn(rows)
+        self.written += len(rows)
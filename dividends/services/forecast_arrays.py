@@ -0,0 +1,244 @@
+# dividends/services/forecast_arrays.py
+"""
+Backend NumPy (optionnel) de la projection annuelle des dividendes.
+
+Représentation en entiers :
+- montants par action en micro-unités (DecimalField 6 décimales -> exact)
+- quantités en micro-actions (DecimalField 6 décimales -> exact)
+- montants estimés en centimes, arrondis HALF_EVEN comme Decimal.quantize(0.01)
+
+Résultats identiques au chemin Decimal (build_year_events / year_histogram).
+Le backend se récuse (retourne None) quand l'égalité exacte n'est pas garantie :
+numpy absent, croissance non nulle ((1+g)^n n'est pas représentable en entiers),
+ou produits pouvant dépasser int64.
+
+DIVIDENDS_FORECAST_BACKEND : "auto" (numpy s'il est installé) | "numpy" (obligatoire) | "decimal".
+numpy est listé dans requirements.txt (déjà tiré par yfinance) ; sans lui, "auto" reste sur Decimal.
+Les tableaux sont mis en cache sous les mêmes jetons de version par asset que _cached_projection.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Max, Q
+from django.db.models.functions import ExtractYear
+from django.utils import timezone
+
+from dividends.models import Asset, DividendEvent
+from dividends.services.forecast_year import _forecast_cache, _safe_date, forecast_versions, histogram_months
+from dividends.services.holdings import load_timelines
+from dividends.services.money import from_cents, to_micro
+
+try:
+    import numpy as np
+except ImportError:  # backend optionnel
+    np = None
+
+
+INT64_MAX = 2**63 - 1
+FLOAT_EXACT = 2**53  # bincount(weights=...) passe par float64
+_ASSET_SHIFT = 2**32  # clé triable (asset, jour) = idx * 2^32 + ordinal
+
+
+BACKENDS = ("auto", "numpy", "decimal")
+
+
+def available() -> bool:
+    backend = getattr(settings, "DIVIDENDS_FORECAST_BACKEND", "auto")
+    if backend not in BACKENDS:
+        raise ImproperlyConfigured(f"DIVIDENDS_FORECAST_BACKEND={backend!r} (attendu: {' | '.join(BACKENDS)})")
+    if backend == "numpy" and np is None:
+        raise ImproperlyConfigured('DIVIDENDS_FORECAST_BACKEND="numpy" mais numpy n\'est pas installé')
+    return backend != "decimal" and np is not None
+
+
+def _round_half_even_div(num, den: int):
+    """Division entière vectorisée, arrondi HALF_EVEN (num >= 0)."""
+    q, r = np.divmod(num, den)
+    twice = 2 * r
+    up = (twice > den) | ((twice == den) & (q % 2 == 1))
+    return q + up
+
+
+@dataclass
+class YearArrays:
+    year: int
+    tickers: List[str]  # index -> ticker (ordre des assets)
+    asset_idx: "np.ndarray"  # par event
+    display_ord: "np.ndarray"  # date affichée (ordinal)
+    month: "np.ndarray"  # 0..11
+    cents: "np.ndarray"  # montant estimé en centimes
+    received: "np.ndarray"  # bool
+
+    def histogram(self) -> Tuple[List[dict], Decimal, Decimal]:
+        """Même sortie que year_histogram(build_year_events(...), year)."""
+        total = np.bincount(self.month, weights=self.cents, minlength=12).astype(np.int64)
+        rec = np.bincount(self.month, weights=np.where(self.received, self.cents, 0), minlength=12).astype(np.int64)
+        return histogram_months(
+            [from_cents(v) for v in total],
+            [from_cents(v) for v in rec],
+            [from_cents(v) for v in total - rec],
+        )
+
+    def by_ticker(self) -> Tuple[Dict[str, dict], int, int, int]:
+        """
+        Agrégats par ticker pour le heatmap (en centimes), dans l'ordre de première
+        apparition (même ordre que le parcours des events triés par (display_date, ticker)).
+        """
+        n = len(self.tickers)
+        cell = np.bincount(self.asset_idx * 12 + self.month, weights=self.cents, minlength=n * 12)
+        cell = cell.astype(np.int64).reshape(n, 12)
+        rec = np.bincount(
+            self.asset_idx, weights=np.where(self.received, self.cents, 0), minlength=n
+        ).astype(np.int64)
+
+        first: Dict[int, int] = {}
+        for i, d in zip(self.asset_idx.tolist(), self.display_ord.tolist()):
+            if i not in first or d < first[i]:
+                first[i] = d
+        order = sorted(first, key=lambda i: (first[i], self.tickers[i]))
+
+        out: Dict[str, dict] = {}
+        for i in order:
+            row_total = int(cell[i].sum())
+            out[self.tickers[i]] = {
+                "total": row_total,
+                "received": int(rec[i]),
+                "regular": row_total - int(rec[i]),
+                "by_month": {m + 1: v for m, v in enumerate(cell[i].tolist()) if v},
+            }
+
+        total = int(self.cents.sum())
+        received = int(self.cents[self.received].sum())
+        return out, total, received, total - received
+
+
+def project_year_arrays(user, year: int, growth_pct: Decimal = Decimal("0")) -> Optional[YearArrays]:
+    """
+    Projection de `year` en tableaux ; None si le backend ne s'applique pas
+    (l'appelant repasse alors par build_year_events).
+    """
+    if not available() or (growth_pct and growth_pct != 0):
+        return None
+
+    today = timezone.localdate()
+    assets = list(Asset.objects.filter(user=user, is_active=True).order_by("ticker").values_list("id", "ticker"))
+
+    # ✅ même invalidation que _cached_projection : la clé change avec la version d'un des assets
+    versions = forecast_versions(aid for aid, _t in assets)
+    digest = hashlib.sha1(repr(sorted(versions.items())).encode()).hexdigest()
+    key = f"dividends:fa:{user.pk}:{year}:{today.isoformat()}:{digest}"
+    cache = _forecast_cache()
+    arrays = cache.get(key)
+    if arrays is None:
+        arrays = _project_year_arrays(assets, year, today)
+        if arrays is not None:
+            cache.set(key, arrays, timeout=getattr(settings, "DIVIDENDS_FORECAST_CACHE_TTL", 300))
+    return arrays
+
+
+def _project_year_arrays(assets: List[Tuple[int, str]], year: int, today: date) -> Optional[YearArrays]:
+    idx_by_id = {aid: i for i, (aid, _t) in enumerate(assets)}
+    tickers = [t for _aid, t in assets]
+    empty = YearArrays(
+        year=year,
+        tickers=tickers,
+        asset_idx=np.zeros(0, dtype=np.int64),
+        display_ord=np.zeros(0, dtype=np.int64),
+        month=np.zeros(0, dtype=np.int64),
+        cents=np.zeros(0, dtype=np.int64),
+        received=np.zeros(0, dtype=bool),
+    )
+    if not assets:
+        return empty
+
+    # --- events de l'année de base (dernier ex_date.year <= year-1) par asset
+    base_rows = (
+        DividendEvent.objects.filter(asset_id__in=list(idx_by_id), ex_date__year__lte=year - 1)
+        .values("asset_id")
+        .annotate(base=Max(ExtractYear("ex_date")))
+        .values_list("asset_id", "base")
+    )
+    in_base_year = Q()
+    for aid, base in base_rows:
+        in_base_year |= Q(asset_id=aid, ex_date__year=base)
+    if not in_base_year:
+        return empty
+
+    base_events = list(
+        DividendEvent.objects.filter(in_base_year)
+        .order_by("asset_id", "ex_date")
+        .values_list("asset_id", "ex_date", "pay_date", "amount_per_share")
+    )
+
+    ev_idx, ev_ex, ev_disp, ev_aps = [], [], [], []
+    for aid, ex_d, pay_d, aps in base_events:
+        ex = _safe_date(year, ex_d.month, ex_d.day)
+        pay = _safe_date(year, pay_d.month, pay_d.day) if pay_d else None
+        ev_idx.append(idx_by_id[aid])
+        ev_ex.append(ex.toordinal())
+        ev_disp.append((pay or ex).toordinal())
+        ev_aps.append(to_micro(aps))
+
+    # --- timeline des quantités (micro-actions) : blobs persistés sur AssetPosition
+    tx_key, tx_qty = [], []
+    timelines = load_timelines(idx_by_id)
+    for aid in sorted(timelines, key=idx_by_id.__getitem__):
+        tl = timelines[aid]
+        shift = idx_by_id[aid] * _ASSET_SHIFT
+        tx_key.extend(shift + o for o in tl.days)
+        tx_qty.extend(tl.q6)
+
+    if not tx_key or not ev_idx:
+        return empty
+
+    # garde-fous d'exactitude int64 / float64
+    if max(ev_aps) * max(tx_qty) > INT64_MAX:
+        return None
+
+    asset_idx = np.asarray(ev_idx, dtype=np.int64)
+    ex_ord = np.asarray(ev_ex, dtype=np.int64)
+    keys = np.asarray(tx_key, dtype=np.int64)
+    qtys = np.asarray(tx_qty, dtype=np.int64)
+
+    # shares à l'ex-date : dernier point (asset, jour <= ex) via searchsorted
+    ev_key = asset_idx * _ASSET_SHIFT + ex_ord
+    pos = np.searchsorted(keys, ev_key, side="right") - 1
+    valid = (pos >= 0) & ((keys[np.maximum(pos, 0)] // _ASSET_SHIFT) == asset_idx)
+    shares = np.where(valid, qtys[np.maximum(pos, 0)], 0)
+
+    keep = shares > 0
+    asset_idx = asset_idx[keep]
+    display_ord = np.asarray(ev_disp, dtype=np.int64)[keep]
+    aps = np.asarray(ev_aps, dtype=np.int64)[keep]
+    shares = shares[keep]
+
+    # micro * micro = 1e-12 ; centimes = 1e-2 -> division par 1e10, HALF_EVEN
+    cents = _round_half_even_div(aps * shares, 10**10)
+    if int(cents.sum()) >= FLOAT_EXACT:
+        return None
+
+    if year < today.year:
+        received = np.ones(len(cents), dtype=bool)
+    elif year > today.year:
+        received = np.zeros(len(cents), dtype=bool)
+    else:
+        received = display_ord <= today.toordinal()
+
+    month = np.asarray([date.fromordinal(int(o)).month - 1 for o in display_ord.tolist()], dtype=np.int64)
+
+    return YearArrays(
+        year=year,
+        tickers=tickers,
+        asset_idx=asset_idx,
+        display_ord=display_ord,
+        month=month,
+        cents=cents,
+        received=received,
+    )
@@ -1,14 +1,21 @@
 from __future__ import annotations
 
+import time
+from bisect import bisect_right
 from dataclasses import dataclass
 from datetime import date
 from decimal import Decimal
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Tuple
 
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max, Q
+from django.db.models.functions import ExtractYear
 from django.utils import timezone
 
 from dividends.models import Asset, DividendEvent
-from dividends.services.holdings import build_tx_index, shares_asof
+from dividends.services.dashboard_cache import cached_fragment
+from dividends.services.holdings import Timeline, load_timelines
 
 
 def _safe_date(y: int, m: int, d: int) -> date:
@@ -34,6 +41,41 @@ class ForecastEvent:
     status: str  # "received" | "regular"
 
 
+@dataclass(slots=True)
+class BaseEvent:
+    """
+    Event projeté sur l'année cible, indépendant de la croissance :
+    montant/action de l'année de base + écart d'années. La croissance s'applique
+    ensuite en O(1) par event (apply_growth), sans requête.
+    """
+
+    asset_id: int
+    ticker: str
+    currency: str
+    ex_date: date
+    pay_date: date | None
+    display_date: date
+    base_aps: Decimal
+    years_diff: int
+    shares: Decimal
+    status: str
+
+    def with_factor(self, factor: Decimal) -> ForecastEvent:
+        aps = self.base_aps * factor
+        return ForecastEvent(
+            asset_id=self.asset_id,
+            ticker=self.ticker,
+            currency=self.currency,
+            ex_date=self.ex_date,
+            pay_date=self.pay_date,
+            display_date=self.display_date,
+            amount_per_share=aps.quantize(Decimal("0.0001")),
+            shares=self.shares,
+            estimated_amount=(aps * self.shares).quantize(Decimal("0.01")),
+            status=self.status,
+        )
+
+
 def build_year_events(user, year: int, growth_pct: Decimal = Decimal("0")) -> List[ForecastEvent]:
     """
     Logique:
@@ -47,16 +89,310 @@ def build_year_events(user, year: int, growth_pct: Decimal = Decimal("0")) -> Li
         - si year == this_year => received si display_date <= today sinon regular
     - On skip si shares == 0 (pas détenu à ex_date)
     """
+    return apply_growth(build_year_base(user, year), growth_pct)
+
+
+def build_year_base(user, year: int) -> List[BaseEvent]:
+    """Projection de `year` sans croissance (en cache par asset), triée (display_date, ticker)."""
+    today = timezone.localdate()
+
+    asset_by_id = _active_assets(user)
+    asset_ids = list(asset_by_id.keys())
+    if not asset_ids:
+        return []
+
+    by_asset = _cached_projection(user, asset_by_id, year, today)
+
+    out: List[BaseEvent] = [e for aid in asset_ids for e in by_asset.get(aid, [])]
+
+    # tri chrono
+    out.sort(key=lambda x: (x.display_date, x.ticker))
+    return out
+
+
+def _active_assets(user) -> Dict[int, Asset]:
+    """Assets actifs du user (id, ticker, devise), en cache sous la version dashboard du user."""
+    ttl = getattr(settings, "DIVIDENDS_FORECAST_CACHE_TTL", 300)
+    rows = cached_fragment(
+        "assets",
+        user.pk,
+        (),
+        ttl,
+        lambda: list(Asset.objects.filter(user=user, is_active=True).values_list("id", "ticker", "currency")),
+    )
+    return {aid: Asset(id=aid, ticker=ticker, currency=currency) for aid, ticker, currency in rows}
+
+
+def apply_growth(base: List[BaseEvent], growth_pct: Decimal = Decimal("0")) -> List[ForecastEvent]:
+    """aps * (1+g)^years_diff, un facteur par écart d'années distinct ; aucune requête."""
+    growth = (growth_pct / Decimal("100")) if growth_pct else Decimal("0")
+    factors: Dict[int, Decimal] = {}
+    out: List[ForecastEvent] = []
+    for be in base:
+        f = factors.get(be.years_diff)
+        if f is None:
+            f = factors[be.years_diff] = _growth_factor(growth, be.years_diff)
+        out.append(be.with_factor(f))
+    return out
+
+
+def growth_grid(base: List[BaseEvent], year: int, growths: Iterable[Decimal]) -> List[dict]:
+    """
+    Sensibilité à la croissance : pour chaque g (en %), totaux annuels identiques à
+    year_histogram(build_year_events(user, year, g), year). O(events x len(growths)).
+    """
+    base = [be for be in base if be.display_date.year == year]
+    out = []
+    for g in growths:
+        growth = (g / Decimal("100")) if g else Decimal("0")
+        factors: Dict[int, Decimal] = {}
+        total = received = Decimal("0.00")
+        for be in base:
+            f = factors.get(be.years_diff)
+            if f is None:
+                f = factors[be.years_diff] = _growth_factor(growth, be.years_diff)
+            amt = (be.base_aps * f * be.shares).quantize(Decimal("0.01"))
+            total += amt
+            if be.status == "received":
+                received += amt
+        out.append({"growth": g, "total": total, "received": received, "regular": total - received})
+    return out
+
+
+def build_month_events(
+    user, year: int, month: int, growth_pct: Decimal = Decimal("0")
+) -> List[ForecastEvent]:
+    """
+    Équivalent de [e for e in build_year_events(...) if e.display_date est dans (year, month)],
+    sans projeter l'année entière :
+    - ne charge que les events de l'année de base dont la date affichée tombe dans `month`
+      (pay_date si présente, sinon ex_date — la projection garde le mois)
+    - n'indexe les transactions que des assets concernés, jusqu'à la dernière ex-date utile
+    """
     today = timezone.localdate()
-    this_year = today.year
+    growth = (growth_pct / Decimal("100")) if growth_pct else Decimal("0")
+
+    assets = Asset.objects.filter(user=user, is_active=True).only("id", "ticker", "currency")
+    asset_by_id = {a.id: a for a in assets}
+    if not asset_by_id:
+        return []
+
+    # année de base par asset = dernier ex_date.year <= year-1
+    base_rows = (
+        DividendEvent.objects.filter(asset_id__in=list(asset_by_id), ex_date__year__lte=year - 1)
+        .values("asset_id")
+        .annotate(base=Max(ExtractYear("ex_date")))
+        .values_list("asset_id", "base")
+    )
+    ids_by_base: Dict[int, List[int]] = {}
+    for aid, base in base_rows:
+        ids_by_base.setdefault(base, []).append(aid)
+    if not ids_by_base:
+        return []
 
+    in_base_year = Q()
+    for base, ids in ids_by_base.items():
+        in_base_year |= Q(asset_id__in=ids, ex_date__year=base)
+    in_month = Q(pay_date__month=month) | Q(pay_date__isnull=True, ex_date__month=month)
+
+    base_events = list(
+        DividendEvent.objects.filter(in_base_year & in_month)
+        .only("asset_id", "ex_date", "pay_date", "amount_per_share", "currency")
+        .order_by("asset_id", "ex_date")
+    )
+    if not base_events:
+        return []
+
+    timelines = load_timelines({e.asset_id for e in base_events})
+
+    out: List[ForecastEvent] = []
+    for e in base_events:
+        a = asset_by_id[e.asset_id]
+        be = _project_event(a, e, year, timelines.get(e.asset_id, _NO_HOLDINGS), today)
+        if be is not None:
+            out.append(be.with_factor(_growth_factor(growth, be.years_diff)))
+
+    out.sort(key=lambda x: (x.display_date, x.ticker))
+    return out
+
+
+def build_range_events(
+    user, start_year: int, end_year: int, growth_pct: Decimal = Decimal("0")
+) -> Dict[int, List[ForecastEvent]]:
+    """
+    Projection multi-années : {year: [ForecastEvent]} pour start_year..end_year (inclus).
+    Même logique que build_year_events année par année, mais :
+    - l'historique et l'index des transactions sont chargés une seule fois
+    - un facteur de croissance (1+g)^n par écart d'années distinct, calculé par _growth_factor
+      comme build_year_events (un produit cumulé arrondirait différemment au 28e chiffre)
+    """
+    today = timezone.localdate()
     growth = (growth_pct / Decimal("100")) if growth_pct else Decimal("0")
 
+    out: Dict[int, List[ForecastEvent]] = {y: [] for y in range(start_year, end_year + 1)}
+    if end_year < start_year:
+        return out
+
     assets = Asset.objects.filter(user=user, is_active=True).only("id", "ticker", "currency")
     asset_by_id = {a.id: a for a in assets}
     asset_ids = list(asset_by_id.keys())
     if not asset_ids:
-        return []
+        return out
+
+    hist_events = (
+        DividendEvent.objects.filter(asset_id__in=asset_ids, ex_date__year__lte=end_year - 1)
+        .only("asset_id", "ex_date", "pay_date", "amount_per_share", "currency")
+        .order_by("asset_id", "ex_date")
+    )
+
+    events_by_asset_year: Dict[tuple[int, int], List[DividendEvent]] = {}
+    years_by_asset: Dict[int, List[int]] = {}  # années avec events, triées asc
+    for e in hist_events:
+        y = e.ex_date.year
+        key = (e.asset_id, y)
+        if key not in events_by_asset_year:
+            years_by_asset.setdefault(e.asset_id, []).append(y)
+        events_by_asset_year.setdefault(key, []).append(e)
+
+    timelines = load_timelines(asset_ids)
+
+    factors: Dict[int, Decimal] = {}  # years_diff -> (1+g)^years_diff
+
+    for asset_id in asset_ids:
+        years = years_by_asset.get(asset_id)
+        if not years:
+            continue
+
+        a = asset_by_id[asset_id]
+        tl = timelines.get(asset_id, _NO_HOLDINGS)
+
+        for year in out:
+            # base = dernier year dispo <= year-1
+            i = bisect_right(years, year - 1)
+            if i == 0:
+                continue
+            base_year = years[i - 1]
+
+            years_diff = year - base_year
+            f = factors.get(years_diff)
+            if f is None:
+                f = factors[years_diff] = _growth_factor(growth, years_diff)
+
+            for e in events_by_asset_year[(asset_id, base_year)]:
+                be = _project_event(a, e, year, tl, today)
+                if be is not None:
+                    out[year].append(be.with_factor(f))
+
+    for events in out.values():
+        events.sort(key=lambda x: (x.display_date, x.ticker))
+    return out
+
+
+# =========================
+# Cache par (user, année, asset), invalidé par signaux
+# =========================
+def _forecast_cache():
+    return caches[getattr(settings, "DIVIDENDS_CACHE_ALIAS", "default")]
+
+
+def _version_key(asset_id: int) -> str:
+    return f"dividends:fy:ver:{asset_id}"
+
+
+def invalidate_forecasts(asset_ids: Iterable[int]) -> None:
+    """
+    Rend obsolètes les projections en cache des assets donnés (toutes années / croissances).
+    Appelé par les signaux Transaction / DividendEvent / Asset.
+    """
+    token = time.time_ns()
+    _forecast_cache().set_many({_version_key(aid): token for aid in set(asset_ids)}, timeout=None)
+
+
+def forecast_versions(asset_ids: Iterable[int]) -> Dict[int, int]:
+    """Version courante (jeton) de chaque asset ; changée par invalidate_forecasts."""
+    cache = _forecast_cache()
+    asset_ids = list(asset_ids)
+
+    versions = cache.get_many([_version_key(aid) for aid in asset_ids])
+    missing_versions = {}
+    for aid in asset_ids:
+        if _version_key(aid) not in versions:
+            # version absente (1er accès ou éviction) : nouvelle version -> anciennes entrées inaccessibles
+            missing_versions[_version_key(aid)] = time.time_ns()
+    if missing_versions:
+        cache.set_many(missing_versions, timeout=None)
+        versions.update(missing_versions)
+
+    return {aid: versions[_version_key(aid)] for aid in asset_ids}
+
+
+def _cached_projection(
+    user, asset_by_id: Dict[int, Asset], year: int, today: date
+) -> Dict[int, List[BaseEvent]]:
+    cache = _forecast_cache()
+    ttl = getattr(settings, "DIVIDENDS_FORECAST_CACHE_TTL", 300)
+    versions = forecast_versions(asset_by_id)
+
+    # pas de croissance dans la clé : une entrée sert toutes les valeurs de g
+    keys = {aid: f"dividends:fy:{user.pk}:{aid}:{year}:{today.isoformat()}:{versions[aid]}" for aid in asset_by_id}
+
+    hits = cache.get_many(list(keys.values()))
+    out = {aid: hits[k] for aid, k in keys.items() if k in hits}
+
+    todo = {aid: a for aid, a in asset_by_id.items() if aid not in out}
+    if todo:
+        computed = _project_assets(user, todo, year, today)
+        out.update(computed)
+        cache.set_many({keys[aid]: evs for aid, evs in computed.items()}, timeout=ttl)
+
+    return out
+
+
+_NO_HOLDINGS = Timeline()
+
+
+def _growth_factor(growth: Decimal, years_diff: int) -> Decimal:
+    return (Decimal("1") + growth) ** Decimal(str(years_diff)) if years_diff else Decimal("1")
+
+
+def _project_event(
+    a: Asset, e: DividendEvent, year: int, tl: Timeline, today: date
+) -> BaseEvent | None:
+    """Projette un event de l'année de base sur `year` ; None si rien n'est détenu à l'ex-date."""
+    ex = _safe_date(year, e.ex_date.month, e.ex_date.day)
+    pay = _safe_date(year, e.pay_date.month, e.pay_date.day) if e.pay_date else None
+    display = pay or ex
+
+    sh = tl.shares_asof(ex)
+    if sh <= 0:
+        return None
+
+    if year < today.year:
+        status = "received"
+    elif year > today.year:
+        status = "regular"
+    else:
+        status = "received" if display <= today else "regular"
+
+    return BaseEvent(
+        asset_id=a.id,
+        ticker=a.ticker,
+        currency=(e.currency or a.currency or "EUR"),
+        ex_date=ex,
+        pay_date=pay,
+        display_date=display,
+        base_aps=(e.amount_per_share or Decimal("0")),
+        years_diff=year - e.ex_date.year,
+        shares=sh,
+        status=status,
+    )
+
+
+def _project_assets(
+    user, asset_by_id: Dict[int, Asset], year: int, today: date
+) -> Dict[int, List[BaseEvent]]:
+    """Projection de l'année cible (sans croissance) pour les assets donnés ; {asset_id: [BaseEvent]}."""
+    asset_ids = list(asset_by_id.keys())
 
     # On charge tous les events "historiques" jusqu'à year-1 (pour pouvoir projeter très loin)
     hist_events = (
@@ -75,9 +411,9 @@ def build_year_events(user, year: int, growth_pct: Decimal = Decimal("0")) -> Li
         events_by_asset_year.setdefault(key, []).append(e)
         base_year_by_asset[e.asset_id] = y  # comme c'est trié asc, la dernière écrase = max
 
-    tx_index = build_tx_index(user)
+    timelines = load_timelines(asset_ids)
 
-    out: List[ForecastEvent] = []
+    out: Dict[int, List[BaseEvent]] = {aid: [] for aid in asset_ids}
 
     for asset_id in asset_ids:
         base_year = base_year_by_asset.get(asset_id)
@@ -88,51 +424,17 @@ def build_year_events(user, year: int, growth_pct: Decimal = Decimal("0")) -> Li
         if not base_list:
             continue
 
-        years_diff = year - base_year
-        if years_diff < 0:
+        if year - base_year < 0:
             continue
 
-        factor = (Decimal("1") + growth) ** Decimal(str(years_diff)) if years_diff else Decimal("1")
-
         a = asset_by_id[asset_id]
-        pts = tx_index.get(asset_id, [])
+        tl = timelines.get(asset_id, _NO_HOLDINGS)
 
         for e in base_list:
-            ex = _safe_date(year, e.ex_date.month, e.ex_date.day)
-            pay = _safe_date(year, e.pay_date.month, e.pay_date.day) if e.pay_date else None
-            display = pay or ex
+            be = _project_event(a, e, year, tl, today)
+            if be is not None:
+                out[asset_id].append(be)
 
-            sh = shares_asof(pts, ex)
-            if sh <= 0:
-                continue
-
-            aps = (e.amount_per_share or Decimal("0")) * factor
-            amt = (aps * sh).quantize(Decimal("0.01"))
-
-            if year < this_year:
-                status = "received"
-            elif year > this_year:
-                status = "regular"
-            else:
-                status = "received" if display <= today else "regular"
-
-            out.append(
-                ForecastEvent(
-                    asset_id=asset_id,
-                    ticker=a.ticker,
-                    currency=(e.currency or a.currency or "EUR"),
-                    ex_date=ex,
-                    pay_date=pay,
-                    display_date=display,
-                    amount_per_share=aps.quantize(Decimal("0.0001")),
-                    shares=sh,
-                    estimated_amount=amt,
-                    status=status,
-                )
-            )
-
-    # tri chrono
-    out.sort(key=lambda x: (x.display_date, x.ticker))
     return out
 
 
@@ -142,22 +444,18 @@ def year_histogram(events: List[ForecastEvent], year: int) -> Tuple[List[dict],
     + total_year + max_month
     pct_* calculés sur max_month (0..100) pour le rendu CSS.
     """
-    labels = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    from dividends.services.aggregate import aggregate_events  # aggregate importe ce module
 
-    total = [Decimal("0.00")] * 12
-    received = [Decimal("0.00")] * 12
-    regular = [Decimal("0.00")] * 12
+    return aggregate_events(events, year).histogram()
+
+
+MONTH_LABELS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
 
-    for e in events:
-        if e.display_date.year != year:
-            continue
-        i = e.display_date.month - 1
-        total[i] += e.estimated_amount
-        if e.status == "received":
-            received[i] += e.estimated_amount
-        else:
-            regular[i] += e.estimated_amount
 
+def histogram_months(
+    total: List[Decimal], received: List[Decimal], regular: List[Decimal]
+) -> Tuple[List[dict], Decimal, Decimal]:
+    """Mise en forme commune de l'histogramme à partir des 12 totaux mensuels."""
     total_year = sum(total, Decimal("0.00"))
     max_month = max(total) if total else Decimal("0.00")
     if max_month <= 0:
@@ -174,7 +472,7 @@ def year_histogram(events: List[ForecastEvent], year: int) -> Tuple[List[dict],
 
         months.append(
             {
-                "label": labels[i],
+                "label": MONTH_LABELS[i],
                 "total": total[i],
                 "received": received[i],
                 "regular": regular[i],
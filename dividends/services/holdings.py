@@ -1,49 +1,122 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import sys
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
 from datetime import date
 from decimal import Decimal
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-from dividends.models import Asset, Transaction
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, DecimalField, F, Max, Sum, Value, When, Window
+from django.db.models.expressions import RowRange
 
+from dividends.models import Asset, AssetPosition, Transaction
+from dividends.services.money import from_micro, to_micro
 
-@dataclass(frozen=True)
+
+_QTY = DecimalField(max_digits=20, decimal_places=6)
+
+
+@dataclass(frozen=True, slots=True)
 class TxPoint:
     d: date
-    qty: Decimal  # quantité détenue APRES cette transaction
+    q6: int  # quantité détenue APRES cette transaction, en micro-actions
+
+    @property
+    def qty(self) -> Decimal:
+        return from_micro(self.q6)
 
 
-def build_tx_index(user) -> Dict[int, List[TxPoint]]:
+def _step(q6: int, typ: str, quantity) -> int:
+    """Règle unique des quantités : BUY ajoute, SELL enlève, plancher à 0 après chaque transaction."""
+    if typ == Transaction.BUY:
+        q6 += to_micro(quantity)
+    elif typ == Transaction.SELL:
+        q6 -= to_micro(quantity)
+    return max(q6, 0)
+
+
+def build_tx_index(
+    user, asset_ids: Optional[Iterable[int]] = None, until: Optional[date] = None
+) -> Dict[int, List[TxPoint]]:
     """
     Index de transactions par asset, sous forme de points (date -> qty cumulée).
     Hypothèse: BUY ajoute, SELL enlève.
+    asset_ids: restreint l'index à ces assets (sinon: tous les assets actifs du user).
+    until: ignore les transactions postérieures (suffit pour des lookups <= until).
     """
-    assets = Asset.objects.filter(user=user, is_active=True).only("id")
-    asset_ids = list(assets.values_list("id", flat=True))
+    if asset_ids is None:
+        assets = Asset.objects.filter(user=user, is_active=True).only("id")
+        asset_ids = list(assets.values_list("id", flat=True))
+    else:
+        asset_ids = list(asset_ids)
 
-    tx = (
-        Transaction.objects.filter(asset_id__in=asset_ids)
-        .only("asset_id", "date", "type", "quantity")
-        .order_by("asset_id", "date", "id")
-    )
+    tx = Transaction.objects.filter(asset_id__in=asset_ids)
+    if until is not None:
+        tx = tx.filter(date__lte=until)
+
+    if _use_window():
+        return _index_window(tx)
+    return _index_python(tx)
 
+
+# =========================
+# Backends : fenêtre SQL (PostgreSQL) / parcours Python
+# =========================
+def _use_window() -> bool:
+    """DIVIDENDS_HOLDINGS_BACKEND: "auto" (fenêtre SQL sur PostgreSQL) | "window" | "python"."""
+    backend = getattr(settings, "DIVIDENDS_HOLDINGS_BACKEND", "auto")
+    if backend == "auto":
+        # SQLite agrège les DecimalField en flottant : cumul exact seulement côté Python
+        return connection.vendor == "postgresql"
+    return backend == "window"
+
+
+def _index_python(tx) -> Dict[int, List[TxPoint]]:
     out: Dict[int, List[TxPoint]] = {}
-    running: Dict[int, Decimal] = {}
+    running: Dict[int, int] = {}  # micro-actions
 
-    for t in tx:
-        qty = running.get(t.asset_id, Decimal("0"))
+    tx = tx.order_by("asset_id", "date", "id")
+    for asset_id, d, typ, quantity in tx.values_list("asset_id", "date", "type", "quantity"):
+        qty = running[asset_id] = _step(running.get(asset_id, 0), typ, quantity)
+        out.setdefault(asset_id, []).append(TxPoint(d=d, q6=qty))
 
-        if t.type == "BUY":
-            qty += (t.quantity or Decimal("0"))
-        elif t.type == "SELL":
-            qty -= (t.quantity or Decimal("0"))
+    return out
 
-        if qty < 0:
-            qty = Decimal("0")
 
-        running[t.asset_id] = qty
-        out.setdefault(t.asset_id, []).append(TxPoint(d=t.date, qty=qty))
+def _index_window(tx) -> Dict[int, List[TxPoint]]:
+    """
+    Cumul calculé par la base : SUM(delta) OVER (PARTITION BY asset_id ORDER BY date, id).
+    Le plancher à 0 du parcours Python (SELL > détenu) se déduit du cumul brut S :
+    q_k = S_k - min(0, min_{j<=k} S_j) -> mêmes points, sans re-parcourir les transactions.
+    """
+    delta = Case(
+        When(type=Transaction.BUY, then=F("quantity")),
+        When(type=Transaction.SELL, then=-F("quantity")),
+        default=Value(Decimal("0")),
+        output_field=_QTY,
+    )
+    cum = Window(
+        Sum(delta),
+        partition_by=[F("asset_id")],
+        order_by=[F("date").asc(), F("id").asc()],
+        frame=RowRange(start=None, end=0),
+        output_field=_QTY,
+    )
+    rows = tx.annotate(cum=cum).order_by("asset_id", "date", "id").values_list("asset_id", "date", "cum")
+
+    out: Dict[int, List[TxPoint]] = {}
+    floor: Dict[int, int] = {}  # min(0, plus bas cumul vu)
+
+    for asset_id, d, s in rows:
+        # arrondi au micro le plus proche : le cumul est un flottant si la base n'a pas de NUMERIC exact
+        s6 = int(Decimal(str(s)).scaleb(6).to_integral_value())
+        low = min(floor.get(asset_id, 0), s6)
+        floor[asset_id] = low
+        out.setdefault(asset_id, []).append(TxPoint(d=d, q6=s6 - low))
 
     return out
 
@@ -52,19 +125,162 @@ def shares_asof(points: List[TxPoint], asof: date) -> Decimal:
     """
     Quantité détenue à une date asof via recherche binaire dans la série.
     """
-    if not points:
-        return Decimal("0")
+    i = bisect_right(points, asof, key=lambda p: p.d)
+    return points[i - 1].qty if i else Decimal("0")
+
+
+# =========================
+# Timeline persistée (AssetPosition.timeline_days / timeline_q6)
+# =========================
+def _pack(arr: array) -> bytes:
+    # stockage little-endian, quelle que soit la machine
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _unpack(typecode: str, blob) -> array:
+    arr = array(typecode)
+    if blob:
+        arr.frombytes(bytes(blob))
+        if sys.byteorder == "big":
+            arr.byteswap()
+    return arr
+
+
+@dataclass(slots=True)
+class Timeline:
+    """
+    Quantité détenue par asset, en tableaux parallèles compacts :
+    days = ordinaux des jours de transaction (croissants, un point par jour),
+    q6 = quantité détenue en fin de journée (micro-actions, plancher à 0 comme build_tx_index).
+    """
+
+    days: array = field(default_factory=lambda: array("i"))
+    q6: array = field(default_factory=lambda: array("q"))
+
+    @classmethod
+    def from_blobs(cls, days, q6) -> "Timeline":
+        return cls(days=_unpack("i", days), q6=_unpack("q", q6))
+
+    @classmethod
+    def from_points(cls, points: Iterable[TxPoint]) -> "Timeline":
+        """Depuis build_tx_index : un point par transaction -> un point par jour (le dernier du jour)."""
+        tl = cls()
+        for p in points:
+            tl._set(p.d.toordinal(), p.q6)
+        return tl
+
+    def blobs(self) -> Tuple[bytes, bytes]:
+        return _pack(self.days), _pack(self.q6)
 
-    lo, hi = 0, len(points) - 1
-    ans = -1
-    while lo <= hi:
-        mid = (lo + hi) // 2
-        if points[mid].d <= asof:
-            ans = mid
-            lo = mid + 1
+    @property
+    def last_q6(self) -> int:
+        return self.q6[-1] if self.q6 else 0
+
+    def _set(self, o: int, q6: int) -> None:
+        if self.days and self.days[-1] == o:
+            self.q6[-1] = q6
         else:
-            hi = mid - 1
+            self.days.append(o)
+            self.q6.append(q6)
+
+    def append(self, d: date, typ: str, quantity) -> None:
+        """Applique une transaction postérieure (ou du même jour) au dernier point."""
+        self._set(d.toordinal(), _step(self.last_q6, typ, quantity))
+
+    def q6_asof(self, asof: date) -> int:
+        i = bisect_right(self.days, asof.toordinal())
+        return self.q6[i - 1] if i else 0
+
+    def shares_asof(self, asof: date) -> Decimal:
+        return from_micro(self.q6_asof(asof))
+
+
+def replay_timelines(asset_ids: Iterable[int]) -> Dict[int, Timeline]:
+    """
+    Timelines rejouées depuis Transaction via build_tx_index (fenêtre SQL sur PostgreSQL).
+    Seul chemin de reconstruction : rebuild_positions et les lectures sans position à jour.
+    """
+    asset_ids = list(asset_ids)
+    index = build_tx_index(None, asset_ids=asset_ids)
+    return {aid: Timeline.from_points(index.get(aid, ())) for aid in asset_ids}
 
-    if ans == -1:
-        return Decimal("0")
-    return points[ans].qty
\ No newline at end of file
+
+Stamp = Tuple[int, Optional[int]]  # (nombre de transactions, plus grand Transaction.id)
+
+
+def tx_stamps(asset_ids: Iterable[int]) -> Dict[int, Stamp]:
+    """Stamp réel de chaque asset (une requête groupée) ; asset sans transaction : absent."""
+    rows = (
+        Transaction.objects.filter(asset_id__in=list(asset_ids))
+        .order_by()
+        .values("asset_id")
+        .annotate(n=Count("id"), m=Max("id"))
+        .values_list("asset_id", "n", "m")
+    )
+    return {aid: (n, m) for aid, n, m in rows}
+
+
+def stale_assets(stamps: Dict[int, Stamp]) -> Set[int]:
+    """
+    Assets dont la position (tx_count, tx_max_id, tenus par les signaux) ne correspond plus aux
+    transactions : écriture sans signaux (bulk_create, loaddata, SQL direct).
+    Cas courant : une seule agrégation (nombre + max id) comparée à la somme des stamps ;
+    en cas d'écart seulement, comparaison asset par asset.
+    Une modification en place via QuerySet.update() garde le stamp : rebuild_positions reste
+    nécessaire après ce genre d'import.
+    """
+    if not stamps:
+        return set()
+    agg = Transaction.objects.filter(asset_id__in=list(stamps)).aggregate(n=Count("id"), m=Max("id"))
+    expected_n = sum(n for n, _m in stamps.values())
+    expected_m = max((m for _n, m in stamps.values() if m is not None), default=None)
+    if (agg["n"], agg["m"]) == (expected_n, expected_m):
+        return set()
+
+    real = tx_stamps(stamps)
+    return {aid for aid, stamp in stamps.items() if real.get(aid, (0, None)) != stamp}
+
+
+def load_timelines(asset_ids: Iterable[int]) -> Dict[int, Timeline]:
+    """
+    Timelines persistées des assets (blobs d'AssetPosition + une agrégation de contrôle sur Transaction).
+    Asset sans ligne AssetPosition, ou dont la position ne correspond plus aux transactions
+    (écriture sans signaux) : timeline rejouée depuis Transaction.
+    """
+    asset_ids = set(asset_ids)
+    rows = AssetPosition.objects.filter(asset_id__in=asset_ids).values_list(
+        "asset_id", "timeline_days", "timeline_q6", "tx_count", "tx_max_id"
+    )
+    out, stamps = {}, {}
+    for aid, days, q6, n, m in rows:
+        out[aid] = Timeline.from_blobs(days, q6)
+        stamps[aid] = (n, m)
+    for aid in stale_assets(stamps):
+        del out[aid]
+
+    missing = asset_ids - out.keys()
+    if missing:
+        out.update(replay_timelines(missing))
+
+    return out
+
+
+def quantity_at_date(asset, on_date: date) -> Decimal:
+    """Quantité détenue à on_date pour un seul asset (1 requête). En boucle : shares_for_events."""
+    return load_timelines([asset.pk]).get(asset.pk, Timeline()).shares_asof(on_date)
+
+
+def shares_for_events(events) -> List[Decimal]:
+    """
+    Quantités détenues à l'ex-date de chaque event (ordre conservé).
+    Une seule lecture des timelines persistées, puis une recherche binaire par event.
+    """
+    events = list(events)
+    if not events:
+        return []
+    timelines = load_timelines({ev.asset_id for ev in events})
+    empty = Timeline()
+    return [timelines.get(ev.asset_id, empty).shares_asof(ev.ex_date) for ev in events]
@@ -0,0 +1,184 @@
+# dividends/services/market_data.py
+"""
+Interface fournisseur de données de marché (quotes, dividendes, clôtures journalières).
+
+- YFinanceProvider (dividends/services/prices.py) : implémentation réelle
+- RecordingProvider : enveloppe un provider et enregistre ses réponses sur disque
+- ReplayProvider : rejoue ces réponses hors-ligne (tests / benchmarks déterministes)
+
+Contrat des méthodes bulk : un symbole absent du résultat = échec du fetch ;
+présent avec une liste vide = pas de données.
+(Pas d'import yfinance ici : le mode replay doit tourner sans réseau ni yfinance.)
+"""
+from __future__ import annotations
+
+import json
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Protocol, Tuple
+from urllib.parse import quote as _urlquote
+
+from django.conf import settings
+
+Series = List[Tuple[date, Decimal]]
+
+
+@dataclass
+class PriceQuote:
+    symbol: str
+    price: Decimal
+    asof: datetime
+    source: str
+
+
+class MarketDataProvider(Protocol):
+    name: str
+
+    def quotes(self, symbols: Iterable[str]) -> Dict[str, PriceQuote]:
+        """Dernier cours par symbole."""
+        ...
+
+    def dividends(self, symbols: Iterable[str], since: Optional[date] = None) -> Dict[str, Series]:
+        """Dividendes par action [(ex_date, montant), ...] triés, ex_date >= since."""
+        ...
+
+    def daily_closes(self, symbols: Iterable[str], start: date) -> Dict[str, Series]:
+        """Clôtures journalières [(date, close), ...] triées, date >= start."""
+        ...
+
+
+def _uniq(symbols: Iterable[str]) -> List[str]:
+    return sorted({(s or "").strip() for s in symbols} - {""})
+
+
+# =========================
+# Record / replay (fichiers JSON, un par symbole et par type)
+# =========================
+def _path(root: Path, kind: str, symbol: str) -> Path:
+    # symboles type "^FCHI" ou "BRK/B" -> nom de fichier sûr
+    return root / kind / f"{_urlquote(symbol, safe='')}.json"
+
+
+def _dump_series(rows: Series) -> list:
+    return [[d.isoformat(), str(v)] for d, v in rows]
+
+
+def _load_series(raw: list) -> Series:
+    return [(date.fromisoformat(d), Decimal(v)) for d, v in raw]
+
+
+class RecordingProvider:
+    """Enveloppe un provider et écrit chaque réponse sous `root` (écrase l'enregistrement précédent)."""
+
+    def __init__(self, inner: MarketDataProvider, root):
+        self.inner = inner
+        self.root = Path(root)
+        self.name = inner.name
+
+    def _write(self, kind: str, symbol: str, payload) -> None:
+        p = _path(self.root, kind, symbol)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(json.dumps(payload), encoding="utf-8")
+
+    def quotes(self, symbols: Iterable[str]) -> Dict[str, PriceQuote]:
+        out = self.inner.quotes(symbols)
+        for sym, q in out.items():
+            self._write("quotes", sym, {"price": str(q.price), "asof": q.asof.isoformat(), "source": q.source})
+        return out
+
+    def dividends(self, symbols: Iterable[str], since: Optional[date] = None) -> Dict[str, Series]:
+        out = self.inner.dividends(symbols, since)
+        for sym, rows in out.items():
+            self._write("dividends", sym, _dump_series(rows))
+        return out
+
+    def daily_closes(self, symbols: Iterable[str], start: date) -> Dict[str, Series]:
+        out = self.inner.daily_closes(symbols, start)
+        for sym, rows in out.items():
+            self._write("closes", sym, _dump_series(rows))
+        return out
+
+
+class ReplayProvider:
+    """
+    Sert les réponses enregistrées par RecordingProvider, sans réseau.
+    latency: délai simulé (secondes) par appel, pour des benchmarks réalistes.
+    """
+
+    name = "replay"
+
+    def __init__(self, root, latency: float = 0.0):
+        self.root = Path(root)
+        self.latency = latency
+
+    def _read(self, kind: str, symbol: str):
+        p = _path(self.root, kind, symbol)
+        if not p.exists():
+            return None
+        return json.loads(p.read_text(encoding="utf-8"))
+
+    def _wait(self) -> None:
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def quotes(self, symbols: Iterable[str]) -> Dict[str, PriceQuote]:
+        self._wait()
+        out: Dict[str, PriceQuote] = {}
+        for sym in _uniq(symbols):
+            raw = self._read("quotes", sym)
+            if raw is None:
+                continue
+            out[sym] = PriceQuote(
+                symbol=sym,
+                price=Decimal(raw["price"]),
+                asof=datetime.fromisoformat(raw["asof"]),
+                source=raw.get("source") or self.name,
+            )
+        return out
+
+    def _series(self, kind: str, symbols: Iterable[str], start: Optional[date]) -> Dict[str, Series]:
+        self._wait()
+        out: Dict[str, Series] = {}
+        for sym in _uniq(symbols):
+            raw = self._read(kind, sym)
+            if raw is None:
+                continue
+            out[sym] = [(d, v) for d, v in _load_series(raw) if start is None or d >= start]
+        return out
+
+    def dividends(self, symbols: Iterable[str], since: Optional[date] = None) -> Dict[str, Series]:
+        return self._series("dividends", symbols, since)
+
+    def daily_closes(self, symbols: Iterable[str], start: date) -> Dict[str, Series]:
+        return self._series("closes", symbols, start)
+
+
+# =========================
+# Sélection du provider
+# =========================
+def get_provider(
+    replay: Optional[str] = None, record: Optional[str] = None, chunk_size: int = 50
+) -> MarketDataProvider:
+    """
+    replay: dossier d'enregistrements -> ReplayProvider (prioritaire)
+    record: dossier où enregistrer les réponses du provider réel
+    Sans argument : DIVIDENDS_MARKET_DATA_PROVIDER ("yfinance" | "replay"),
+    DIVIDENDS_MARKET_DATA_DIR, DIVIDENDS_MARKET_DATA_RECORD, DIVIDENDS_MARKET_DATA_REPLAY_LATENCY.
+    """
+    root = getattr(settings, "DIVIDENDS_MARKET_DATA_DIR", None)
+    if replay is None and getattr(settings, "DIVIDENDS_MARKET_DATA_PROVIDER", "yfinance") == "replay":
+        replay = root
+    if replay:
+        return ReplayProvider(replay, latency=float(getattr(settings, "DIVIDENDS_MARKET_DATA_REPLAY_LATENCY", 0)))
+
+    from dividends.services.prices import YFinanceProvider  # import yfinance seulement ici
+
+    provider: MarketDataProvider = YFinanceProvider(chunk_size=chunk_size)
+    if record is None and getattr(settings, "DIVIDENDS_MARKET_DATA_RECORD", False):
+        record = root
+    if record:
+        provider = RecordingProvider(provider, record)
+    return provider
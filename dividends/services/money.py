@@ -0,0 +1,53 @@
+# dividends/services/money.py
+"""
+Virgule fixe en entiers pour les boucles chaudes.
+
+Échelles utilisées :
+- MICRO (1e-6) : quantités et prix unitaires (DecimalField à 6 décimales -> conversion exacte)
+- CENT (1e-2)  : montants affichés
+
+On convertit Decimal -> int une fois en entrée, on calcule en entiers, et on arrondit
+explicitement (HALF_EVEN, comme Decimal.quantize) une seule fois en sortie.
+"""
+from __future__ import annotations
+
+from decimal import Decimal
+
+MICRO = 10**6
+CENT = 10**2
+
+
+def to_scaled(x, places: int) -> int:
+    """Decimal/str/int -> entier à `places` décimales (exact si x n'a pas plus de décimales)."""
+    return int(Decimal(x or 0).scaleb(places))
+
+
+def to_micro(x) -> int:
+    return to_scaled(x, 6)
+
+
+def to_cents(x) -> int:
+    return to_scaled(x, 2)
+
+
+def from_scaled(n: int, places: int) -> Decimal:
+    return Decimal(int(n)).scaleb(-places)
+
+
+def from_micro(n: int) -> Decimal:
+    return from_scaled(n, 6)
+
+
+def from_cents(n: int) -> Decimal:
+    return from_scaled(n, 2)
+
+
+def div_round(num: int, den: int) -> int:
+    """num / den arrondi au plus proche, égalités au pair (HALF_EVEN). den != 0."""
+    if den < 0:
+        num, den = -num, -den
+    q, r = divmod(num, den)
+    twice = 2 * r
+    if twice > den or (twice == den and q % 2 == 1):
+        q += 1
+    return q
@@ -3,15 +3,81 @@ from __future__ import annotations
 
 from collections import defaultdict
 from dataclasses import dataclass
+from datetime import date
 from decimal import Decimal
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 from dividends.models import Asset, Transaction
+from dividends.services.quotes import load_resolved_price, resolved_price, with_quotes
 
 
 ZERO = Decimal("0")
 
 
+@dataclass
+class AvcoState:
+    """
+    État courant d'une ligne en PMP (AVCO), rejoué transaction par transaction.
+    Même sémantique que le dashboard : une vente au-delà de la quantité détenue est plafonnée.
+    """
+
+    qty: Decimal = ZERO
+    cost: Decimal = ZERO  # coût restant (qty * PMP), frais d'achat inclus
+    realized: Decimal = ZERO  # P&L réalisé cumulé
+    last_date: Optional[date] = None
+    count: int = 0
+
+    @property
+    def pmp(self) -> Decimal:
+        return (self.cost / self.qty) if self.qty > 0 else ZERO
+
+    def apply(self, type_: str, quantity, price, fees, on: date, strict: bool = False) -> Decimal:
+        """
+        Applique une transaction ; retourne le P&L réalisé par cette transaction.
+        strict=True : une vente supérieure à la quantité détenue lève ValueError.
+        """
+        q = Decimal(quantity or 0)
+        px = Decimal(price or 0)
+        f = Decimal(fees or 0)
+
+        self.count += 1
+        if self.last_date is None or on > self.last_date:
+            self.last_date = on
+
+        if q <= 0:
+            return ZERO
+
+        if type_ == Transaction.BUY:
+            self.qty += q
+            # ✅ frais inclus dans le PRU (PMP)
+            self.cost += (q * px) + f
+            return ZERO
+
+        if type_ == Transaction.SELL:
+            if strict and q > self.qty:
+                raise ValueError(f"oversell: sell {q} > held {self.qty} on {on}")
+            if self.qty <= 0:
+                return ZERO
+
+            avg = self.pmp
+            sell_qty = min(q, self.qty)
+
+            # ✅ gain réalisé = (sell - PMP) * qty - fees
+            pnl = (px - avg) * sell_qty - f
+            self.realized += pnl
+
+            self.qty -= sell_qty
+            self.cost -= sell_qty * avg
+
+            # petite protection numérique
+            if self.qty <= 0:
+                self.qty = ZERO
+                self.cost = ZERO
+            return pnl
+
+        return ZERO
+
+
 @dataclass
 class Position:
     qty: Decimal
@@ -22,55 +88,42 @@ class Position:
     realized_pnl: Decimal
 
 
+def _position(st: AvcoState, price) -> Position:
+    last_price = Decimal(price or 0)
+    market_value = st.qty * last_price
+    return Position(
+        qty=st.qty,
+        pmp=st.pmp,
+        cost_basis=st.cost,
+        market_value=market_value,
+        unrealized_pnl=market_value - st.cost,
+        realized_pnl=st.realized,
+    )
+
+
+def _replay_asset(asset: Asset) -> Tuple[AvcoState, Dict[str, Decimal]]:
+    txs = asset.transactions.all().only("type", "date", "quantity", "price", "fees").order_by("date", "id")
+
+    st = AvcoState()
+    by_month: Dict[str, Decimal] = defaultdict(lambda: ZERO)
+    for tx in txs:
+        try:
+            pnl = st.apply(tx.type, tx.quantity, tx.price, tx.fees, tx.date, strict=True)
+        except ValueError as e:
+            raise ValueError(f"[{asset.ticker}] {e}") from None
+        if tx.type == Transaction.SELL:
+            by_month[tx.date.strftime("%Y-%m")] += pnl
+    return st, dict(by_month)
+
+
 def compute_position(asset: Asset) -> Position:
     """
     PMP (AVCO) :
     - BUY : recalcul PMP
     - SELL : realized += (sell - pmp) * qty - fees ; qty baisse ; pmp inchangé tant que qty>0
     """
-    txs = asset.transactions.all().only("type", "date", "quantity", "price", "fees").order_by("date", "id")
-
-    qty = ZERO
-    pmp = ZERO
-    realized = ZERO
-
-    for tx in txs:
-        q = Decimal(tx.quantity or 0)
-        px = Decimal(tx.price or 0)
-        fees = Decimal(tx.fees or 0)
-
-        if q <= 0:
-            continue
-
-        if tx.type == Transaction.BUY:
-            new_qty = qty + q
-            total_cost = (qty * pmp) + (q * px) + fees
-            qty = new_qty
-            pmp = (total_cost / qty) if qty > 0 else ZERO
-
-        elif tx.type == Transaction.SELL:
-            if q > qty:
-                # Si tu préfères, tu peux "continue" au lieu de raise.
-                raise ValueError(f"[{asset.ticker}] oversell: sell {q} > held {qty} on {tx.date}")
-
-            realized += (px - pmp) * q - fees
-            qty -= q
-            if qty == 0:
-                pmp = ZERO
-
-    last_price = Decimal(asset.last_price or 0)
-    market_value = qty * last_price
-    cost_basis = qty * pmp
-    unrealized = market_value - cost_basis
-
-    return Position(
-        qty=qty,
-        pmp=pmp,
-        cost_basis=cost_basis,
-        market_value=market_value,
-        unrealized_pnl=unrealized,
-        realized_pnl=realized,
-    )
+    st, _ = _replay_asset(asset)
+    return _position(st, load_resolved_price(asset))
 
 
 def realized_pnl_by_month(asset: Asset) -> Dict[str, Decimal]:
@@ -78,35 +131,63 @@ def realized_pnl_by_month(asset: Asset) -> Dict[str, Decimal]:
     P&L réalisé mensuel basé sur PMP, date = date de vente.
     Return: {"YYYY-MM": pnl_decimal}
     """
-    txs = asset.transactions.all().only("type", "date", "quantity", "price", "fees").order_by("date", "id")
+    _, by_month = _replay_asset(asset)
+    return by_month
 
-    qty = ZERO
-    pmp = ZERO
-    out = defaultdict(lambda: ZERO)
 
-    for tx in txs:
-        q = Decimal(tx.quantity or 0)
-        px = Decimal(tx.price or 0)
-        fees = Decimal(tx.fees or 0)
-        if q <= 0:
-            continue
-
-        if tx.type == Transaction.BUY:
-            new_qty = qty + q
-            total_cost = (qty * pmp) + (q * px) + fees
-            qty = new_qty
-            pmp = (total_cost / qty) if qty > 0 else ZERO
+# =========================
+# Moteur portefeuille (une passe, requêtes constantes)
+# =========================
+@dataclass
+class PortfolioBook:
+    assets: Dict[int, Asset]  # assets actifs, triés par ticker
+    positions: Dict[int, Position]  # uniquement qty > 0
+    realized_by_month: Dict[str, Decimal]  # {"YYYY-MM": pnl} des lignes encore détenues
+    sector_totals: Dict[str, Decimal]  # valeur de marché par secteur
 
-        elif tx.type == Transaction.SELL:
-            if q > qty:
-                raise ValueError(f"[{asset.ticker}] oversell: sell {q} > held {qty} on {tx.date}")
 
-            pnl = (px - pmp) * q - fees
-            ym = tx.date.strftime("%Y-%m")
-            out[ym] += pnl
+def build_portfolio(user) -> PortfolioBook:
+    """
+    Charge toutes les transactions du user en une requête et produit en une passe chronologique :
+    positions (PMP), P&L réalisé par mois et totaux par secteur.
+    2 requêtes quel que soit le nombre d'assets.
+    """
+    assets = (
+        with_quotes(Asset.objects.filter(user=user, is_active=True))
+        .only("id", "ticker", "sector", "currency", "price_symbol", "last_price", "last_price_asof")
+        .order_by("ticker")
+    )
+    asset_by_id = {a.id: a for a in assets}
 
-            qty -= q
-            if qty == 0:
-                pmp = ZERO
+    txs = (
+        Transaction.objects.filter(asset_id__in=list(asset_by_id))
+        .only("asset_id", "type", "date", "quantity", "price", "fees")
+        .order_by("date", "id")
+    )
 
-    return dict(out)
\ No newline at end of file
+    states: Dict[int, AvcoState] = {aid: AvcoState() for aid in asset_by_id}
+    sells: Dict[int, list] = defaultdict(list)  # asset_id -> [(ym, pnl)]
+    for t in txs:
+        pnl = states[t.asset_id].apply(t.type, t.quantity, t.price, t.fees, t.date)
+        if t.type == Transaction.SELL:
+            sells[t.asset_id].append((t.date.strftime("%Y-%m"), pnl))
+
+    positions: Dict[int, Position] = {}
+    by_month: Dict[str, Decimal] = defaultdict(lambda: ZERO)
+    sectors: Dict[str, Decimal] = defaultdict(lambda: ZERO)
+    for aid, a in asset_by_id.items():
+        st = states[aid]
+        if st.qty <= 0:
+            continue
+        pos = _position(st, resolved_price(a))
+        positions[aid] = pos
+        sectors[a.sector or "—"] += pos.market_value
+        for ym, pnl in sells[aid]:
+            by_month[ym] += pnl
+
+    return PortfolioBook(
+        assets=asset_by_id,
+        positions=positions,
+        realized_by_month=dict(by_month),
+        sector_totals=dict(sectors),
+    )
@@ -0,0 +1,193 @@
+# dividends/services/positions.py
+"""
+Positions matérialisées (AssetPosition) : lecture O(assets) pour le dashboard et les ventes.
+
+- une transaction ajoutée "à la fin" (date >= dernière date connue) est appliquée en O(1)
+- toute autre écriture (édition, suppression, transaction antidatée) rejoue l'asset concerné
+- la timeline des quantités (timeline_days / timeline_q6) suit les mêmes règles
+- une vente passe par record_sell : ligne AssetPosition verrouillée, contrôle + insertion atomiques
+- une position qui ne correspond plus aux transactions (stamp tx_count / tx_max_id, écriture sans
+  signaux : bulk_create, loaddata) est ignorée par les lecteurs et rejouée ; après un import en
+  masse, `manage.py rebuild_positions` la remet à jour (et invalide les caches de prévision)
+"""
+from __future__ import annotations
+
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import transaction
+
+from dividends.models import AssetPosition, Transaction
+from dividends.services.holdings import Stamp, Timeline, replay_timelines, stale_assets
+from dividends.services.money import from_micro, to_micro
+from dividends.services.pnl import AvcoState
+
+
+def _state_from_row(pos: AssetPosition) -> AvcoState:
+    return AvcoState(
+        qty=pos.quantity,
+        cost=pos.cost_basis,
+        realized=pos.realized_pnl,
+        last_date=pos.last_tx_date,
+        count=pos.tx_count,
+    )
+
+
+def _fill_row(pos: AssetPosition, st: AvcoState, tl: Timeline, max_id: Optional[int]) -> AssetPosition:
+    pos.quantity = st.qty
+    pos.cost_basis = st.cost
+    pos.avg_cost = st.pmp
+    pos.realized_pnl = st.realized
+    pos.last_tx_date = st.last_date
+    pos.tx_count = st.count
+    pos.tx_max_id = max_id
+    pos.timeline_days, pos.timeline_q6 = tl.blobs()
+    return pos
+
+
+def replay_states(asset_ids: Iterable[int]) -> Dict[int, Tuple[AvcoState, Optional[int]]]:
+    """Rejoue les transactions de plusieurs assets en une requête : (état, plus grand Transaction.id)."""
+    states: Dict[int, AvcoState] = {aid: AvcoState() for aid in asset_ids}
+    max_ids: Dict[int, int] = {}
+    txs = (
+        Transaction.objects.filter(asset_id__in=list(states))
+        .only("id", "asset_id", "type", "date", "quantity", "price", "fees")
+        .order_by("asset_id", "date", "id")
+    )
+    for t in txs:
+        states[t.asset_id].apply(t.type, t.quantity, t.price, t.fees, t.date)
+        max_ids[t.asset_id] = max(max_ids.get(t.asset_id, 0), t.id)
+    return {aid: (st, max_ids.get(aid)) for aid, st in states.items()}
+
+
+def rebuild_positions(asset_ids: Iterable[int], batch_size: int = 500) -> int:
+    """
+    Reconstruit (upsert) les positions (et timelines) des assets donnés.
+    Les lignes existantes sont verrouillées (select_for_update) avant le replay, comme dans
+    apply_new_transaction / record_sell : une mise à jour O(1) concurrente n'est pas écrasée.
+    """
+    asset_ids = list(asset_ids)
+    with transaction.atomic():
+        # ordre fixe des verrous : pas d'interblocage entre deux reconstructions
+        list(
+            AssetPosition.objects.select_for_update()
+            .filter(asset_id__in=asset_ids)
+            .order_by("asset_id")
+            .values_list("asset_id", flat=True)
+        )
+        return _rebuild_rows(asset_ids, batch_size)
+
+
+def _rebuild_rows(asset_ids: List[int], batch_size: int) -> int:
+    states = replay_states(asset_ids)
+    timelines = replay_timelines(asset_ids)
+    rows = [
+        _fill_row(AssetPosition(asset_id=aid), st, timelines[aid], max_id) for aid, (st, max_id) in states.items()
+    ]
+    if rows:
+        AssetPosition.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["asset"],
+            update_fields=[
+                "quantity",
+                "cost_basis",
+                "avg_cost",
+                "realized_pnl",
+                "last_tx_date",
+                "tx_count",
+                "tx_max_id",
+                "timeline_days",
+                "timeline_q6",
+            ],
+        )
+    return len(rows)
+
+
+def rebuild_position(asset_id: int) -> None:
+    rebuild_positions([asset_id])
+
+
+def refresh_stale_positions(stamps: Dict[int, Stamp]) -> Set[int]:
+    """
+    Pour les lecteurs directs d'AssetPosition (quantité, PMP) : reconstruit les positions dont le
+    stamp (tx_count, tx_max_id) ne correspond plus aux transactions. Asset sans ligne : (0, None).
+    Retourne les assets reconstruits (vide dans le cas courant : une agrégation de contrôle).
+    """
+    stale = stale_assets(stamps)
+    if stale:
+        rebuild_positions(sorted(stale))
+    return stale
+
+
+def apply_new_transaction(tx: Transaction) -> None:
+    """
+    Appelé après la création d'une transaction.
+    O(1) si elle est la plus récente de l'asset, sinon rejoue l'asset.
+    """
+    with transaction.atomic():
+        pos, created = AssetPosition.objects.select_for_update().get_or_create(asset_id=tx.asset_id)
+
+        # ligne absente (historique antérieur aux positions) ou transaction antidatée -> replay
+        if created or (pos.last_tx_date is not None and tx.date < pos.last_tx_date):
+            rebuild_position(tx.asset_id)
+            return
+
+        st = _state_from_row(pos)
+        st.apply(tx.type, tx.quantity, tx.price, tx.fees, tx.date)
+        tl = Timeline.from_blobs(pos.timeline_days, pos.timeline_q6)
+        tl.append(tx.date, tx.type, tx.quantity)
+        _fill_row(pos, st, tl, max(pos.tx_max_id or 0, tx.id)).save()
+
+
+# =========================
+# Vente (contrôle de survente sous verrou)
+# =========================
+class OversellError(ValueError):
+    def __init__(self, qty: Decimal, available: Decimal, on: date):
+        super().__init__(f"oversell: sell {qty} > available {available} on {on}")
+        self.qty = qty
+        self.available = available
+        self.on = on
+
+
+def available_to_sell(tl: Timeline, on: date) -> int:
+    """
+    Micro-actions vendables à `on` sans rendre négatif un point ultérieur de la timeline :
+    min(quantité à `on`, quantités des jours suivants). O(1) pour une vente datée après
+    la dernière transaction ; une vente antidatée parcourt les points postérieurs.
+    """
+    i = bisect_right(tl.days, on.toordinal())
+    if i == 0:
+        return 0
+    return min(tl.q6[i - 1 :])
+
+
+def record_sell(asset_id: int, on: date, quantity, price, fees=Decimal("0.00")) -> Transaction:
+    """
+    Insère une vente si elle ne crée pas de survente (à sa date ni plus tard).
+    La ligne AssetPosition est verrouillée (select_for_update) jusqu'au commit :
+    deux ventes concurrentes sur le même asset sont sérialisées, la seconde voit la première.
+    Lève OversellError sinon ; la position est mise à jour dans la même transaction (signal).
+    """
+    locked = AssetPosition.objects.select_for_update()
+    with transaction.atomic():
+        pos = locked.filter(asset_id=asset_id).first()
+        if pos is None or stale_assets({asset_id: (pos.tx_count, pos.tx_max_id)}):
+            # historique antérieur aux positions, ou transactions écrites sans signaux :
+            # on (re)construit avant de contrôler, puis on verrouille la ligne à jour
+            rebuild_position(asset_id)
+            pos = locked.get(asset_id=asset_id)
+
+        tl = Timeline.from_blobs(pos.timeline_days, pos.timeline_q6)
+        available = available_to_sell(tl, on)
+        if to_micro(quantity) > available:
+            raise OversellError(Decimal(quantity), from_micro(available), on)
+
+        # post_save -> apply_new_transaction (même transaction, ligne déjà verrouillée)
+        return Transaction.objects.create(
+            asset_id=asset_id, type=Transaction.SELL, date=on, quantity=quantity, price=price, fees=fees
+        )
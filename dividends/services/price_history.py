@@ -0,0 +1,20 @@
+# dividends/services/price_history.py
+from __future__ import annotations
+
+from datetime import date
+from typing import Dict, Iterable
+
+from django.db.models import Max
+
+from dividends.models import DailyPrice
+
+
+def last_stored_dates(symbols: Iterable[str]) -> Dict[str, date]:
+    """Dernière date stockée par symbole (base de l'incrémental, re-téléchargée à chaque passage)."""
+    rows = (
+        DailyPrice.objects.filter(symbol__in=list(symbols))
+        .values("symbol")
+        .annotate(last=Max("date"))
+        .values_list("symbol", "last")
+    )
+    return dict(rows)
@@ -1,56 +1,148 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
 from decimal import Decimal
-from datetime import datetime
+from datetime import date
+from typing import Dict, Iterable, List, Optional
 from django.utils import timezone
 
 import yfinance as yf
 
+from dividends.services.market_data import PriceQuote, Series
 
-@dataclass
-class PriceQuote:
-    symbol: str
-    price: Decimal
-    asof: datetime
-    source: str
 
-
-def get_quote(symbol: str) -> PriceQuote | None:
-    """
-    Source unique et stable pour récupérer un prix.
-    Yahoo via yfinance (gère cookies/consent mieux que requests).
-    """
-    symbol = (symbol or "").strip()
-    if not symbol:
-        return None
-
-    t = yf.Ticker(symbol)
-    hist = t.history(period="7d")  # marge (week-end / jours fériés)
-    if hist is None or hist.empty:
-        return None
-
-    close = hist["Close"].dropna()
+def _last_close(close) -> Decimal | None:
+    close = close.dropna()
     if close.empty:
         return None
 
     price = Decimal(str(close.iloc[-1]))
     if price <= 0:
         return None
+    return price
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def get_quotes(symbols: Iterable[str], chunk_size: int = 50) -> Dict[str, PriceQuote]:
+    """
+    Derniers cours : un seul yf.download par paquet de `chunk_size` symboles.
+    Les symboles sont dédoublonnés ; ceux sans cours exploitable sont absents du résultat.
+    """
+    uniq = sorted({(s or "").strip() for s in symbols} - {""})
+    out: Dict[str, PriceQuote] = {}
+
+    for chunk in _chunks(uniq, max(1, chunk_size)):
+        frame = yf.download(
+            tickers=chunk,
+            period="7d",  # marge (week-end / jours fériés)
+            group_by="ticker",
+            auto_adjust=False,
+            progress=False,
+            threads=True,
+        )
+        if frame is None or frame.empty:
+            continue
+
+        asof = timezone.now()
+        multi = getattr(frame.columns, "nlevels", 1) > 1
+
+        for sym in chunk:
+            try:
+                close = frame[sym]["Close"] if multi else frame["Close"]
+            except KeyError:
+                continue
+
+            price = _last_close(close)
+            if price is None:
+                continue
+            out[sym] = PriceQuote(symbol=sym, price=price, asof=asof, source="yfinance")
+
+    return out
+
+
+def get_daily_closes(symbols: Iterable[str], start: date, chunk_size: int = 50) -> Dict[str, Series]:
+    """
+    Clôtures journalières depuis `start` (inclus) pour plusieurs symboles, par paquets.
+    Retour: {symbol: [(date, close), ...]} trié par date, sans les jours vides.
+    """
+    uniq = sorted({(s or "").strip() for s in symbols} - {""})
+    out: Dict[str, Series] = {}
+
+    for chunk in _chunks(uniq, max(1, chunk_size)):
+        frame = yf.download(
+            tickers=chunk,
+            start=start.isoformat(),
+            interval="1d",
+            group_by="ticker",
+            auto_adjust=False,
+            progress=False,
+            threads=True,
+        )
+        if frame is None or frame.empty:
+            continue
+
+        multi = getattr(frame.columns, "nlevels", 1) > 1
+
+        for sym in chunk:
+            try:
+                close = frame[sym]["Close"] if multi else frame["Close"]
+            except KeyError:
+                continue
+
+            rows = []
+            for ts, v in close.dropna().items():
+                px = Decimal(str(v))
+                if px > 0 and ts.date() >= start:
+                    rows.append((ts.date(), px))
+            if rows:
+                out[sym] = rows
+
+    return out
+
+
+def get_dividends(symbols: Iterable[str], since: Optional[date] = None) -> Dict[str, Series]:
+    """
+    Historique des dividendes par action pour plusieurs symboles.
+    yfinance n'expose pas de download groupé des dividendes : un appel Ticker par symbole.
+    Les symboles en erreur sont absents du résultat ; [] = aucun dividende.
+    """
+    out: Dict[str, Series] = {}
+    for sym in sorted({(s or "").strip() for s in symbols} - {""}):
+        try:
+            s = yf.Ticker(sym).dividends
+        except Exception:
+            continue
+
+        rows = []
+        if s is not None and not getattr(s, "empty", True):
+            for ts, amt in s.items():
+                try:
+                    amount = Decimal(str(amt))
+                except Exception:
+                    continue
+                if since is None or ts.date() >= since:
+                    rows.append((ts.date(), amount))
+        out[sym] = rows
+
+    return out
+
+
+class YFinanceProvider:
+    """MarketDataProvider adossé à yfinance (voir dividends/services/market_data.py)."""
 
-    return PriceQuote(symbol=symbol, price=price, asof=timezone.now(), source="yfinance")
+    name = "yfinance"
 
+    def __init__(self, chunk_size: int = 50):
+        self.chunk_size = chunk_size
 
-def update_asset_price(asset) -> bool:
-    sym = (getattr(asset, "price_symbol", "") or "").strip()
-    if not sym:
-        return False
+    def quotes(self, symbols: Iterable[str]) -> Dict[str, PriceQuote]:
+        return get_quotes(symbols, chunk_size=self.chunk_size)
 
-    q = get_quote(sym)
-    if not q:
-        return False
+    def dividends(self, symbols: Iterable[str], since: Optional[date] = None) -> Dict[str, Series]:
+        return get_dividends(symbols, since)
 
-    asset.last_price = q.price.quantize(Decimal("0.01"))  # 2 décimales
-    asset.last_price_updated_at = q.asof
-    asset.save(update_fields=["last_price", "last_price_asof"])
-    return True
\ No newline at end of file
+    def daily_closes(self, symbols: Iterable[str], start: date) -> Dict[str, Series]:
+        return get_daily_closes(symbols, start, chunk_size=self.chunk_size)
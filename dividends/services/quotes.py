@@ -0,0 +1,109 @@
+# dividends/services/quotes.py
+"""
+Quotes partagées : une ligne Quote par price_symbol, lue par toutes les valorisations.
+(Pas d'import yfinance ici : ce module est utilisé côté vues.)
+"""
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import TYPE_CHECKING, Iterable, Set
+
+from django.db.models import OuterRef, QuerySet, Subquery
+from django.utils import timezone
+
+from dividends.models import Quote
+
+if TYPE_CHECKING:
+    from dividends.services.market_data import MarketDataProvider, PriceQuote
+
+
+PRICE_Q = Decimal("0.000001")  # Quote.price et Asset.last_price : 6 décimales
+
+
+def quantize_price(price: Decimal) -> Decimal:
+    """Arrondi unique des cours, quel que soit le chemin d'écriture."""
+    return price.quantize(PRICE_Q)
+
+
+def store_quotes(quotes: Iterable[PriceQuote]) -> int:
+    """
+    Upsert des cours dans Quote (une requête par appel, quel que soit le nombre de symboles).
+    Asset.last_price n'est pas recopié : les lectures passent par with_quotes(), le fallback
+    ne sert qu'aux symboles jamais synchronisés.
+    """
+    now = timezone.now()
+    rows = {
+        q.symbol: Quote(
+            symbol=q.symbol,
+            price=quantize_price(q.price),
+            asof=q.asof,
+            source=q.source,
+            fetched_at=now,
+        )
+        for q in quotes
+    }
+    if not rows:
+        return 0
+
+    Quote.objects.bulk_create(
+        list(rows.values()),
+        update_conflicts=True,
+        unique_fields=["symbol"],
+        update_fields=["price", "asof", "source", "fetched_at"],
+    )
+
+    return len(rows)
+
+
+def update_asset_price(asset, provider: MarketDataProvider) -> PriceQuote | None:
+    """Cours du price_symbol de l'asset via le provider, stocké dans la quote partagée (Asset non modifié)."""
+    sym = (getattr(asset, "price_symbol", "") or "").strip()
+    if not sym:
+        return None
+
+    q = provider.quotes([sym]).get(sym)
+    if not q:
+        return None
+
+    store_quotes([q])
+    return q
+
+
+def fresh_symbols(symbols: Iterable[str]) -> Set[str]:
+    """Symboles dont la quote partagée est encore dans le TTL (inutile de les re-télécharger)."""
+    limit = timezone.now() - Quote.ttl()
+    return set(
+        Quote.objects.filter(symbol__in=list(symbols), fetched_at__gte=limit).values_list("symbol", flat=True)
+    )
+
+
+def with_quotes(qs: QuerySet) -> QuerySet:
+    """
+    Annote un queryset d'Asset avec la quote partagée de son price_symbol
+    (quote_price / quote_asof), en une seule requête SQL.
+    """
+    quote = Quote.objects.filter(symbol=OuterRef("price_symbol"))
+    return qs.annotate(
+        quote_price=Subquery(quote.values("price")[:1]),
+        quote_asof=Subquery(quote.values("asof")[:1]),
+    )
+
+
+def resolved_price(asset) -> Decimal | None:
+    """
+    Prix à utiliser pour valoriser un asset : quote partagée, sinon Asset.last_price.
+    L'asset doit venir d'un queryset with_quotes() (pas de requête cachée par asset) ;
+    pour un asset isolé : load_resolved_price.
+    """
+    if not hasattr(asset, "quote_price"):
+        raise ValueError(f"resolved_price: Asset#{asset.pk} chargé sans with_quotes()")
+    return asset.quote_price if asset.quote_price is not None else asset.last_price
+
+
+def load_resolved_price(asset) -> Decimal | None:
+    """resolved_price pour UN asset chargé sans with_quotes() (1 requête) ; en boucle : with_quotes()."""
+    if hasattr(asset, "quote_price"):
+        return resolved_price(asset)
+    sym = (asset.price_symbol or asset.ticker or "").strip()
+    price = Quote.objects.filter(symbol=sym).values_list("price", flat=True).first() if sym else None
+    return price if price is not None else asset.last_price
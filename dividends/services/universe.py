@@ -1,11 +1,29 @@
 # dividends/services/universe.py
+"""
+Référentiel d'instruments (actions / ETFs), chargé depuis un fichier TSV.
+
+- fichier : DIVIDENDS_UNIVERSE_FILE (défaut: dividends/data/universe.tsv), une ligne par instrument
+  colonnes : key, label, symbol, isin, kind, currency, country, exchange, sector
+- parsé paresseusement au premier accès, une fois par process (dizaines de milliers de lignes OK)
+- index de préfixes trié (label + chaque mot du label, ticker, ISIN) -> recherche par bisect
+- ticker / racine du ticker / ISIN exacts : dictionnaire, servis avant les préfixes
+"""
 from __future__ import annotations
 
+import re
+import unicodedata
+from bisect import bisect_left
 from dataclasses import dataclass
-from typing import Dict, List
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
 
+from django.conf import settings
 
-@dataclass(frozen=True)
+DEFAULT_FILE = Path(__file__).resolve().parent.parent / "data" / "universe.tsv"
+
+
+@dataclass(frozen=True, slots=True)
 class UniverseItem:
     key: str                 # clé interne stable
     label: str               # nom affiché
@@ -23,144 +41,127 @@ def _k(s: str) -> str:
     return s.strip().lower()
 
 
-def universe_choices() -> List[UniverseItem]:
+def _norm(s: str) -> str:
+    """Terme de recherche : minuscules, sans accents ("Société" -> "societe"), apostrophe droite."""
+    s = unicodedata.normalize("NFKD", s.strip().casefold().replace("’", "'"))
+    return "".join(c for c in s if not unicodedata.combining(c))
+
+
+# séparateurs de mots du label : espaces, tirets, apostrophes, points ("L'Oréal" -> "oreal", "S.A." -> ...)
+_WORD_SEP = re.compile(r"[\s\-'.]+")
+
+
+class InstrumentMaster:
     """
-    Retourne une liste triée pour affichage (actions puis ETFs).
+    items : triés pour l'affichage (actions puis ETFs, par label), calculé une fois.
+    index : termes normalisés triés + indice de l'item (tableaux parallèles).
     """
-    items = list(UNIVERSE.values())
-    items.sort(key=lambda x: (x.kind, x.label))
+
+    def __init__(self, items: List[UniverseItem]):
+        self.items = sorted(items, key=lambda x: (x.kind, x.label))
+        self.by_key: Dict[str, UniverseItem] = {it.key: it for it in self.items}
+        self.by_symbol: Dict[str, UniverseItem] = {}
+        for it in self.items:
+            self.by_symbol.setdefault(it.symbol, it)
+            self.by_symbol.setdefault(it.ticker, it)
+
+        # ticker, racine du ticker ("san" pour SAN.PA) et ISIN exacts -> items, dans l'ordre d'affichage
+        self._exact: Dict[str, List[int]] = {}
+        entries = []
+        for i, it in enumerate(self.items):
+            ticker = _norm(it.ticker)
+            for k in dict.fromkeys((ticker, ticker.split(".")[0], _norm(it.isin))):
+                if k:
+                    self._exact.setdefault(k, []).append(i)
+
+            label = _norm(it.label)
+            terms = {label, ticker, _norm(it.isin)}
+            terms.update(w for w in _WORD_SEP.split(label) if len(w) > 1)
+            entries.extend((t, i) for t in terms if t)
+        entries.sort()
+        self._terms = [t for t, _i in entries]
+        self._idx = [i for _t, i in entries]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def get(self, key: str) -> Optional[UniverseItem]:
+        return self.by_key.get(_k(key or ""))
+
+    def search(self, query: str, limit: int = 20) -> List[UniverseItem]:
+        """
+        Ticker / ISIN exacts d'abord (ticker complet, puis racine), puis les instruments dont
+        un terme commence par `query`, par label, jusqu'à `limit`.
+        """
+        q = _norm(query or "")
+        if not q or limit <= 0:
+            return []
+
+        exact = self._exact.get(q, [])
+        exact = sorted(exact, key=lambda i: _norm(self.items[i].ticker) != q)[:limit]
+        seen = set(exact)
+
+        prefix = []
+        pos = bisect_left(self._terms, q)
+        while pos < len(self._terms) and self._terms[pos].startswith(q) and len(seen) < limit:
+            i = self._idx[pos]
+            if i not in seen:
+                seen.add(i)
+                prefix.append(i)
+            pos += 1
+        prefix.sort(key=lambda i: self.items[i].label)
+
+        return [self.items[i] for i in exact + prefix]
+
+
+def _read_tsv(path: Path) -> List[UniverseItem]:
+    items = []
+    with open(path, encoding="utf-8") as f:
+        header = f.readline().rstrip("\n").split("\t")
+        for line in f:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            row = dict(zip(header, line.split("\t")))
+            sym = row.get("symbol", "").strip()
+            if not sym:
+                continue
+            items.append(
+                UniverseItem(
+                    key=_k(row.get("key") or sym),
+                    label=row.get("label", "").strip() or sym,
+                    ticker=sym,
+                    symbol=sym,
+                    isin=row.get("isin", "").strip(),
+                    kind=row.get("kind", "").strip() or "stock",
+                    currency=row.get("currency", "").strip() or "EUR",
+                    country=row.get("country", "").strip() or "FR",
+                    exchange=row.get("exchange", "").strip() or "XPAR",
+                    sector=row.get("sector", "").strip() or "—",
+                )
+            )
     return items
 
 
-# ---------------------------------------------------------------------
-# UNIVERSE
-# - ticker/symbol: pour ton pricing provider, mets YAHOO style: xxx.PA
-# - ISIN: laisse vide si tu ne l’as pas (ça ne casse rien)
-# ---------------------------------------------------------------------
-UNIVERSE: Dict[str, UniverseItem] = {}
-
-def _add(
-    label: str,
-    symbol: str,
-    isin: str = "",
-    kind: str = "stock",
-    sector: str = "—",
-    currency: str = "EUR",
-    country: str = "FR",
-    exchange: str = "XPAR",
-    key: str | None = None,
-):
-    sym = symbol.strip()
-    k = _k(key or sym)
-    UNIVERSE[k] = UniverseItem(
-        key=k,
-        label=label.strip(),
-        ticker=sym,
-        symbol=sym,
-        isin=isin.strip(),
-        kind=kind,
-        currency=currency,
-        country=country,
-        exchange=exchange,
-        sector=sector,
-    )
-
-# =========================
-# CAC 40 (et gros Euronext Paris) – symbols Yahoo ".PA"
-# =========================
-_add("Accor", "AC.PA", isin="", sector="Travel & Leisure")
-_add("Air Liquide", "AI.PA", isin="FR0000120073", sector="Chemicals")
-_add("Airbus", "AIR.PA", isin="", sector="Aerospace & Defense")
-_add("Axa", "CS.PA", isin="", sector="Insurance")
-_add("BNP Paribas", "BNP.PA", isin="", sector="Banks")
-_add("Bouygues", "EN.PA", isin="", sector="Industrials")
-_add("Capgemini", "CAP.PA", isin="", sector="IT Services")
-_add("Carrefour", "CA.PA", isin="", sector="Retail")
-_add("Crédit Agricole", "ACA.PA", isin="", sector="Banks")
-_add("Danone", "BN.PA", isin="", sector="Food & Beverage")
-_add("Dassault Systèmes", "DSY.PA", isin="", sector="Software")
-_add("Engie", "ENGI.PA", isin="", sector="Utilities")
-_add("EssilorLuxottica", "EL.PA", isin="", sector="Healthcare")
-_add("Eurofins Scientific", "ERF.PA", isin="", sector="Healthcare")
-_add("Hermès", "RMS.PA", isin="", sector="Luxury")
-_add("Kering", "KER.PA", isin="", sector="Luxury")
-_add("Legrand", "LR.PA", isin="", sector="Industrials")
-_add("L'Oréal", "OR.PA", isin="", sector="Consumer")
-_add("LVMH", "MC.PA", isin="", sector="Luxury")
-_add("Michelin", "ML.PA", isin="", sector="Automotive")
-_add("Orange", "ORA.PA", isin="", sector="Telecom")
-_add("Pernod Ricard", "RI.PA", isin="", sector="Beverages")
-_add("Publicis", "PUB.PA", isin="", sector="Media")
-_add("Renault", "RNO.PA", isin="", sector="Automotive")
-_add("Safran", "SAF.PA", isin="", sector="Aerospace & Defense")
-_add("Saint-Gobain", "SGO.PA", isin="", sector="Materials")
-_add("Sanofi", "SAN.PA", isin="FR0000120578", sector="Pharma")
-_add("Schneider Electric", "SU.PA", isin="", sector="Industrials")
-_add("Société Générale", "GLE.PA", isin="", sector="Banks")
-_add("Stellantis", "STLAP.PA", isin="", sector="Automotive")
-_add("STMicroelectronics", "STMPA.PA", isin="", sector="Semiconductors")
-_add("Teleperformance", "TEP.PA", isin="", sector="Business Services")
-_add("Thales", "HO.PA", isin="", sector="Defense")
-_add("TotalEnergies", "TTE.PA", isin="", sector="Energy")
-_add("Unibail-Rodamco-Westfield", "URW.PA", isin="", sector="Real Estate")
-_add("Veolia", "VIE.PA", isin="", sector="Utilities")
-_add("Vinci", "DG.PA", isin="", sector="Industrials")
-_add("Worldline", "WLN.PA", isin="", sector="Payments")
-
-# Quelques grosses FR / Euronext utiles
-_add("Alstom", "ALO.PA", isin="", sector="Industrials")
-_add("Edenred", "EDEN.PA", isin="", sector="Payments")
-_add("Eramet", "ERA.PA", isin="", sector="Materials")
-_add("Getlink", "GET.PA", isin="", sector="Industrials")
-_add("Rexel", "RXL.PA", isin="", sector="Industrials")
-_add("Sodexo", "SW.PA", isin="", sector="Services")
-_add("TF1", "TFI.PA", isin="", sector="Media")
-_add("Ubisoft", "UBI.PA", isin="", sector="Gaming")
-
-# =========================
-# ETFs (focus PEA + gros ETFs Europe)
-# Note: beaucoup ont un ticker Yahoo ".PA" (Euronext Paris)
-# =========================
-# MSCI World PEA (très utilisé)
-_add("Amundi MSCI World (PEA)", "CW8.PA", isin="FR0011869353", kind="etf", sector="ETF — World")
-_add("Amundi MSCI World (PEA) - (alt)", "EWLD.PA", isin="FR0011869304", kind="etf", sector="ETF — World")
-
-# S&P 500 / Nasdaq PEA
-_add("Amundi PEA S&P 500", "500.PA", isin="FR0013412285", kind="etf", sector="ETF — US")
-_add("Amundi PEA Nasdaq-100", "PANX.PA", isin="", kind="etf", sector="ETF — US Tech")
-
-# Europe / Zone Euro
-_add("Amundi Stoxx Europe 600", "MEUD.PA", isin="", kind="etf", sector="ETF — Europe")
-_add("Amundi Euro Stoxx 50", "C50.PA", isin="", kind="etf", sector="ETF — Eurozone")
-_add("Lyxor Euro Stoxx 50 (PEA)", "MSE.PA", isin="", kind="etf", sector="ETF — Eurozone")
-
-# Emerging Markets (souvent hors PEA, mais utile)
-_add("iShares Core MSCI EM IMI", "EIMI.L", isin="IE00BKM4GZ66", kind="etf", sector="ETF — EM", currency="USD", country="IE", exchange="XLON")
-_add("Vanguard FTSE EM", "VFEM.L", isin="IE00B3VVMM84", kind="etf", sector="ETF — EM", currency="USD", country="IE", exchange="XLON")
-
-# Small caps / facteurs
-_add("Amundi MSCI Europe Small Cap", "ESE.PA", isin="", kind="etf", sector="ETF — Europe Small")
-_add("Amundi MSCI World Momentum", "WDMO.PA", isin="", kind="etf", sector="ETF — Factor")
-
-# Thématiques (optionnel)
-_add("Amundi Global Clean Energy", "CLIM.PA", isin="", kind="etf", sector="ETF — Thematic")
-_add("Amundi Global Water", "CWEA.PA", isin="", kind="etf", sector="ETF — Thematic")
-
-# Obligataires (si tu veux)
-_add("Amundi Euro Govt Bond 1-3", "E13.PA", isin="", kind="etf", sector="ETF — Bonds")
-_add("Amundi Euro Corp Bond", "ECRP.PA", isin="", kind="etf", sector="ETF — Bonds")
-
-# Or (souvent ETC, pas ETF UCITS, mais demandé parfois)
-_add("Gold (ETC) - Xetra", "4GLD.DE", isin="", kind="etf", sector="ETC — Gold", currency="EUR", country="DE", exchange="XETRA")
-
-# =========================
-# US Mega caps (si tu veux suivre en watchlist)
-# (pas Euronext, mais Yahoo symbol OK)
-# =========================
-_add("Apple", "AAPL", isin="US0378331005", kind="stock", sector="US Tech", currency="USD", country="US", exchange="NASDAQ")
-_add("Microsoft", "MSFT", isin="US5949181045", kind="stock", sector="US Tech", currency="USD", country="US", exchange="NASDAQ")
-_add("NVIDIA", "NVDA", isin="US67066G1040", kind="stock", sector="US Tech", currency="USD", country="US", exchange="NASDAQ")
-_add("Amazon", "AMZN", isin="US0231351067", kind="stock", sector="US Consumer", currency="USD", country="US", exchange="NASDAQ")
-_add("Meta", "META", isin="US30303M1027", kind="stock", sector="US Tech", currency="USD", country="US", exchange="NASDAQ")
-_add("Alphabet (A)", "GOOGL", isin="US02079K3059", kind="stock", sector="US Tech", currency="USD", country="US", exchange="NASDAQ")
-_add("Tesla", "TSLA", isin="US88160R1014", kind="stock", sector="US Auto", currency="USD", country="US", exchange="NASDAQ")
\ No newline at end of file
+@lru_cache(maxsize=4)
+def _load(path: str) -> InstrumentMaster:
+    return InstrumentMaster(_read_tsv(Path(path)))
+
+
+def instrument_master() -> InstrumentMaster:
+    return _load(str(getattr(settings, "DIVIDENDS_UNIVERSE_FILE", DEFAULT_FILE)))
+
+
+def get_instrument(key: str) -> Optional[UniverseItem]:
+    return instrument_master().get(key)
+
+
+def search_instruments(query: str, limit: int = 20) -> List[UniverseItem]:
+    return instrument_master().search(query, limit)
+
+
+def universe_choices() -> List[UniverseItem]:
+    """
+    Retourne une liste triée pour affichage (actions puis ETFs) ; tri fait au chargement.
+    """
+    return instrument_master().items
@@ -0,0 +1,92 @@
+# dividends/signals.py
+"""
+Tenue à jour des positions matérialisées (AssetPosition + timeline) et des caches de prévision.
+
+⚠️ Ces receivers ne voient que les écritures unitaires (save / delete). Ne déclenchent PAS de signaux :
+- loaddata (raw=True, ignoré explicitement ci-dessous)
+- QuerySet.update() / bulk_update()
+- bulk_create()
+- SQL direct, données antérieures aux migrations des positions
+
+Après ce genre d'import : `manage.py rebuild_positions [--user-id N]` (positions, timelines et caches).
+Les lecteurs détectent un écart de tx_count / tx_max_id (insertion ou suppression), pas une modification en place.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from dividends.models import Asset, DividendEvent, Transaction
+from dividends.services.dashboard_cache import invalidate_dashboards
+from dividends.services.forecast_year import invalidate_forecasts
+from dividends.services.positions import apply_new_transaction, rebuild_position, rebuild_positions
+
+
+def _invalidate_on_commit(asset_ids, user_ids=None):
+    # après commit : un lecteur concurrent ne peut pas remettre en cache l'état d'avant
+    ids = [aid for aid in asset_ids if aid]
+
+    def _run():
+        invalidate_forecasts(ids)
+        users = user_ids
+        if users is None:
+            users = Asset.objects.filter(id__in=ids).values_list("user_id", flat=True)
+        invalidate_dashboards(users)
+
+    transaction.on_commit(_run)
+
+
+@receiver(pre_save, sender=Transaction)
+def _tx_remember_asset(sender, instance, **kwargs):
+    # une édition peut déplacer la transaction vers un autre asset : on garde l'ancien
+    instance._previous_asset_id = None
+    if instance.pk:
+        instance._previous_asset_id = (
+            Transaction.objects.filter(pk=instance.pk).values_list("asset_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Transaction)
+def _tx_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_asset_id", None)
+
+    # position d'abord (ligne verrouillée), invalidation ensuite : un lecteur qui voit la
+    # nouvelle version de cache voit aussi la position à jour
+    if created:
+        apply_new_transaction(instance)
+    else:
+        rebuild_position(instance.asset_id)
+        if previous and previous != instance.asset_id:
+            rebuild_position(previous)
+
+    _invalidate_on_commit([instance.asset_id, previous])
+
+
+@receiver(post_delete, sender=Transaction)
+def _tx_deleted(sender, instance, **kwargs):
+    # après commit : si la suppression vient d'un asset/user supprimé en cascade, il n'y a rien à rebâtir.
+    # Les callbacks on_commit tournent dans l'ordre d'enregistrement : reconstruction, puis invalidation.
+    asset_id = instance.asset_id
+    transaction.on_commit(
+        lambda: rebuild_positions(Asset.objects.filter(id=asset_id).values_list("id", flat=True))
+    )
+    _invalidate_on_commit([asset_id])
+
+
+# =========================
+# Cache des projections de dividendes
+# =========================
+@receiver(post_save, sender=DividendEvent)
+@receiver(post_delete, sender=DividendEvent)
+def _dividend_event_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _invalidate_on_commit([instance.asset_id])
+
+
+@receiver(post_save, sender=Asset)
+@receiver(post_delete, sender=Asset)
+def _asset_changed(sender, instance, raw=False, **kwargs):
+    # ticker / devise sont recopiés dans les ForecastEvent en cache ; is_active filtre les fragments
+    if not raw:
+        _invalidate_on_commit([instance.pk], user_ids=[instance.user_id])
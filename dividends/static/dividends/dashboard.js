@@ -123,6 +123,94 @@
     }
   });
 
+  // =========================
+  // Navigation année / croissance : seul le fragment "forecast" est rechargé
+  // =========================
+  const forecastBox = document.querySelector('[data-fragment="forecast"][data-fragment-url]');
+
+  async function loadForecast(y, g, push) {
+    if (!forecastBox) return false;
+    const qs = `?y=${encodeURIComponent(y)}&g=${encodeURIComponent(g ?? "0")}`;
+
+    forecastBox.classList.add("is-loading");
+    try {
+      const r = await fetch(forecastBox.dataset.fragmentUrl + qs, { credentials: "same-origin" });
+      if (!r.ok) throw new Error("HTTP " + r.status);
+      forecastBox.innerHTML = await r.text();
+    } catch (e) {
+      console.error("[dividends] forecast fragment error:", e);
+      return false;
+    } finally {
+      forecastBox.classList.remove("is-loading");
+    }
+
+    // les formulaires redirigent vers l'année affichée
+    document.querySelectorAll("form[action*='?y=']").forEach((f) => {
+      f.action = f.action.split("?")[0] + qs;
+    });
+    if (push) history.pushState({ y, g }, "", qs);
+    return true;
+  }
+
+  document.addEventListener("click", async (ev) => {
+    const a = ev.target.closest("a[data-nav-y]");
+    if (!a || !forecastBox) return;
+    ev.preventDefault();
+    const ok = await loadForecast(a.dataset.navY, a.dataset.navG, true);
+    if (!ok) window.location.href = a.href; // fallback : page complète
+  });
+
+  window.addEventListener("popstate", (ev) => {
+    const st = ev.state;
+    if (st && st.y) loadForecast(st.y, st.g, false);
+    else window.location.reload();
+  });
+
+  // =========================
+  // Champ instrument : recherche par préfixe (api_instruments), debounce 200ms
+  // =========================
+  document.querySelectorAll("[data-typeahead]").forEach((box) => {
+    const input = box.querySelector("input[type=search]");
+    const hidden = box.querySelector("input[name=universe_key]");
+    const options = box.querySelector("datalist");
+    if (!input || !hidden || !options) return;
+
+    let timer = null;
+    let seq = 0;
+    const keyByText = new Map();
+
+    async function search(q) {
+      const mine = ++seq;
+      const url = `${box.dataset.typeahead}?q=${encodeURIComponent(q)}&limit=20`;
+      try {
+        const r = await fetch(url, { credentials: "same-origin" });
+        if (!r.ok) throw new Error("HTTP " + r.status);
+        const data = await r.json();
+        if (mine !== seq) return; // réponse d'une frappe plus ancienne
+        options.innerHTML = "";
+        for (const it of data.results || []) {
+          const text = `${it.label} — ${it.ticker}`;
+          keyByText.set(text, it.key);
+          const opt = document.createElement("option");
+          opt.value = text;
+          opt.label = [it.isin, it.kind, it.currency].filter(Boolean).join(" · ");
+          options.appendChild(opt);
+        }
+      } catch (e) {
+        console.error("[dividends] instrument search error:", e);
+      }
+    }
+
+    input.addEventListener("input", () => {
+      hidden.value = keyByText.get(input.value) || "";
+      input.setCustomValidity(hidden.value ? "" : "Choisir un instrument dans la liste");
+      if (hidden.value) return;
+      clearTimeout(timer);
+      const q = input.value.trim();
+      if (q.length >= 1) timer = setTimeout(() => search(q), 200);
+    });
+  });
+
   document.addEventListener("keydown", (e) => {
     if (e.key === "Escape" && modal.classList.contains("is-open")) {
       closeModal();
@@ -1,3 +1,1443 @@
-from django.test import TestCase
+import importlib
+import json
+import re
+import shutil
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import ROUND_HALF_EVEN, Decimal
+from io import StringIO
+from importlib import import_module
+from pathlib import Path
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+
+from dividends import urls as dividends_urls, views
+from dividends.management.commands import refresh_prices_daemon
+from dividends.management.commands.refresh_prices_daemon import Command as Refresher
+from dividends.models import (
+    Asset,
+    AssetDividendCursor,
+    AssetPosition,
+    DailyPrice,
+    DividendEvent,
+    Quote,
+    Transaction,
+)
+from dividends.services import dashboard_cache, fetch_pipeline, forecast_arrays
+from dividends.services.aggregate import aggregate_events, year_aggregate
+from dividends.services.analytics import portfolio_allocation
+from dividends.services.fetch_pipeline import breaker_for, fetch_concurrent
+from dividends.services.forecast_arrays import project_year_arrays
+from dividends.services.calendar_view import month_grid
+from dividends.services.forecast_year import ForecastEvent, build_year_events, forecast_versions
+from dividends.services.holdings import Timeline, build_tx_index, load_timelines, shares_asof
+from dividends.services.market_data import PriceQuote, ReplayProvider
+from dividends.services.money import div_round, from_cents, from_micro, from_scaled, to_cents, to_micro
+from dividends.services.pnl import build_portfolio, compute_position, realized_pnl_by_month
+from dividends.services.positions import OversellError, rebuild_positions, record_sell
+from dividends.services.quotes import load_resolved_price, resolved_price, store_quotes, with_quotes
+from dividends.services.universe import InstrumentMaster, UniverseItem, search_instruments
+
+
+D = Decimal
+
+
+def _q2(x):
+    return Decimal(x).quantize(Decimal("0.01"), rounding=ROUND_HALF_EVEN)
+
+
+def _dividend_portfolio(user, y):
+    """Portefeuille de prévision : ventes, position soldée, base ancienne, asset sans dividende, paiement en janvier."""
+    a = Asset.objects.create(user=user, ticker="SAN.PA", price_symbol="SAN.PA")
+    b = Asset.objects.create(user=user, ticker="TTE.PA", price_symbol="TTE.PA")
+    c = Asset.objects.create(user=user, ticker="AI.PA", price_symbol="AI.PA")
+    d = Asset.objects.create(user=user, ticker="OR.PA", price_symbol="OR.PA")
+
+    _tx(a, "BUY", date(y - 3, 1, 2), "10")
+    _tx(a, "SELL", date(y - 1, 6, 1), "4.5")
+    _tx(a, "BUY", date(y, 7, 10), "0.333333")
+    _tx(b, "BUY", date(y - 2, 1, 2), "7")
+    _tx(c, "BUY", date(y - 2, 1, 2), "3")
+    _tx(d, "BUY", date(y - 2, 1, 5), "2")
+    _tx(d, "SELL", date(y - 2, 12, 1), "2")  # plus rien à l'ex-date
+
+    for asset, ex, pay, aps in (
+        (a, date(y - 2, 3, 15), None, "1.11"),
+        (a, date(y - 1, 5, 10), date(y - 1, 5, 20), "2.345678"),
+        (a, date(y - 1, 11, 15), None, "0.333333"),
+        (a, date(y - 1, 12, 20), date(y, 1, 10), "0.5"),  # ex-date en décembre, paiement en janvier
+        (b, date(y - 2, 6, 1), date(y - 2, 6, 20), "0.79"),  # base plus ancienne : years_diff = 2
+        (d, date(y - 1, 4, 20), None, "1.5"),
+    ):
+        DividendEvent.objects.create(asset=asset, ex_date=ex, pay_date=pay, amount_per_share=D(aps))
+
+
+def _user(name="alice"):
+    return get_user_model().objects.create_user(username=name, password="x")
+
+
+def _tx(asset, typ, on, qty, price="10"):
+    return Transaction.objects.create(asset=asset, type=typ, date=on, quantity=D(qty), price=D(price))
+
+
+class _FakeClock:
+    """Horloge simulée (monotonic / sleep) à substituer au module `time` d'un service."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+# =========================
+# Virgule fixe (services/money.py)
+# =========================
+class FixedPointMoneyTests(TestCase):
+    def test_div_round_matches_decimal_half_even(self):
+        for num in range(-2000, 2001, 7):
+            for den in (1, 2, 3, 8, 10, 40, -4, -100):
+                expected = (Decimal(num) / Decimal(den)).quantize(Decimal("1"), rounding=ROUND_HALF_EVEN)
+                self.assertEqual(div_round(num, den), int(expected), (num, den))
+
+    def test_ties_go_to_even(self):
+        self.assertEqual([div_round(n, 2) for n in (1, 3, 5, -1, -3)], [0, 2, 2, 0, -2])
+        self.assertEqual(div_round(125, 100), 1)
+        self.assertEqual(div_round(150, 100), 2)
+
+    def test_scaled_round_trip(self):
+        for s in ("0", "0.000001", "123456.789012", "-42.5"):
+            self.assertEqual(from_micro(to_micro(s)), D(s))
+        self.assertEqual(to_cents(None), 0)
+        self.assertEqual(from_cents(-5), D("-0.05"))
+        self.assertEqual(from_scaled(div_round(-125, 10), 1), D("-1.2"))
+
+    def test_perf_snapshot_rounds_once(self):
+        from dividends.views import _build_perf_snapshot
+
+        user = _user()
+        asset = Asset.objects.create(user=user, ticker="AI.PA", price_symbol="AI.PA", last_price=D("10.005"))
+        _tx(asset, "BUY", date(2024, 1, 2), "3", price="10.125")
+        _tx(asset, "BUY", date(2024, 2, 1), "0.333333", price="9.995")
+        pos = AssetPosition.objects.get(asset=asset)
+
+        snap = _build_perf_snapshot(user)
+        row = snap["rows"][0]
+        market = pos.quantity * D("10.005")
+        self.assertEqual(row.cost_total, _q2(pos.cost_basis))
+        self.assertEqual(row.market_total, _q2(market))
+        self.assertEqual(row.pnl, _q2(market - pos.cost_basis))
+        self.assertEqual(row.pru, _q2(pos.cost_basis / pos.quantity))
+        self.assertEqual(row.price, D("10.00"))  # 10.005 -> pair
+        self.assertEqual(snap["total_pnl"], row.pnl)
+
+
+# =========================
+# Ventes : contrôle de survente sous verrou (record_sell)
+# =========================
+class RecordSellTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = _user()
+        cls.asset = Asset.objects.create(user=cls.user, ticker="TTE.PA", price_symbol="TTE.PA")
+        _tx(cls.asset, "BUY", date(2024, 1, 2), "10")
+        _tx(cls.asset, "SELL", date(2024, 6, 3), "8")
+
+    def test_backdated_oversell_is_refused(self):
+        # 10 détenus au 1er mars, mais la vente du 3 juin n'en laisserait que -3
+        with self.assertRaises(OversellError) as ctx:
+            record_sell(self.asset.id, date(2024, 3, 1), D("5"), D("50"))
+        self.assertEqual(ctx.exception.available, D("2"))
+        self.assertEqual(Transaction.objects.filter(asset=self.asset).count(), 2)
+
+    def test_sell_within_available(self):
+        record_sell(self.asset.id, date(2024, 3, 1), D("2"), D("50"))
+        self.assertEqual(AssetPosition.objects.get(asset=self.asset).quantity, D("0"))
+        with self.assertRaises(OversellError):
+            record_sell(self.asset.id, date(2024, 7, 1), D("0.000001"), D("50"))
+
+    def test_sell_before_first_buy_is_refused(self):
+        with self.assertRaises(OversellError):
+            record_sell(self.asset.id, date(2023, 12, 29), D("1"), D("50"))
+
+    def test_stale_position_is_rebuilt_before_check(self):
+        Transaction.objects.bulk_create(
+            [Transaction(asset=self.asset, type="BUY", date=date(2024, 5, 2), quantity=D("4"), price=D("1"))]
+        )
+        record_sell(self.asset.id, date(2024, 7, 1), D("6"), D("50"))
+        self.assertEqual(AssetPosition.objects.get(asset=self.asset).quantity, D("0"))
+
+
+# =========================
+# Holdings : backends Python / fenêtre SQL
+# =========================
+class HoldingsBackendParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = _user()
+        cls.a = Asset.objects.create(user=cls.user, ticker="SAN.PA", price_symbol="SAN.PA")
+        cls.b = Asset.objects.create(user=cls.user, ticker="TTE.PA", price_symbol="TTE.PA")
+
+        d0 = date(2024, 1, 2)
+        _tx(cls.a, "BUY", d0, "10.5")
+        _tx(cls.a, "BUY", d0, "0.123456")  # même jour
+        _tx(cls.a, "SELL", d0 + timedelta(days=30), "4.2")
+        _tx(cls.a, "BUY", d0 + timedelta(days=90), "1.1")
+
+        # survente : SELL 15 sur 10 détenus -> plancher à 0, puis BUY 4 -> 4 (et non -1)
+        _tx(cls.b, "BUY", d0, "10")
+        _tx(cls.b, "SELL", d0 + timedelta(days=10), "15")
+        _tx(cls.b, "BUY", d0 + timedelta(days=20), "4")
+        _tx(cls.b, "SELL", d0 + timedelta(days=25), "1.5")
+
+    def _index(self, backend):
+        with override_settings(DIVIDENDS_HOLDINGS_BACKEND=backend):
+            return build_tx_index(self.user)
+
+    def test_window_matches_python(self):
+        self.assertEqual(self._index("window"), self._index("python"))
+
+    def test_oversell_floor_per_step(self):
+        for backend in ("python", "window"):
+            points = self._index(backend)[self.b.id]
+            self.assertEqual([p.qty for p in points], [D("10"), D("0"), D("4"), D("2.5")], backend)
+
+    def test_persisted_timeline_matches_index(self):
+        index = self._index("python")
+        timelines = load_timelines([self.a.id, self.b.id])
+        day = date(2023, 12, 1)
+        while day < date(2024, 6, 1):
+            for aid in (self.a.id, self.b.id):
+                self.assertEqual(timelines[aid].shares_asof(day), shares_asof(index[aid], day), (aid, day))
+            day += timedelta(days=1)
+
+    def test_from_points_keeps_last_point_of_day(self):
+        tl = Timeline.from_points(self._index("window")[self.a.id])
+        self.assertEqual(len(tl.days), 3)
+        self.assertEqual(tl.shares_asof(date(2024, 1, 2)), D("10.623456"))
+
+    def test_rebuild_uses_same_timeline(self):
+        pos = AssetPosition.objects.get(asset=self.b)
+        before = Timeline.from_blobs(pos.timeline_days, pos.timeline_q6)
+        with override_settings(DIVIDENDS_HOLDINGS_BACKEND="window"):
+            rebuild_positions([self.b.id])
+        pos.refresh_from_db()
+        self.assertEqual(Timeline.from_blobs(pos.timeline_days, pos.timeline_q6), before)
+
+
+# =========================
+# Moteur portefeuille (services/pnl.py)
+# =========================
+class BuildPortfolioTests(TestCase):
+    def setUp(self):
+        self.user = _user()
+        specs = (("SAN.PA", "Santé", "91.5"), ("TTE.PA", "Énergie", "60.25"), ("AI.PA", "Chimie", "150"))
+        self.assets = [
+            Asset.objects.create(user=self.user, ticker=t, price_symbol=t, sector=sec, last_price=D(px))
+            for t, sec, px in specs
+        ]
+        san, tte, ai = self.assets
+        for asset, typ, on, qty, price, fees in (
+            (san, "BUY", date(2023, 1, 2), "10", "80", "2.5"),
+            (san, "SELL", date(2023, 6, 1), "4", "90", "1"),
+            (san, "BUY", date(2024, 2, 1), "1.5", "85", "0"),
+            (tte, "BUY", date(2023, 3, 1), "7", "55", "0"),
+            (tte, "SELL", date(2023, 6, 20), "2", "50", "0"),
+            (ai, "BUY", date(2023, 1, 2), "3", "140", "0"),
+            (ai, "SELL", date(2024, 1, 2), "3", "150", "0"),  # soldée : hors positions et hors P&L mensuel
+        ):
+            Transaction.objects.create(
+                asset=asset, type=typ, date=on, quantity=D(qty), price=D(price), fees=D(fees)
+            )
+        Asset.objects.create(user=_user("bob"), ticker="SAN.PA", price_symbol="SAN.PA", last_price=D("1"))
+
+    def test_single_pass_matches_per_asset_replay(self):
+        with self.assertNumQueries(2):
+            book = build_portfolio(self.user)
+
+        san, tte, ai = self.assets
+        self.assertEqual(list(book.assets), [ai.id, san.id, tte.id])  # triés par ticker
+        self.assertEqual(set(book.positions), {san.id, tte.id})
+        for a in (san, tte):
+            self.assertEqual(book.positions[a.id], compute_position(a))
+
+        expected = defaultdict(Decimal)
+        for a in (san, tte):
+            for ym, pnl in realized_pnl_by_month(a).items():
+                expected[ym] += pnl
+        self.assertEqual(book.realized_by_month, dict(expected))
+        # SAN : (90 - 80.25) * 4 - 1 = 38 ; TTE : (50 - 55) * 2 = -10
+        self.assertEqual(book.realized_by_month, {"2023-06": D("28")})
+        self.assertEqual(book.sector_totals, {"Santé": D("7.5") * D("91.5"), "Énergie": 5 * D("60.25")})
+
+    def test_query_count_does_not_grow_with_assets(self):
+        for i in range(5):
+            a = Asset.objects.create(user=self.user, ticker=f"X{i}", price_symbol=f"X{i}", last_price=D("1"))
+            _tx(a, "BUY", date(2024, 1, 2), "1")
+
+        request = RequestFactory().get("/portfolio/")
+        request.user = self.user
+        with self.assertNumQueries(2):
+            resp = views.portfolio_view(request)
+        self.assertEqual(resp.status_code, 200)
+        for ticker in ("SAN.PA", "TTE.PA", "X4"):
+            self.assertContains(resp, ticker)
+        self.assertNotContains(resp, "AI.PA")
+
+
+# =========================
+# Timeline persistée (AssetPosition)
+# =========================
+class PersistedTimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = _user()
+        cls.asset = Asset.objects.create(user=cls.user, ticker="AI.PA", price_symbol="AI.PA")
+        _tx(cls.asset, "BUY", date(2024, 3, 1), "5")
+        _tx(cls.asset, "BUY", date(2024, 6, 1), "2.5")
+
+    def test_blobs_round_trip(self):
+        tl = Timeline()
+        tl.append(date(1999, 1, 4), "BUY", "123456789.123456")
+        tl.append(date(1999, 1, 4), "SELL", "0.000001")
+        tl.append(date(2030, 12, 31), "SELL", "1")
+        days, q6 = tl.blobs()
+        self.assertIsInstance(days, bytes)
+        self.assertEqual(len(days), 4 * 2)
+        self.assertEqual(len(q6), 8 * 2)
+        back = Timeline.from_blobs(memoryview(days), memoryview(q6))
+        self.assertEqual(back, tl)
+        self.assertEqual(back.shares_asof(date(2030, 12, 31)), D("123456788.123455"))
+
+    def test_signals_keep_timeline_current(self):
+        _tx(self.asset, "SELL", date(2024, 7, 1), "1")
+        tl = load_timelines([self.asset.id])[self.asset.id]
+        self.assertEqual(tl.shares_asof(date(2024, 7, 1)), D("6.5"))
+
+    def test_current_timelines_cost_one_check_query(self):
+        pos = AssetPosition.objects.get(asset=self.asset)
+        self.assertEqual(
+            (pos.tx_count, pos.tx_max_id),
+            (2, Transaction.objects.filter(asset=self.asset).latest("id").id),
+        )
+        with self.assertNumQueries(2):  # blobs + agrégat de contrôle, pas de replay
+            load_timelines([self.asset.id])
+
+    def test_bulk_insert_without_signals_is_replayed(self):
+        Transaction.objects.bulk_create(
+            [Transaction(asset=self.asset, type="SELL", date=date(2024, 4, 1), quantity=D("3"), price=D("1"))]
+        )
+        pos = AssetPosition.objects.get(asset=self.asset)
+        self.assertEqual(pos.tx_count, 2)  # blob périmé
+
+        tl = load_timelines([self.asset.id])[self.asset.id]
+        self.assertEqual(tl.shares_asof(date(2024, 4, 1)), D("2"))
+        self.assertEqual(tl.shares_asof(date(2024, 6, 1)), D("4.5"))
+
+    def test_perf_snapshot_rebuilds_stale_position(self):
+        from dividends.views import _build_perf_snapshot
+
+        Transaction.objects.bulk_create(
+            [Transaction(asset=self.asset, type="SELL", date=date(2024, 7, 1), quantity=D("7.5"), price=D("1"))]
+        )
+        self.assertEqual(_build_perf_snapshot(self.user)["rows"], [])
+        self.assertEqual(AssetPosition.objects.get(asset=self.asset).quantity, D("0"))
+
+    def test_refresher_scan_sees_bulk_inserted_holdings(self):
+        from dividends.management.commands.refresh_prices_daemon import Command as Refresher
+
+        other = Asset.objects.create(user=self.user, ticker="SAN.PA", price_symbol="SAN.PA")
+        Transaction.objects.bulk_create(
+            [Transaction(asset=other, type="BUY", date=date(2024, 1, 2), quantity=D("1"), price=D("1"))]
+        )
+        refresher = Refresher()
+        refresher._calendars()
+        holders, _markets, _fetched = refresher._scan()
+        self.assertEqual(holders, {"AI.PA": 1, "SAN.PA": 1})
+
+    def test_rebuild_command_refreshes_stale_position(self):
+        Transaction.objects.bulk_create(
+            [Transaction(asset=self.asset, type="BUY", date=date(2025, 1, 1), quantity=D("1"), price=D("1"))]
+        )
+        call_command("rebuild_positions", stdout=StringIO())
+        pos = AssetPosition.objects.get(asset=self.asset)
+        self.assertEqual((pos.tx_count, pos.quantity), (3, D("8.5")))
+        tl = Timeline.from_blobs(pos.timeline_days, pos.timeline_q6)
+        self.assertEqual(tl.shares_asof(date(2025, 1, 1)), D("8.5"))
+
+
+# =========================
+# Daemon de refresh des cours : calendriers et backoff
+# =========================
+class RefreshPricesDaemonTests(TestCase):
+    def setUp(self):
+        self.refresher = Refresher()
+        self.refresher._calendars()
+
+    def _utc(self, *args):
+        return datetime(*args, tzinfo=dt_timezone.utc)
+
+    def test_market_key_exchange_then_currency(self):
+        key = self.refresher._market_key
+        self.assertEqual(key("xpar", "USD"), "XPAR")
+        self.assertEqual(key("", "USD"), "USD")
+        self.assertEqual(key("XTKS", "JPY"), "")  # inconnu -> calendrier par défaut
+
+    def test_is_open_per_exchange(self):
+        is_open = self.refresher._is_open
+        wed_16h_paris = self._utc(2026, 1, 14, 15, 0)
+        wed_21h_paris = self._utc(2026, 1, 14, 20, 0)  # 15:00 à New York
+        self.assertTrue(is_open("XPAR", wed_16h_paris))
+        self.assertTrue(is_open("NYSE", wed_16h_paris))
+        self.assertFalse(is_open("XPAR", wed_21h_paris))
+        self.assertTrue(is_open("NYSE", wed_21h_paris))
+        self.assertFalse(is_open("XLON", self._utc(2026, 1, 14, 16, 35)))  # clôture exclue
+        self.assertFalse(is_open("XPAR", self._utc(2026, 1, 17, 12, 0)))  # samedi
+        # heure d'été : 09:00 Paris = 07:00 UTC
+        self.assertTrue(is_open("XPAR", self._utc(2026, 7, 15, 7, 0)))
+        self.assertFalse(is_open("XPAR", self._utc(2026, 1, 15, 7, 0)))
+
+    def test_last_close_skips_weekend(self):
+        last = self.refresher._last_close
+        paris, ny = ZoneInfo("Europe/Paris"), ZoneInfo("America/New_York")
+        monday_8h_paris = self._utc(2026, 1, 19, 7, 0)
+        self.assertEqual(last("XPAR", monday_8h_paris), datetime(2026, 1, 16, 17, 35, tzinfo=paris))
+        self.assertEqual(last("NYSE", monday_8h_paris), datetime(2026, 1, 16, 16, 0, tzinfo=ny))
+        wed_21h_paris = self._utc(2026, 1, 14, 20, 0)
+        self.assertEqual(last("XPAR", wed_21h_paris), datetime(2026, 1, 14, 17, 35, tzinfo=paris))
+        self.assertEqual(last("NYSE", wed_21h_paris), datetime(2026, 1, 13, 16, 0, tzinfo=ny))
+
+    @override_settings(DIVIDENDS_MARKET_CALENDARS={"XTKS": ("Asia/Tokyo", "09:00", "15:30")})
+    def test_calendar_overrides_from_settings(self):
+        self.refresher._calendars()
+        self.assertEqual(self.refresher._market_key("XTKS", "JPY"), "XTKS")
+        self.assertTrue(self.refresher._is_open("XTKS", self._utc(2026, 1, 14, 1, 0)))  # 10:00 Tokyo
+
+
+class RefreshPricesDaemonLoopTests(TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        (self.root / "quotes").mkdir()
+        for sym, price in (("SAN.PA", "91.5"), ("TTE.PA", "60.25")):
+            payload = {"price": price, "asof": timezone.now().isoformat(), "source": "test"}
+            (self.root / "quotes" / f"{sym}.json").write_text(json.dumps(payload), encoding="utf-8")
+
+        self.u1, self.u2 = _user("u1"), _user("u2")
+        for u, sym in ((self.u1, "SAN.PA"), (self.u1, "TTE.PA"), (self.u2, "TTE.PA"), (self.u1, "NOPE.PA")):
+            a = Asset.objects.create(user=u, ticker=sym, price_symbol=sym, exchange="XPAR")
+            _tx(a, "BUY", date(2024, 1, 2), "1")
+        # soldé : pas de détenteur, jamais rafraîchi
+        a = Asset.objects.create(user=self.u2, ticker="AI.PA", price_symbol="AI.PA")
+        _tx(a, "BUY", date(2024, 1, 2), "1")
+        _tx(a, "SELL", date(2024, 2, 2), "1")
+
+        self.clock = _FakeClock()
+        patcher = mock.patch.object(refresh_prices_daemon, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command("refresh_prices_daemon", "--replay", str(self.root), *args, stdout=out)
+        return out.getvalue()
+
+    def test_batch_prioritises_symbols_held_by_more_users(self):
+        out = self._run("--once", "--batch", "1")
+        self.assertIn("batch 1/3 due (top: TTE.PA x2)", out)
+        self.assertEqual(set(Quote.objects.values_list("symbol", flat=True)), {"TTE.PA"})
+        self.assertIn("symbols=3", out)
+
+    def test_failed_symbol_backs_off_exponentially_up_to_max(self):
+        out = self._run(
+            "--max-cycles", "7", "--interval", "40", "--closed-interval", "40",
+            "--retry-base", "30", "--retry-max", "100",
+        )
+        # essais à t=0, 40, 120, 240 : attentes 30, 60, puis plafonnées à 100
+        self.assertEqual(
+            re.findall(r"FAIL NOPE\.PA x(\d) \(retry in (\d+)s\)", out),
+            [("1", "30"), ("2", "60"), ("3", "100"), ("4", "100")],
+        )
+        self.assertIn("cycles=7 refreshed=2 FAIL=4 symbols=3", out)
+        self.assertEqual(self.clock.now - 100.0, 6 * 40)
+        self.assertEqual(Quote.objects.count(), 2)
+
+
+# =========================
+# Signaux : position reconstruite avant l'invalidation des caches
+# =========================
+class TransactionSignalOrderTests(TestCase):
+    def setUp(self):
+        self.asset = Asset.objects.create(user=_user(), ticker="AI.PA", price_symbol="AI.PA")
+        _tx(self.asset, "BUY", date(2024, 1, 2), "5")
+        self.tx = _tx(self.asset, "BUY", date(2024, 2, 1), "3")
+        self.seen = []
+
+    def _spy(self, asset_ids):
+        self.seen.append(AssetPosition.objects.get(asset=self.asset).quantity)
+
+    def test_delete_rebuilds_before_invalidating(self):
+        with mock.patch("dividends.signals.invalidate_forecasts", self._spy):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.tx.delete()
+        self.assertEqual(self.seen, [D("5")])
+
+    def test_edit_rebuilds_before_invalidating(self):
+        with mock.patch("dividends.signals.invalidate_forecasts", self._spy):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.tx.quantity = D("1")
+                self.tx.date = date(2023, 12, 1)
+                self.tx.save()
+        self.assertEqual(self.seen, [D("6")])
+
+
+# =========================
+# sync_dividends_declared : curseurs par symbole / par asset
+# =========================
+class DividendSyncCursorTests(TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        y = date.today().year
+        self.d1, self.d2, self.d3 = date(y - 2, 3, 1), date(y - 1, 3, 1), date(y, 1, 2)
+        self._publish("ABC.PA", [(self.d1, "0.5"), (self.d2, "0.6")])
+
+        self.u1, self.u2 = _user("u1"), _user("u2")
+        self.a1 = Asset.objects.create(user=self.u1, ticker="ABC", price_symbol="ABC.PA")
+        self.a2 = Asset.objects.create(user=self.u2, ticker="ABC", price_symbol="ABC.PA")
+
+    def _publish(self, symbol, rows):
+        p = self.root / "dividends" / f"{symbol}.json"
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(json.dumps([[d.isoformat(), v] for d, v in rows]), encoding="utf-8")
+
+    def _sync(self, *args):
+        out = StringIO()
+        call_command("sync_dividends_declared", "--replay", str(self.root), *args, stdout=out)
+        return out.getvalue()
+
+    def _ex_dates(self, asset):
+        return sorted(DividendEvent.objects.filter(asset=asset).values_list("ex_date", flat=True))
+
+    def test_run_limited_to_one_user_does_not_hide_history_from_others(self):
+        self._sync("--user-id", str(self.u1.id))
+        self.assertEqual(self._ex_dates(self.a1), [self.d1, self.d2])
+        self.assertEqual(self._ex_dates(self.a2), [])
+
+        self._publish("ABC.PA", [(self.d1, "0.5"), (self.d2, "0.6"), (self.d3, "0.7")])
+        self._sync("--user-id", str(self.u1.id), "--min-interval-hours", "0")
+
+        out = self._sync()  # le curseur du symbole est "frais", mais a2 n'a jamais été synchronisé
+        self.assertNotIn("FRESH=2", out)
+        self.assertEqual(self._ex_dates(self.a2), [self.d1, self.d2, self.d3])
+        self.assertEqual(AssetDividendCursor.objects.get(asset=self.a2).last_ex_date, self.d3)
+
+    def test_reactivated_asset_catches_up(self):
+        self._sync()
+        Asset.objects.filter(pk=self.a2.pk).update(is_active=False)
+        self._publish("ABC.PA", [(self.d1, "0.5"), (self.d2, "0.6"), (self.d3, "0.7")])
+        self._sync("--min-interval-hours", "0")
+        self.assertEqual(self._ex_dates(self.a2), [self.d1, self.d2])
+
+        Asset.objects.filter(pk=self.a2.pk).update(is_active=True)
+        self._sync()
+        self.assertEqual(self._ex_dates(self.a2), [self.d1, self.d2, self.d3])
+
+    def test_price_symbol_change_backfills_new_symbol(self):
+        self._sync()
+        self._publish("ABC.AS", [(self.d1, "0.4")])
+        Asset.objects.filter(pk=self.a1.pk).update(price_symbol="ABC.AS")
+        self._sync()
+        self.assertIn(self.d1, self._ex_dates(self.a1))
+        self.assertEqual(
+            sorted(DividendEvent.objects.filter(asset=self.a1).values_list("amount_per_share", flat=True)),
+            [D("0.4"), D("0.5"), D("0.6")],
+        )
+        self.assertEqual(AssetDividendCursor.objects.get(asset=self.a1).symbol, "ABC.AS")
+
+    def test_fresh_then_unchanged(self):
+        self._sync()
+        self.assertIn("FRESH=2", self._sync())
+        out = self._sync("--min-interval-hours", "0")
+        self.assertIn("UNCHANGED=2", out)
+        self.assertIn("created=0", out)
+
+    def test_bulk_insert_counts_duplicates_and_downloads_each_symbol_once(self):
+        rows = [(date(self.d1.year, m, 1), "0.1") for m in range(1, 13)] + [(self.d2, "0.6"), (self.d2, "0.6")]
+        self._publish("ABC.PA", rows)
+        DividendEvent.objects.create(asset=self.a1, ex_date=self.d2, amount_per_share=D("0.6"), status="received")
+
+        requested = []
+        real = ReplayProvider.dividends
+
+        def spy(provider, symbols, since=None):
+            symbols = list(symbols)
+            requested.extend(symbols)
+            return real(provider, symbols, since)
+
+        with mock.patch.object(ReplayProvider, "dividends", spy):
+            out = self._sync("--batch-size", "5")
+
+        self.assertEqual(requested, ["ABC.PA"])  # 2 assets, 1 symbole
+        # 13 clés distinctes par asset (doublon du provider fusionné) ; celle déjà en base de a1 est comptée dup
+        self.assertIn("OK  ABC.PA +25 dup=1", out)
+        self.assertIn("created=25 dup=1", out)
+        self.assertEqual(len(self._ex_dates(self.a1)), 13)
+        self.assertEqual(len(self._ex_dates(self.a2)), 13)
+        self.assertEqual(DividendEvent.objects.get(asset=self.a1, ex_date=self.d2).status, "received")
+
+        # run concurrent : une clé insérée entre la pré-lecture et l'écriture ne fait pas échouer le bulk
+        self._publish("ABC.PA", rows + [(self.d3, "0.7")])
+        real_create = DividendEvent.objects.bulk_create
+
+        def racing_create(objs, **kw):
+            if objs and isinstance(objs[0], DividendEvent):
+                DividendEvent.objects.create(asset=self.a2, ex_date=self.d3, amount_per_share=D("0.7"))
+            return real_create(objs, **kw)
+
+        with mock.patch.object(DividendEvent.objects, "bulk_create", racing_create):
+            self._sync("--min-interval-hours", "0")
+        self.assertEqual(DividendEvent.objects.filter(ex_date=self.d3).count(), 2)
+
+
+# =========================
+# Pipeline de fetch (services/fetch_pipeline.py)
+# =========================
+class FetchPipelineTests(TestCase):
+    def setUp(self):
+        self.clock = _FakeClock()
+        patcher = mock.patch.object(fetch_pipeline, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_token_bucket_allows_burst_then_paces(self):
+        bucket = fetch_pipeline.TokenBucket(rate=4, burst=2)  # délais exacts en binaire (horloge simulée)
+        self.assertEqual([bucket.acquire(), bucket.acquire()], [0.0, 0.0])
+        self.assertEqual(bucket.acquire(), 0.25)
+        self.assertEqual(self.clock.slept, [0.25])
+        self.clock.now += 1  # le seau se remplit, plafonné à la capacité
+        self.assertEqual([bucket.acquire(), bucket.acquire()], [0.0, 0.0])
+        self.assertEqual(bucket.acquire(), 0.25)
+        self.assertEqual(fetch_pipeline.TokenBucket(rate=0).acquire(), 0.0)  # illimité
+
+    def test_circuit_breaker_opens_then_probes_once(self):
+        br = fetch_pipeline.CircuitBreaker(threshold=2, cooldown=10)
+        br.failure()
+        self.assertTrue(br.allow())
+        br.failure()
+        self.assertTrue(br.is_open)
+        self.assertFalse(br.allow())
+
+        self.clock.now += 10
+        self.assertTrue(br.allow())  # half-open : un seul essai
+        self.assertFalse(br.allow())
+        br.failure()  # essai raté -> nouveau cooldown complet
+        self.assertFalse(br.allow())
+
+        self.clock.now += 10
+        self.assertTrue(br.allow())
+        br.success()
+        self.assertFalse(br.is_open)
+        self.assertTrue(br.allow())
+
+    def test_backoff_is_capped_full_jitter(self):
+        for attempt in range(10):
+            d = fetch_pipeline.backoff_delay(attempt, base=0.5, cap=4)
+            self.assertGreaterEqual(d, 0)
+            self.assertLessEqual(d, min(4, 0.5 * 2**attempt))
+
+    def test_fetch_concurrent_retries_and_reports_errors(self):
+        calls = defaultdict(int)
+        lock = threading.Lock()
+
+        def fetch(item):
+            with lock:
+                calls[item] += 1
+                n = calls[item]
+            if item == "flaky" and n < 3:
+                raise IOError("timeout")
+            if item == "down":
+                raise IOError("503")
+            return item.upper()
+
+        cfg = fetch_pipeline.FetchConfig(workers=3, rate=0, retries=2, backoff=0)
+        timings = fetch_pipeline.StageTimings()
+        breaker = fetch_pipeline.CircuitBreaker(threshold=99)
+        out = fetch_concurrent(fetch, ["ok", "flaky", "down"], cfg, breaker, timings)
+        results = {item: (res, type(err).__name__ if err else None) for item, res, err in out}
+
+        self.assertEqual(results, {"ok": ("OK", None), "flaky": ("FLAKY", None), "down": (None, "OSError")})
+        self.assertEqual(dict(calls), {"ok": 1, "flaky": 3, "down": 3})  # 1 essai + 2 retries
+        self.assertEqual(timings.counts["fetch"], 7)
+        self.assertEqual(list(fetch_concurrent(fetch, [], cfg, fetch_pipeline.CircuitBreaker(), timings)), [])
+
+    def test_open_breaker_fails_fast(self):
+        br = fetch_pipeline.CircuitBreaker(threshold=1, cooldown=60)
+        br.failure()
+        fetch = mock.Mock()
+        cfg = fetch_pipeline.FetchConfig(workers=2, rate=0, retries=3, backoff=0)
+        out = list(fetch_concurrent(fetch, ["a", "b"], cfg, br, fetch_pipeline.StageTimings()))
+        self.assertEqual(sorted(item for item, _res, _err in out), ["a", "b"])
+        self.assertTrue(all(isinstance(err, fetch_pipeline.CircuitOpen) for _item, _res, err in out))
+        fetch.assert_not_called()
+
+    def test_batched_writer_flushes_by_batch(self):
+        batches = []
+        w = fetch_pipeline.BatchedWriter(batches.append, batch_size=3, timings=fetch_pipeline.StageTimings())
+        w.add([1, 2])
+        w.add([3, 4])
+        w.add([5])
+        w.flush()
+        w.flush()
+        self.assertEqual(batches, [[1, 2, 3, 4], [5]])
+        self.assertEqual(w.written, 5)
+
+    @override_settings(DIVIDENDS_FETCH_RETRIES=0)
+    def test_failed_chunk_is_reported_not_raised(self):
+        root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, root)
+        self.addCleanup(breaker_for("replay").success)  # breaker partagé par le process
+        u = _user()
+        for sym in ("AAA.PA", "BBB.PA"):
+            Asset.objects.create(user=u, ticker=sym, price_symbol=sym)
+
+        out = StringIO()
+        with mock.patch.object(ReplayProvider, "dividends", side_effect=IOError("boom")):
+            call_command("sync_dividends_declared", "--replay", str(root), "--chunk-size", "1", stdout=out)
+        out = out.getvalue()
+        self.assertEqual(out.count("FAIL 1 symbols"), 2)
+        self.assertIn("FAIL=2", out)
+        self.assertRegex(out, r"Timings: wall=\S+ .*fetch=\S+/2")
+
+
+# =========================
+# Référentiel d'instruments : recherche
+# =========================
+class InstrumentSearchTests(TestCase):
+    def _item(self, symbol, label, isin=""):
+        return UniverseItem(key=symbol.lower(), label=label, ticker=symbol, symbol=symbol, isin=isin)
+
+    def test_words_split_on_apostrophes_and_dots(self):
+        master = InstrumentMaster([self._item("OR.PA", "L'Oréal"), self._item("BN.PA", "Danone S.A.")])
+        self.assertEqual([it.ticker for it in master.search("oreal")], ["OR.PA"])
+        self.assertEqual([it.ticker for it in master.search("L’Oréal")], ["OR.PA"])
+        self.assertEqual([it.ticker for it in master.search("danone s")], ["BN.PA"])
+
+    def test_exact_ticker_and_isin_before_prefix_matches(self):
+        items = [self._item(f"SA{i:02d}.PA", f"Saxo {i:02d}") for i in range(30)]
+        items.append(self._item("SA.PA", "Zeta", isin="FR0000000001"))
+        master = InstrumentMaster(items)
+
+        hits = master.search("sa", limit=5)
+        self.assertEqual(len(hits), 5)
+        self.assertEqual(hits[0].ticker, "SA.PA")  # au-delà de la limite dans l'index de préfixes
+        self.assertEqual([it.label for it in hits[1:]], sorted(it.label for it in hits[1:]))
+
+        self.assertEqual(master.search("FR0000000001", limit=1)[0].ticker, "SA.PA")
+        self.assertEqual(master.search("sa.pa")[0].ticker, "SA.PA")
+
+    def test_default_universe(self):
+        self.assertEqual(search_instruments("oreal")[0].ticker, "OR.PA")
+        self.assertEqual(search_instruments("FR0000120578")[0].ticker, "SAN.PA")
+        self.assertEqual(search_instruments(""), [])
+        self.assertEqual(search_instruments("sa", limit=0), [])
+
+
+# =========================
+# Paramètres de croissance des APIs
+# =========================
+class GrowthParamsTests(TestCase):
+    def setUp(self):
+        self.client.force_login(_user())
+
+    def _get(self, name, **params):
+        return self.client.get(reverse(name), params)
+
+    def test_grid_is_built_by_index(self):
+        r = self._get("dividends-api-growth-grid", y=2026, **{"from": "0", "to": "1", "step": "0.3"})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([D(row["growth"]) for row in r.json()["grid"]], [D("0"), D("0.3"), D("0.6"), D("0.9")])
+
+    def test_grid_rejects_out_of_range_values(self):
+        for params in (
+            {"from": "1e40", "to": "10000000000000000000000000000000000000001", "step": "0.5"},
+            {"from": "-101", "to": "0"},
+            {"from": "0", "to": "10", "step": "1e500000"},
+            {"from": "0", "to": "10", "step": "0"},
+            {"from": "0", "to": "10", "step": "0.01"},
+        ):
+            self.assertEqual(self._get("dividends-api-growth-grid", **params).status_code, 400, params)
+
+    def test_month_and_range_reject_unbounded_growth(self):
+        r = self._get("dividends-api-range", **{"from": "2026", "to": "2030", "g": "1e500000"})
+        self.assertEqual((r.status_code, r.json()["ok"]), (400, False))
+        self.assertEqual(self._get("dividends-api-month-details", y=2026, m=3, g="1e500000").status_code, 400)
+        self.assertEqual(self._get("dividends-api-month-details", y=2026, m=3, g="-100").status_code, 200)
+
+    def test_pages_clamp_growth(self):
+        self.assertEqual(self._get("dividends-calendar", y=2026, m=3, g="1e500000").status_code, 200)
+        r = self.client.get(
+            reverse("dividends-dashboard-fragment", args=["forecast"]), {"g": "1e500000", "format": "json"}
+        )
+        self.assertEqual(r.json()["growth"], "100")
+
+
+# =========================
+# Quotes partagées
+# =========================
+class SharedQuoteTests(TestCase):
+    def test_one_quote_one_row_readers_see_new_price(self):
+        u1, u2 = _user("u1"), _user("u2")
+        a1 = Asset.objects.create(user=u1, ticker="SAN.PA", price_symbol="SAN.PA", last_price=D("80"))
+        a2 = Asset.objects.create(user=u2, ticker="SAN.PA", price_symbol="SAN.PA")
+        _tx(a1, "BUY", date(2024, 1, 2), "2", price="80")
+
+        for price in ("90.1234567", "91.5"):
+            with self.assertNumQueries(1):
+                store_quotes([PriceQuote("SAN.PA", D(price), timezone.now(), "test")])
+
+        self.assertEqual(Quote.objects.get().price, D("91.500000"))
+        # pas de recopie dans Asset : les lectures résolvent la quote partagée
+        self.assertEqual(
+            list(Asset.objects.order_by("id").values_list("last_price", flat=True)), [D("80"), None]
+        )
+        for a in with_quotes(Asset.objects.filter(pk__in=[a1.pk, a2.pk])):
+            self.assertEqual(resolved_price(a), D("91.5"))
+        self.assertEqual(load_resolved_price(Asset.objects.get(pk=a1.pk)), D("91.5"))
+
+        from dividends.views import _build_perf_snapshot
+
+        self.assertEqual(_build_perf_snapshot(u1)["rows"][0].price, D("91.50"))
+
+    def test_never_quoted_symbol_falls_back_to_last_price(self):
+        a = Asset.objects.create(user=_user(), ticker="XYZ", price_symbol="XYZ", last_price=D("12.5"))
+        self.assertEqual(resolved_price(with_quotes(Asset.objects.filter(pk=a.pk)).get()), D("12.5"))
+
+
+# =========================
+# Allocation (services/analytics.py)
+# =========================
+class PortfolioAllocationTests(TestCase):
+    def test_decimal_weights_from_sql_quantities(self):
+        u = _user()
+        a = Asset.objects.create(user=u, ticker="SAN.PA", price_symbol="SAN.PA", last_price=D("80"))
+        b = Asset.objects.create(user=u, ticker="TTE.PA", price_symbol="TTE.PA", last_price=D("60.1"))
+        c = Asset.objects.create(user=u, ticker="AI.PA", price_symbol="AI.PA", last_price=D("150"))
+        d = Asset.objects.create(user=u, ticker="NOQ", price_symbol="NOQ")
+        zero = Asset.objects.create(user=u, ticker="ZERO", price_symbol="ZERO", last_price=D("5"))
+        Asset.objects.create(user=_user("bob"), ticker="SAN.PA", price_symbol="SAN.PA", last_price=D("1"))
+
+        _tx(a, "BUY", date(2024, 1, 2), "3")
+        _tx(a, "SELL", date(2024, 3, 2), "0.5")
+        _tx(b, "BUY", date(2024, 1, 2), "7.333333")
+        _tx(c, "BUY", date(2024, 1, 2), "1")
+        _tx(d, "BUY", date(2024, 1, 2), "4")
+        for qty in ("0.1", "0.2"):
+            _tx(zero, "BUY", date(2024, 1, 2), qty)
+        _tx(zero, "SELL", date(2024, 2, 2), "0.3")  # résidu flottant en SQLite, pas une position
+        store_quotes([PriceQuote("SAN.PA", D("91.5"), timezone.now(), "test")])
+
+        out = portfolio_allocation(u)
+
+        values = [D("440.7333133"), D("228.75"), D("150")]  # TTE, SAN (quote partagée), AI
+        total = sum(values, D("0"))
+        self.assertEqual([r["asset"].ticker for r in out["rows"]], ["TTE.PA", "SAN.PA", "AI.PA"])
+        self.assertEqual([r["value"] for r in out["rows"]], values)
+        self.assertEqual(out["total_value"], total)
+        for r, v in zip(out["rows"], values):
+            self.assertIsInstance(r["weight"], Decimal)
+            self.assertEqual(r["weight"], (v / total).quantize(D("0.000001")))
+        self.assertEqual(out["top1"], out["rows"][0]["weight"])
+        self.assertEqual(out["top3"], sum((r["weight"] for r in out["rows"]), D("0")))
+        self.assertEqual([a.ticker for a in out["missing_prices"]], ["NOQ"])
+
+
+# =========================
+# sync_prices (provider + replay)
+# =========================
+class SyncPricesTests(TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        (self.root / "quotes").mkdir()
+        for sym, price in (("SAN.PA", "91.5"), ("TTE.PA", "60.25")):
+            self._publish(sym, price)
+
+        self.u1, self.u2 = _user("u1"), _user("u2")
+        for u in (self.u1, self.u2):
+            Asset.objects.create(user=u, ticker="SAN.PA", price_symbol="SAN.PA")
+            Asset.objects.create(user=u, ticker="TTE.PA", price_symbol="TTE.PA")
+        Asset.objects.create(user=self.u1, ticker="NOPE", price_symbol="NOPE.PA")
+
+    def _publish(self, symbol, price):
+        payload = {"price": price, "asof": timezone.now().isoformat(), "source": "test"}
+        (self.root / "quotes" / f"{symbol}.json").write_text(json.dumps(payload), encoding="utf-8")
+
+    def _sync(self, *args):
+        out = StringIO()
+        call_command("sync_prices", "--replay", str(self.root), *args, stdout=out)
+        return out.getvalue()
+
+    def _prices(self):
+        return dict(Quote.objects.values_list("symbol", "price"))
+
+    def test_unbatched_mode_uses_the_provider(self):
+        out = self._sync()
+        self.assertIn("provider=replay OK=4 FAIL=1", out)
+        self.assertEqual(self._prices(), {"SAN.PA": D("91.5"), "TTE.PA": D("60.25")})
+        self.assertFalse(Asset.objects.exclude(last_price=None).exists())
+
+    def test_batched_fetches_each_symbol_once(self):
+        requested = []
+        real = ReplayProvider.quotes
+
+        def spy(provider, symbols):
+            symbols = list(symbols)
+            requested.extend(symbols)
+            return real(provider, symbols)
+
+        with mock.patch.object(ReplayProvider, "quotes", spy):
+            out = self._sync("--batched", "--chunk-size", "2")
+        self.assertEqual(sorted(requested), ["NOPE.PA", "SAN.PA", "TTE.PA"])  # 5 assets, 3 symboles
+        self.assertIn("symbols=3 OK=2 FAIL=1 FRESH=0", out)
+        self.assertEqual(self._prices(), {"SAN.PA": D("91.5"), "TTE.PA": D("60.25")})
+
+    def test_batched_skips_fresh_quotes_unless_forced(self):
+        self._sync("--batched")
+        self._publish("SAN.PA", "95")
+        self.assertIn("OK=0 FAIL=1 FRESH=2", self._sync("--batched"))
+        self.assertEqual(self._prices()["SAN.PA"], D("91.5"))
+
+        self.assertIn("OK=2 FAIL=1 FRESH=0", self._sync("--batched", "--force"))
+        self.assertEqual(self._prices()["SAN.PA"], D("95"))
+
+    def test_batched_user_filter(self):
+        self.assertIn("symbols=2 OK=2 FAIL=0", self._sync("--batched", "--user-id", str(self.u2.id)))
+
+
+# =========================
+# sync_price_history (backfill + incrémental)
+# =========================
+class SyncPriceHistoryTests(TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root)
+        (self.root / "closes").mkdir()
+        self.today = timezone.localdate()
+
+        u = _user()
+        for sym in ("SAN.PA", "TTE.PA", "NOPE.PA"):
+            Asset.objects.create(user=u, ticker=sym, price_symbol=sym)
+
+    def _publish(self, symbol, closes):
+        """closes: {jours avant aujourd'hui: cours}"""
+        rows = [[(self.today - timedelta(days=n)).isoformat(), px] for n, px in sorted(closes.items(), reverse=True)]
+        (self.root / "closes" / f"{symbol}.json").write_text(json.dumps(rows), encoding="utf-8")
+
+    def _sync(self):
+        calls = []
+        real = ReplayProvider.daily_closes
+
+        def spy(provider, symbols, start):
+            symbols = sorted(symbols)
+            calls.append((symbols, start))
+            return real(provider, symbols, start)
+
+        out = StringIO()
+        with mock.patch.object(ReplayProvider, "daily_closes", spy):
+            call_command("sync_price_history", "--replay", str(self.root), "--years", "1", stdout=out)
+        return out.getvalue(), calls
+
+    def _closes(self, symbol):
+        return {
+            (self.today - d).days: px
+            for d, px in DailyPrice.objects.filter(symbol=symbol).values_list("date", "close")
+        }
+
+    def test_backfill_then_incremental_refetches_last_stored_day(self):
+        self._publish("SAN.PA", {400: "80", 3: "90", 2: "91", 1: "91.5"})
+        self._publish("TTE.PA", {5: "60", 4: "61.123456789"})
+
+        out, calls = self._sync()
+        backfill = self.today - timedelta(days=365)
+        self.assertEqual(calls, [(["NOPE.PA", "SAN.PA", "TTE.PA"], backfill)])  # un seul appel multi-symboles
+        self.assertIn("Done. symbols=3 rows=5 NO=1", out)
+        self.assertEqual(self._closes("SAN.PA"), {3: D("90"), 2: D("91"), 1: D("91.5")})  # > --years exclu
+        self.assertEqual(self._closes("TTE.PA"), {5: D("60"), 4: D("61.123457")})
+
+        # barre partielle révisée + nouvelle clôture ; l'historique antérieur n'est pas re-téléchargé
+        self._publish("SAN.PA", {3: "1", 2: "1", 1: "92", 0: "93"})
+        self._publish("TTE.PA", {4: "62", 1: "63"})
+
+        out, calls = self._sync()
+        self.assertEqual(
+            calls,
+            [
+                (["NOPE.PA"], backfill),
+                (["TTE.PA"], self.today - timedelta(days=4)),
+                (["SAN.PA"], self.today - timedelta(days=1)),
+            ],
+        )
+        self.assertIn("Done. symbols=3 rows=4 NO=1", out)
+        self.assertEqual(self._closes("SAN.PA"), {3: D("90"), 2: D("91"), 1: D("92"), 0: D("93")})
+        self.assertEqual(self._closes("TTE.PA"), {5: D("60"), 4: D("62"), 1: D("63")})
+        self.assertEqual(DailyPrice.objects.count(), 7)
+
+
+# =========================
+# Agrégat annuel (services/aggregate.py)
+# =========================
+class AggregateEventsTests(TestCase):
+    Y = 2026
+
+    def _ev(self, ticker, on, amount, status="regular"):
+        return ForecastEvent(
+            asset_id=0, ticker=ticker, currency="EUR", ex_date=on, pay_date=on, display_date=on,
+            amount_per_share=D(amount), shares=D("1"), estimated_amount=D(amount), status=status,
+        )
+
+    def _events(self):
+        y = self.Y
+        return [
+            self._ev("SAN", date(y, 1, 10), "12.34", "received"),
+            self._ev("TTE", date(y, 3, 31), "5.55"),
+            self._ev("SAN", date(y, 1, 10), "1.00"),  # même jour : un seul bucket
+            self._ev("", date(y, 12, 1), "2.00", "Received"),
+            self._ev("SAN", date(y - 1, 12, 29), "99.00"),  # hors année : ignoré partout
+            self._ev("SAN", date(y + 1, 1, 2), "99.00"),
+        ]
+
+    def test_matrix_histogram_and_heatmap(self):
+        agg = aggregate_events(self._events(), self.Y)
+
+        self.assertEqual(agg.tickers, ["SAN", "TTE", "—"])
+        months, total_year, max_month = agg.histogram()
+        self.assertEqual((total_year, max_month), (D("20.89"), D("13.34")))
+        jan, mar, dec = months[0], months[2], months[11]
+        self.assertEqual(
+            (jan["total"], jan["received"], jan["regular"], jan["pct_total"]), (D("13.34"), D("12.34"), D("1.00"), 100)
+        )
+        self.assertEqual((mar["total"], mar["pct_total"], mar["pct_received"]), (D("5.55"), 42, 0))
+        self.assertEqual((dec["received"], dec["regular"]), (D("2.00"), D("0.00")))
+        self.assertEqual(sum(m["total"] for m in months), total_year)
+        self.assertEqual(agg.month_total(2), D("0"))
+
+        by_ticker, total, received, regular = agg.by_ticker()
+        self.assertEqual((total, received, regular), (2089, 1434, 655))
+        self.assertEqual(
+            by_ticker,
+            {
+                "SAN": {"total": 1334, "received": 1234, "regular": 100, "by_month": {1: 1334}},
+                "TTE": {"total": 555, "received": 0, "regular": 555, "by_month": {3: 555}},
+                "—": {"total": 200, "received": 200, "regular": 0, "by_month": {12: 200}},
+            },
+        )
+
+    def test_month_grid_matches_calendar_view(self):
+        events = self._events()
+        agg = aggregate_events(events, self.Y)
+        for month in (1, 3, 12):
+            in_month = [e for e in events if e.display_date.year == self.Y and e.display_date.month == month]
+            self.assertEqual(agg.month_grid(month), month_grid(self.Y, month, in_month), month)
+
+        cells = [c for week in agg.month_grid(1) for c in week]
+        self.assertEqual([c["d"] for c in cells if not c["in_month"] and c["events"]], [])  # 29/12 de y-1 absent
+        jan10 = next(c for c in cells if c["d"] == date(self.Y, 1, 10))
+        self.assertEqual((len(jan10["events"]), jan10["total_estimated"]), (2, D("13.34")))
+
+    def test_cached_aggregate_backs_the_calendar_and_follows_writes(self):
+        cache.clear()
+        y = date.today().year
+        user = _user()
+        _dividend_portfolio(user, y)
+        expected = aggregate_events(build_year_events(user, y + 1), y + 1)
+
+        agg = year_aggregate(user, y + 1)
+        for attr in ("tickers", "cells", "month_received", "day_cents"):
+            self.assertEqual(getattr(agg, attr), getattr(expected, attr), attr)
+        with self.assertNumQueries(0):
+            year_aggregate(user, y + 1)
+
+        self.client.force_login(user)
+        for m in range(1, 13):
+            resp = self.client.get(reverse("dividends-calendar"), {"y": y + 1, "m": m})
+            self.assertEqual(resp.context["month_total_estimated"], expected.month_total(m), m)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            _tx(Asset.objects.get(user=user, ticker="SAN.PA"), "BUY", date(y, 1, 2), "10")
+        fresh = year_aggregate(user, y + 1)
+        self.assertGreater(sum(fresh.month_totals()), sum(agg.month_totals()))
+        self.assertEqual(fresh.cells, aggregate_events(build_year_events(user, y + 1), y + 1).cells)
+
+
+# =========================
+# Prévision : backend tableaux (numpy) == chemin Decimal
+# =========================
+class ForecastBackendParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.y = date.today().year
+        cls.user = _user()
+        _dividend_portfolio(cls.user, cls.y)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_arrays_match_decimal_projection(self):
+        for year in (self.y - 1, self.y, self.y + 1, self.y + 3, self.y - 10):
+            with override_settings(DIVIDENDS_FORECAST_BACKEND="numpy"):
+                arrays = project_year_arrays(self.user, year)
+            self.assertIsNotNone(arrays, year)
+
+            with override_settings(DIVIDENDS_FORECAST_BACKEND="decimal"):
+                self.assertIsNone(project_year_arrays(self.user, year))
+                agg = aggregate_events(build_year_events(self.user, year), year)
+
+            self.assertEqual(arrays.histogram(), agg.histogram(), year)
+            self.assertEqual(arrays.by_ticker(), agg.by_ticker(), year)
+        self.assertEqual(len(arrays.cents), 0)  # y - 10 : aucun event
+
+    def test_dashboard_forecast_identical_across_backends(self):
+        from dividends.views import _forecast_fragment
+
+        for growth in (D("0"), D("2.5"), D("-3")):
+            for year in (self.y, self.y + 2):
+                out = {}
+                for backend in ("numpy", "decimal"):
+                    cache.clear()
+                    with override_settings(DIVIDENDS_FORECAST_BACKEND=backend):
+                        out[backend] = _forecast_fragment(self.user, year, growth)
+                self.assertEqual(out["numpy"], out["decimal"], (growth, year))
+                self.assertGreater(out["decimal"]["hist_total"], 0)
+
+    def test_growth_falls_back_to_decimal(self):
+        with override_settings(DIVIDENDS_FORECAST_BACKEND="numpy"):
+            self.assertIsNone(project_year_arrays(self.user, self.y, D("2")))
+
+    def test_invalid_backend_setting_is_rejected(self):
+        with override_settings(DIVIDENDS_FORECAST_BACKEND="gpu"):
+            with self.assertRaises(ImproperlyConfigured):
+                project_year_arrays(self.user, self.y)
+        with override_settings(DIVIDENDS_FORECAST_BACKEND="numpy"), mock.patch.object(forecast_arrays, "np", None):
+            with self.assertRaises(ImproperlyConfigured):
+                forecast_arrays.available()
+        with override_settings(DIVIDENDS_FORECAST_BACKEND="auto"), mock.patch.object(forecast_arrays, "np", None):
+            self.assertFalse(forecast_arrays.available())
+
+
+# =========================
+# APIs mois / plage == projection annuelle
+# =========================
+def _event_json(e):
+    return {
+        "ticker": e.ticker,
+        "status": e.status,
+        "ex_date": e.ex_date.isoformat(),
+        "pay_date": e.pay_date.isoformat() if e.pay_date else None,
+        "amount_per_share": str(e.amount_per_share),
+        "shares": str(e.shares),
+        "amount": str(e.estimated_amount),
+        "currency": e.currency or "EUR",
+    }
+
+
+class ForecastEndpointParityTests(TestCase):
+    GROWTHS = ("0", "2.5", "-3")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.y = date.today().year
+        cls.user = _user()
+        _dividend_portfolio(cls.user, cls.y)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_month_details_match_year_projection(self):
+        for g in self.GROWTHS:
+            for year in (self.y - 1, self.y, self.y + 1):
+                by_month = {}
+                for e in build_year_events(self.user, year, growth_pct=D(g)):
+                    by_month.setdefault(e.display_date.month, []).append(_event_json(e))
+
+                for month in range(1, 13):
+                    r = self.client.get(reverse("dividends-api-month-details"), {"y": year, "m": month, "g": g})
+                    data = r.json()
+                    expected = by_month.get(month, [])
+                    self.assertEqual(data["events"], expected, (g, year, month))
+                    self.assertEqual(D(data["total"]), sum((D(e["amount"]) for e in expected), D("0")))
+
+        # l'event de décembre payé en janvier tombe en janvier de l'année cible
+        r = self.client.get(reverse("dividends-api-month-details"), {"y": self.y + 1, "m": 1})
+        self.assertEqual([e["pay_date"] for e in r.json()["events"]], [date(self.y + 1, 1, 10).isoformat()])
+
+    def test_range_matches_year_projection(self):
+        start, end = self.y - 2, self.y + 6
+        for g in self.GROWTHS + ("7.25",):
+            r = self.client.get(reverse("dividends-api-range"), {"from": start, "to": end, "g": g})
+            years = r.json()["years"]
+            self.assertEqual([row["year"] for row in years], list(range(start, end + 1)))
+
+            for row in years:
+                events = build_year_events(self.user, row["year"], growth_pct=D(g))
+                months = [D("0.00")] * 12
+                for e in events:
+                    months[e.display_date.month - 1] += e.estimated_amount
+                self.assertEqual(row["count"], len(events), (g, row["year"]))
+                self.assertEqual(row["months"], [str(v) for v in months], (g, row["year"]))
+                self.assertEqual(D(row["total"]), sum(months, D("0.00")))
+
+
+# =========================
+# Caches versionnés : invalidation par signaux
+# =========================
+class CacheInvalidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.y = date.today().year
+        cls.user = _user()
+        _dividend_portfolio(cls.user, cls.y)
+        cls.san = Asset.objects.get(user=cls.user, ticker="SAN.PA")
+        cls.tte = Asset.objects.get(user=cls.user, ticker="TTE.PA")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def _read(self):
+        """Dashboard tel que servi (caches chauds) : total prévu de y+1 et quantités du snapshot perf."""
+        url = lambda name: reverse("dividends-dashboard-fragment", args=[name])  # noqa: E731
+        fc = self.client.get(url("forecast"), {"y": self.y + 1, "format": "json"}).json()
+        perf = self.client.get(url("perf"), {"format": "json"}).json()
+        return D(fc["hist_total"]), {r["ticker"]: D(r["qty"]) for r in perf["perf"]["rows"]}
+
+    def _versions(self, asset):
+        return forecast_versions([asset.id])[asset.id], dashboard_cache._user_version(self.user.pk)
+
+    def _assert_refreshed(self, asset, write):
+        before = self._read()
+        versions = self._versions(asset)
+        self.assertEqual(self._read(), before)  # cache chaud, inchangé sans écriture
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+
+        new_versions = self._versions(asset)
+        self.assertNotEqual(new_versions[0], versions[0])
+        self.assertNotEqual(new_versions[1], versions[1])
+
+        after = self._read()
+        self.assertNotEqual(after, before)
+        cache.clear()
+        self.assertEqual(self._read(), after)  # même résultat qu'un calcul à froid
+        return before, after
+
+    def test_transaction_create_edit_delete(self):
+        tx = None
+
+        def create():
+            nonlocal tx
+            tx = _tx(self.san, "BUY", date(self.y - 1, 1, 3), "2")
+
+        (_t0, q0), (_t1, q1) = self._assert_refreshed(self.san, create)
+        self.assertEqual(q1["SAN.PA"] - q0["SAN.PA"], D("2"))
+
+        def edit():
+            tx.quantity = D("3")
+            tx.save()
+
+        self._assert_refreshed(self.san, edit)
+        _before, (_t, q) = self._assert_refreshed(self.san, tx.delete)
+        self.assertEqual(q["SAN.PA"], q0["SAN.PA"])
+
+    def test_dividend_create_edit_delete(self):
+        ev = None
+
+        def create():
+            nonlocal ev
+            ev = DividendEvent.objects.create(asset=self.tte, ex_date=date(self.y - 1, 6, 2), amount_per_share=D("1.2"))
+
+        self._assert_refreshed(self.tte, create)
+
+        def edit():
+            ev.amount_per_share = D("1.7")
+            ev.save()
+
+        (t0, _q0), (t1, _q1) = self._assert_refreshed(self.tte, edit)
+        self.assertEqual(t1 - t0, D("3.50"))  # 7 actions x 0.5
+        self._assert_refreshed(self.tte, ev.delete)
+
+
+# =========================
+# Fragments du dashboard
+# =========================
+class DashboardFragmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.y = date.today().year
+        cls.user = _user()
+        _dividend_portfolio(cls.user, cls.y)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def _get(self, name, **params):
+        return self.client.get(reverse("dividends-dashboard-fragment", args=[name]), params)
+
+    def test_unknown_fragment_is_404(self):
+        r = self._get("nope")
+        self.assertEqual((r.status_code, r.json()["ok"]), (404, False))
+
+    def test_html_and_json(self):
+        for name, template in views.DASHBOARD_FRAGMENTS.items():
+            r = self._get(name)
+            self.assertEqual(r.status_code, 200)
+            self.assertTemplateUsed(r, template)
+            self.assertTemplateNotUsed(r, "dividends/dividends_dashboard.html")
+
+            r = self._get(name, format="json")
+            self.assertEqual(r["Content-Type"], "application/json")
+            self.assertEqual((r.json()["ok"], r.json()["fragment"]), (True, name))
+
+        self.assertEqual(self._get("perf", format="json").json()["perf"]["rows"][0]["ticker"], "AI.PA")
+
+    def test_forecast_honours_year_and_growth(self):
+        base = self._get("forecast", y=self.y + 1, format="json").json()
+        grown = self._get("forecast", y=self.y + 1, g="10", format="json").json()
+        self.assertEqual((base["hist_year"], base["growth"], grown["growth"]), (self.y + 1, "0", "10"))
+        self.assertGreater(D(grown["hist_total"]), D(base["hist_total"]))
+
+        expected = aggregate_events(build_year_events(self.user, self.y + 1, D("10")), self.y + 1).histogram()[1]
+        self.assertEqual(D(grown["hist_total"]), expected)
+
+        r = self._get("forecast", y=self.y - 1, g="2.5")
+        self.assertContains(r, f"Dividendes — {self.y - 1}")
+        self.assertContains(r, 'data-nav-g="2.5"')
+
+
+# =========================
+# Vues async (ASGI) == vues sync
+# =========================
+def _without_csrf(html: bytes) -> bytes:
+    return re.sub(rb'name="csrfmiddlewaretoken" value="[^"]*"', b"", html)
+
+
+def _reload_urls():
+    importlib.reload(dividends_urls)
+    importlib.reload(import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@override_settings(DIVIDENDS_ASYNC_VIEWS=True)
+class AsyncViewsTests(TransactionTestCase):
+    # les calculs tournent dans le pool (autres connexions) : données commitées, pas de TestCase
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        _reload_urls()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with override_settings(DIVIDENDS_ASYNC_VIEWS=False):
+            _reload_urls()
+
+    def setUp(self):
+        cache.clear()
+        self.y = date.today().year
+        self.user = _user()
+        _dividend_portfolio(self.user, self.y)
+        store_quotes([PriceQuote("SAN.PA", D("91.5"), timezone.now(), "test")])
+        self.factory = RequestFactory()
+
+    def _sync(self, view, path, params, *args):
+        request = self.factory.get(path, params)
+        request.user = self.user
+        return view(request, *args)
+
+    async def _async(self, path, params):
+        await self.async_client.aforce_login(self.user)
+        return await self.async_client.get(path, params)
+
+    async def test_json_views_match_sync_twins(self):
+        g = {"g": "2.5"}
+        cases = [
+            (views.api_month_details, "dividends-api-month-details", {"y": self.y, "m": 5, **g}, ()),
+            (views.api_range_events, "dividends-api-range", {"from": self.y - 1, "to": self.y + 3, **g}, ()),
+            (views.api_growth_grid, "dividends-api-growth-grid", {"y": self.y, "from": "0", "to": "3"}, ()),
+            (views.api_instruments, "dividends-api-instruments", {"q": "san", "limit": 5}, ()),
+            (views.dashboard_fragment, "dividends-dashboard-fragment", {"y": self.y, "format": "json", **g}, ("forecast",)),
+            (views.dashboard_fragment, "dividends-dashboard-fragment", {"format": "json"}, ("perf",)),
+            (views.api_range_events, "dividends-api-range", {"g": "1e9"}, ()),
+        ]
+        for view, name, params, args in cases:
+            path = reverse(name, args=args)
+            self.assertEqual(resolve(path).func.__name__, view.__name__ + "_async")
+            a = await self._async(path, params)
+            s = await sync_to_async(self._sync)(view, path, params, *args)
+            self.assertEqual(a.status_code, s.status_code, name)
+            ja, js = json.loads(a.content), json.loads(s.content)
+            if name == "dividends-dashboard-fragment" and "perf" in js:
+                ja["perf"].pop("asof"), js["perf"].pop("asof")  # horodatage à la minute
+            self.assertEqual(ja, js, (name, params))
+
+    async def test_html_fragment_and_dashboard(self):
+        path = reverse("dividends-dashboard-fragment", args=["universe"])
+        a = await self._async(path, {})
+        s = await sync_to_async(self._sync)(views.dashboard_fragment, path, {}, "universe")
+        self.assertEqual(_without_csrf(a.content), _without_csrf(s.content))
+        self.assertEqual((await self._async(reverse("dividends-dashboard-fragment", args=["nope"]), {})).status_code, 404)
+
+        r = await self._async(reverse("dividends-dashboard"), {"y": self.y})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([row.ticker for row in r.context["perf"]["rows"]], ["AI.PA", "SAN.PA", "TTE.PA"])
+
+    async def test_login_required(self):
+        for name, args in (
+            ("dividends-dashboard", ()),
+            ("dividends-dashboard-fragment", ("perf",)),
+            ("dividends-api-month-details", ()),
+            ("dividends-api-instruments", ()),
+        ):
+            r = await self.async_client.get(reverse(name, args=args), {"y": self.y, "m": 1})
+            self.assertEqual(r.status_code, 302, name)
+            self.assertTrue(r["Location"].startswith(settings.LOGIN_URL), name)
+
+    async def test_messages_survive_async_render(self):
+        await self.async_client.aforce_login(self.user)
+        r = await self.async_client.post(reverse("dividends-add-sell"), {"universe_key": "nope"})
+        self.assertEqual(r.status_code, 302)
+
+        r = await self.async_client.get(reverse("dividends-dashboard"))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([str(m) for m in r.context["messages"]], ["Instrument invalide."])
+        self.assertEqual(r.context["user"].pk, self.user.pk)
+
+    def test_executor_is_bounded(self):
+        views._executor.cache_clear()
+        self.addCleanup(views._executor.cache_clear)
+        with override_settings(DIVIDENDS_ASYNC_WORKERS=2):
+            pool = views._executor()
+        self.assertEqual(pool._max_workers, 2)
+        self.assertIs(views._executor(), pool)
+        pool.shutdown(wait=True)
@@ -1,11 +1,35 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# ASGI : DIVIDENDS_ASYNC_VIEWS=True sert les variantes async du dashboard, de ses fragments et des APIs JSON
+_async = getattr(settings, "DIVIDENDS_ASYNC_VIEWS", False)
+
 urlpatterns = [
-    path("", views.dividends_dashboard, name="dividends-dashboard"),
+    path("", views.dividends_dashboard_async if _async else views.dividends_dashboard, name="dividends-dashboard"),
     path("calendar/", views.dividends_calendar, name="dividends-calendar"),
+    path(
+        "fragments/<str:name>/",
+        views.dashboard_fragment_async if _async else views.dashboard_fragment,
+        name="dividends-dashboard-fragment",
+    ),
 
-    path("api/month/", views.api_month_details, name="dividends-api-month-details"),
+    path(
+        "api/month/",
+        views.api_month_details_async if _async else views.api_month_details,
+        name="dividends-api-month-details",
+    ),
+    path("api/range/", views.api_range_events_async if _async else views.api_range_events, name="dividends-api-range"),
+    path(
+        "api/growth-grid/",
+        views.api_growth_grid_async if _async else views.api_growth_grid,
+        name="dividends-api-growth-grid",
+    ),
+    path(
+        "api/instruments/",
+        views.api_instruments_async if _async else views.api_instruments,
+        name="dividends-api-instruments",
+    ),
 
     # dictionnaire (add/remove)
     path("assets/toggle/", views.toggle_asset_from_universe, name="dividends-toggle-asset"),
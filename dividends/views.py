@@ -1,13 +1,19 @@
 from __future__ import annotations
 
-from collections import defaultdict
-from dataclasses import dataclass
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, is_dataclass
 from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
+from functools import lru_cache
 from typing import Dict, List, Tuple, Optional
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
 from django.http import JsonResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
@@ -15,9 +21,20 @@ from django.utils import timezone
 from django.views.decorators.http import require_GET, require_POST
 
 from dividends.models import Asset, Transaction
-from dividends.services.universe import UNIVERSE, universe_choices, UniverseItem
-from .services.calendar_view import month_grid
-from .services.forecast_year import build_year_events, year_histogram
+from dividends.services.universe import UniverseItem, get_instrument, instrument_master, search_instruments
+from .services.aggregate import aggregate_events, year_aggregate
+from .services.dashboard_cache import cached_fragment
+from .services.forecast_arrays import project_year_arrays
+from .services.forecast_year import (
+    build_month_events,
+    build_range_events,
+    build_year_base,
+    growth_grid,
+)
+from .services.money import div_round, from_cents, from_scaled, to_micro, to_scaled
+from .services.pnl import build_portfolio
+from .services.positions import OversellError, record_sell, refresh_stale_positions
+from .services.quotes import resolved_price, with_quotes
 
 
 # =========================
@@ -34,18 +51,34 @@ def _get_int(request, key: str, default: int) -> int:
 
 
 def _get_decimal(request, key: str, default: str = "0") -> Decimal:
-    raw = request.GET.get(key, default)
-    try:
-        return Decimal(str(raw))
-    except (InvalidOperation, TypeError, ValueError):
-        return Decimal(default)
+    return _dec(request.GET.get(key, default), default)
 
 
 def _dec(raw, default: str = "0") -> Decimal:
     try:
-        return Decimal(str(raw))
+        d = Decimal(str(raw))
     except (InvalidOperation, TypeError, ValueError):
         return Decimal(default)
+    # ✅ NaN / Infinity acceptés par Decimal() -> traités comme une saisie invalide
+    return d if d.is_finite() else Decimal(default)
+
+
+# croissance annuelle en % : bornée avant tout calcul (facteurs cumulés, grilles)
+GROWTH_MIN = Decimal("-100")
+GROWTH_MAX = Decimal("100")
+
+
+def _get_growth(request, key: str = "g", default: str = "0") -> Decimal:
+    """Pourcentage de croissance ; ValueError hors de [GROWTH_MIN, GROWTH_MAX]."""
+    g = _get_decimal(request, key, default)
+    if not GROWTH_MIN <= g <= GROWTH_MAX:
+        raise ValueError(f"bad {key} (must be between {GROWTH_MIN} and {GROWTH_MAX})")
+    return g
+
+
+def _clamp_growth(g: Decimal) -> Decimal:
+    """Pages HTML : une croissance hors bornes est ramenée à la borne plutôt que refusée."""
+    return min(max(g, GROWTH_MIN), GROWTH_MAX)
 
 
 def _d0(x) -> Decimal:
@@ -128,74 +161,50 @@ def _apply_universe_to_asset(asset: Asset, item: UniverseItem) -> bool:
 # Dividends breakdown + heatmap
 # =========================
 def _build_dividend_breakdown(events, year: int) -> dict:
-    by_ticker = defaultdict(
-        lambda: {
-            "total": Decimal("0"),
-            "received": Decimal("0"),
-            "regular": Decimal("0"),
-            "by_month": defaultdict(lambda: Decimal("0")),
-        }
-    )
-
-    total = Decimal("0")
-    received = Decimal("0")
-    regular = Decimal("0")
+    # ✅ même parcours unique que l'histogramme / calendrier (services/aggregate.py)
+    return _breakdown_from_totals(*aggregate_events(events, year).by_ticker())
 
-    for e in events:
-        d = getattr(e, "display_date", None)
-        if not d or d.year != year:
-            continue
-
-        ticker = getattr(e, "ticker", "—") or "—"
-        amt = _d0(getattr(e, "estimated_amount", 0))
-        status = (getattr(e, "status", "") or "").lower()
-
-        total += amt
-        by_ticker[ticker]["total"] += amt
-        by_ticker[ticker]["by_month"][d.month] += amt
-
-        if status == "received":
-            received += amt
-            by_ticker[ticker]["received"] += amt
-        else:
-            regular += amt
-            by_ticker[ticker]["regular"] += amt
 
+def _breakdown_from_totals(by_ticker: dict, total: int, received: int, regular: int) -> dict:
+    """
+    Montants en centimes (int).
+    by_ticker: {ticker: {"total", "received", "regular", "by_month": {1..12: int}}}
+    dans l'ordre de première apparition (départage les égalités de total).
+    """
     tickers_sorted = sorted(by_ticker.keys(), key=lambda t: by_ticker[t]["total"], reverse=True)
 
-    max_cell = Decimal("0")
+    max_cell = 0
     raw_rows = []
     for t in tickers_sorted:
         cells = []
         for m in range(1, 13):
-            v = by_ticker[t]["by_month"].get(m, Decimal("0"))
+            v = by_ticker[t]["by_month"].get(m, 0)
             max_cell = max(max_cell, v)
             cells.append(v)
         raw_rows.append({"ticker": t, "total": by_ticker[t]["total"], "cells": cells})
 
-    denom = max_cell if max_cell > 0 else Decimal("1")
+    denom = max_cell if max_cell > 0 else 1
 
     heat_rows = []
     for r in raw_rows:
         cells2 = []
         for v in r["cells"]:
-            intensity = int((_safe_div(v, denom) * Decimal("100")).quantize(Decimal("1")))
-            cells2.append({"v": _money(v), "i": intensity})
-        heat_rows.append({"ticker": r["ticker"], "total": _money(r["total"]), "cells2": cells2})
+            cells2.append({"v": from_cents(v), "i": div_round(v * 100, denom)})
+        heat_rows.append({"ticker": r["ticker"], "total": from_cents(r["total"]), "cells2": cells2})
 
     return {
-        "div_total": _money(total),
-        "div_received": _money(received),
-        "div_regular": _money(regular),
+        "div_total": from_cents(total),
+        "div_received": from_cents(received),
+        "div_regular": from_cents(regular),
         "heat_rows": heat_rows,
-        "max_cell": _money(max_cell),
+        "max_cell": from_cents(max_cell),
     }
 
 
 # =========================
 # Perf snapshot (PRU vs market) + donut
 # =========================
-@dataclass
+@dataclass(slots=True)
 class PerfRow:
     asset_id: int
     ticker: str
@@ -219,117 +228,94 @@ class PerfRow:
     is_neg: bool
 
 
+_E10 = 10**10  # échelle 1e-12 -> centimes
+
+
 def _build_perf_snapshot(user) -> dict:
+    # ✅ positions matérialisées (AssetPosition) : O(assets), plus de replay des transactions
     assets = (
-        Asset.objects.filter(user=user, is_active=True)
-        .only("id", "ticker", "sector", "last_price", "currency")
+        with_quotes(Asset.objects.filter(user=user, is_active=True))
+        .select_related("position")
+        .only(
+            "id", "ticker", "sector", "price_symbol", "last_price", "currency",
+            "position__quantity", "position__cost_basis", "position__realized_pnl",
+            "position__tx_count", "position__tx_max_id",
+        )
         .order_by("ticker")
     )
-    asset_by_id = {a.id: a for a in assets}
-    asset_ids = list(asset_by_id.keys())
-
-    txs = (
-        Transaction.objects.filter(asset_id__in=asset_ids)
-        .only("asset_id", "type", "date", "quantity", "price", "fees")
-        .order_by("date", "id")
-    )
-
-    pos_qty: Dict[int, Decimal] = {aid: Decimal("0") for aid in asset_ids}
-    pos_cost: Dict[int, Decimal] = {aid: Decimal("0") for aid in asset_ids}  # coût restant (qty * PMP)
-    realized: Dict[int, Decimal] = {aid: Decimal("0") for aid in asset_ids}  # ✅ P&L réalisé cumulé
-
-    for t in txs:
-        aid = t.asset_id
-        q = _d0(t.quantity)
-        p = _d0(t.price)
-        f = _d0(getattr(t, "fees", 0))
-
-        if q <= 0:
-            continue
-
-        if t.type == Transaction.BUY:
-            pos_qty[aid] += q
-            # ✅ frais inclus dans le PRU (PMP)
-            pos_cost[aid] += (q * p) + f
-
-        elif t.type == Transaction.SELL:
-            qty_before = pos_qty[aid]
-            if qty_before <= 0:
-                continue
-
-            avg = (pos_cost[aid] / qty_before) if qty_before > 0 else Decimal("0")
-            sell_qty = min(q, qty_before)
-
-            # ✅ gain réalisé = (sell - PMP) * qty - fees
-            realized[aid] += (p - avg) * sell_qty - f
-
-            # On retire du coût restant la part vendue au PMP
-            pos_qty[aid] -= sell_qty
-            pos_cost[aid] -= (sell_qty * avg)
-
-            # petite protection numérique
-            if pos_qty[aid] <= 0:
-                pos_qty[aid] = Decimal("0")
-                pos_cost[aid] = Decimal("0")
 
+    # ✅ même contrôle que load_timelines / record_sell : position écrite sans signaux -> reconstruite
+    rows_in = list(assets)
+    stamps = {}
+    for a in rows_in:
+        pos = getattr(a, "position", None)
+        stamps[a.id] = (pos.tx_count, pos.tx_max_id) if pos is not None else (0, None)
+    if refresh_stale_positions(stamps):
+        rows_in = list(assets.all())
+
+    # ✅ virgule fixe : qty/prix en micro (1e-6), coûts et valeurs en 1e-12 ;
+    # arrondi HALF_EVEN une seule fois, à l'affichage
     rows: List[PerfRow] = []
-    total_cost = Decimal("0")
-    total_market = Decimal("0")
-    total_realized = Decimal("0")  # ✅
-    tmp: List[Tuple[PerfRow, Decimal]] = []
-
-    for aid in asset_ids:
-        a = asset_by_id[aid]
-        qty = pos_qty.get(aid, Decimal("0"))
-        cost_total = pos_cost.get(aid, Decimal("0"))
+    total_cost = 0
+    total_market = 0
+    total_realized = 0  # ✅ 1e-10 (échelle du champ realized_pnl)
+    tmp: List[Tuple[PerfRow, int, int]] = []  # (row, |pnl|, cost) -> |pnl_pct| exact
+
+    for a in rows_in:
+        pos = getattr(a, "position", None)
+        if pos is None:
+            continue
+        qty = to_micro(pos.quantity)
         if qty <= 0:
             continue
+        cost_total = to_scaled(pos.cost_basis, 12)
 
-        avg_cost = (cost_total / qty) if qty > 0 else Decimal("0")
-        mkt_price = _d0(a.last_price)
+        mkt_price = to_micro(_d0(resolved_price(a)))
 
         market_total = qty * mkt_price
         pnl = market_total - cost_total
-        pnl_pct = (pnl / cost_total * Decimal("100")) if cost_total > 0 else Decimal("0")
 
-        pru = _quant2(avg_cost)
-        price = _quant2(mkt_price)
-        unit_diff = _quant2(price - pru)
+        pru = div_round(cost_total, qty * 10**4)  # (cost / qty) en centimes
+        price = div_round(mkt_price, 10**4)
 
         row = PerfRow(
-            asset_id=aid,
+            asset_id=a.id,
             ticker=a.ticker,
             sector=(a.sector or "—"),
-            qty=qty,
-            avg_cost=_quant2(avg_cost),
-            mkt_price=_quant2(mkt_price),
-            cost_total=_quant2(cost_total),
-            market_total=_quant2(market_total),
-            pru=pru,
-            price=price,
-            unit_diff=unit_diff,
-            pnl=_quant2(pnl),
-            pnl_pct=pnl_pct.quantize(Decimal("0.1")),
+            qty=pos.quantity,
+            avg_cost=from_cents(pru),
+            mkt_price=from_cents(price),
+            cost_total=from_cents(div_round(cost_total, _E10)),
+            market_total=from_cents(div_round(market_total, _E10)),
+            pru=from_cents(pru),
+            price=from_cents(price),
+            unit_diff=from_cents(price - pru),
+            pnl=from_cents(div_round(pnl, _E10)),
+            pnl_pct=from_scaled(div_round(pnl * 1000, cost_total), 1) if cost_total > 0 else Decimal("0.0"),
             bar_pct=0,
             is_neg=(pnl < 0),
         )
 
-        tmp.append((row, abs(pnl_pct)))
+        tmp.append((row, abs(pnl), cost_total))
         total_cost += cost_total
         total_market += market_total
-        total_realized += realized.get(aid, Decimal("0"))  # ✅
-
-    max_abs_pct = max((x[1] for x in tmp), default=Decimal("0"))
-    if max_abs_pct <= 0:
-        max_abs_pct = Decimal("1")
-
-    for row, abs_pct in tmp:
-        bar = int((abs_pct / max_abs_pct * Decimal("100")).quantize(Decimal("1")))
+        total_realized += to_scaled(pos.realized_pnl, 10)  # ✅
+
+    # |pnl_pct| max comparé en rationnels exacts (produits croisés)
+    max_pnl, max_cost = 0, 1
+    for _row, abs_pnl, cost in tmp:
+        if cost > 0 and abs_pnl * max_cost > max_pnl * cost:
+            max_pnl, max_cost = abs_pnl, cost
+    if max_pnl <= 0:
+        max_pnl, max_cost = 1, 100  # 1%
+
+    for row, abs_pnl, cost in tmp:
+        bar = div_round(abs_pnl * max_cost * 100, cost * max_pnl) if cost > 0 else 0
         row.bar_pct = max(4, min(100, bar))
         rows.append(row)
 
     total_pnl = total_market - total_cost  # latent total
-    total_pnl_pct = (total_pnl / total_cost * Decimal("100")) if total_cost > 0 else Decimal("0")
+    total_pnl_pct = from_scaled(div_round(total_pnl * 1000, total_cost), 1) if total_cost > 0 else Decimal("0.0")
 
     # donut unchanged...
     sector_totals: Dict[str, Decimal] = {}
@@ -358,92 +344,151 @@ def _build_perf_snapshot(user) -> dict:
     return {
         "asof": timezone.localtime(timezone.now()).strftime("%Y-%m-%d %H:%M"),
         "rows": rows,
-        "total_cost": _quant2(total_cost),
-        "total_market": _quant2(total_market),
-        "total_pnl": _quant2(total_pnl),  # latent
-        "total_pnl_pct": total_pnl_pct.quantize(Decimal("0.1")),
-        "total_realized": _quant2(total_realized),  # ✅ ajouté
+        "total_cost": from_cents(div_round(total_cost, _E10)),
+        "total_market": from_cents(div_round(total_market, _E10)),
+        "total_pnl": from_cents(div_round(total_pnl, _E10)),  # latent
+        "total_pnl_pct": total_pnl_pct,
+        "total_realized": from_cents(div_round(total_realized, 10**8)),  # ✅ ajouté
         "sectors": sector_items,
         "donut_bg": donut_bg,
     }
 
 # =========================
-# Holdings helper (SELL validation)
+# Views
 # =========================
-def _shares_held_now(user, asset_id: int) -> Decimal:
-    qty = Decimal("0")
-    txs = (
-        Transaction.objects.filter(asset_id=asset_id, asset__user=user)
-        .only("type", "quantity", "date", "id")
-        .order_by("date", "id")
-    )
-    for t in txs:
-        q = _d0(t.quantity)
-        if t.type == Transaction.BUY:
-            qty += q
-        elif t.type == Transaction.SELL:
-            qty -= q
-    return max(qty, Decimal("0"))
-
-
 # =========================
-# Views
+# Dashboard fragments (cache indépendant par fragment)
 # =========================
+def _perf_fragment(user) -> dict:
+    # ne dépend ni de l'année ni de la croissance ; TTL court car les cours bougent
+    ttl = getattr(settings, "DIVIDENDS_PERF_CACHE_TTL", 60)
+    return cached_fragment("perf", user.pk, (), ttl, lambda: _build_perf_snapshot(user))
+
+
+def _forecast_fragment(user, year: int, growth: Decimal) -> dict:
+    def build():
+        # backend tableaux (numpy) si applicable, sinon projection Decimal (mêmes résultats)
+        arrays = project_year_arrays(user, year, growth_pct=growth)
+        if arrays is not None:
+            hist_months, hist_total, _ = arrays.histogram()
+            div = _breakdown_from_totals(*arrays.by_ticker())
+        else:
+            # ✅ un seul parcours des events : histogramme + heatmap (agrégat partagé avec le calendrier)
+            agg = year_aggregate(user, year, growth_pct=growth)
+            hist_months, hist_total, _ = agg.histogram()
+            div = _breakdown_from_totals(*agg.by_ticker())
+        return {"hist_months": hist_months, "hist_total": hist_total, "div": div}
+
+    ttl = getattr(settings, "DIVIDENDS_FORECAST_CACHE_TTL", 300)
+    g = format(growth.normalize(), "f")
+    return cached_fragment("forecast", user.pk, (year, g, timezone.localdate().isoformat()), ttl, build)
+
+
+def _universe_fragment(user, perf: dict) -> dict:
+    def build():
+        # l'univers complet n'est plus rendu dans le HTML : l'achat passe par la recherche (api_instruments)
+        u_by_symbol = instrument_master().by_symbol
+
+        # ✅ SELL choices = uniquement les positions détenues (qty > 0)
+        sell_choices = []
+        for r in perf["rows"]:
+            it = u_by_symbol.get(r.ticker)
+            sell_choices.append(
+                {
+                    "key": (it.key if it else ""),
+                    "label": (f"{it.label} — {it.ticker}" if it else r.ticker),
+                    "ticker": r.ticker,
+                    "qty": r.qty,
+                }
+            )
+        return {"sell_choices": sell_choices}
+
+    ttl = getattr(settings, "DIVIDENDS_FORECAST_CACHE_TTL", 300)
+    return cached_fragment("universe", user.pk, (), ttl, build)
+
+
+def _finance(div: dict, perf: dict) -> dict:
+    # combine prévision (année) et perf (positions) : calcul trivial, pas mis en cache
+    y_cost = _pct(_safe_div(_d0(div["div_total"]), _d0(perf["total_cost"]))).quantize(Decimal("0.1"))
+    y_market = _pct(_safe_div(_d0(div["div_total"]), _d0(perf["total_market"]))).quantize(Decimal("0.1"))
+    pnl_vs_received = _money(_d0(perf["total_pnl"]) + _d0(div["div_received"]))
+    return {**div, "yield_cost_pct": y_cost, "yield_market_pct": y_market, "pnl_vs_received": pnl_vs_received}
+
+
+def _dashboard_params(request) -> Tuple[date, int, Decimal]:
+    today = timezone.localdate()
+    return today, _get_int(request, "y", today.year), _clamp_growth(_get_decimal(request, "g", "0"))
+
+
+def _forecast_ctx(today: date, year: int, growth: Decimal, fc: dict, perf: dict) -> dict:
+    return {
+        "today": today,
+        "hist_year": year,
+        "growth": growth,
+        "hist_months": fc["hist_months"],
+        "hist_total": fc["hist_total"],
+        "prev_y": year - 1,
+        "next_y": year + 1,
+        "finance": _finance(fc["div"], perf),
+    }
+
+
 @login_required
 def dividends_dashboard(request):
-    today = timezone.localdate()
-    year = _get_int(request, "y", today.year)
-    growth = _get_decimal(request, "g", "0")
+    today, year, growth = _dashboard_params(request)
 
-    events = build_year_events(request.user, year, growth_pct=growth)
-    hist_months, hist_total, _ = year_histogram(events, year)
+    perf = _perf_fragment(request.user)
+    ctx = _forecast_ctx(today, year, growth, _forecast_fragment(request.user, year, growth), perf)
+    ctx.update(_universe_fragment(request.user, perf))
+    ctx["perf"] = perf
 
-    perf = _build_perf_snapshot(request.user)
+    return render(request, "dividends/dividends_dashboard.html", ctx)
 
-    div = _build_dividend_breakdown(events, year)
-    y_cost = _pct(_safe_div(_d0(div["div_total"]), _d0(perf["total_cost"]))).quantize(Decimal("0.1"))
-    y_market = _pct(_safe_div(_d0(div["div_total"]), _d0(perf["total_market"]))).quantize(Decimal("0.1"))
-    pnl_vs_received = _money(_d0(perf["total_pnl"]) + _d0(div["div_received"]))
-    finance = {**div, "yield_cost_pct": y_cost, "yield_market_pct": y_market, "pnl_vs_received": pnl_vs_received}
 
-    universe = universe_choices()
-    active_assets = Asset.objects.filter(user=request.user, is_active=True).only("ticker", "symbol").order_by("ticker")
+DASHBOARD_FRAGMENTS = {
+    "perf": "dividends/includes/dash_perf.html",
+    "forecast": "dividends/includes/dash_forecast.html",
+    "universe": "dividends/includes/dash_universe.html",
+}
 
-    # ✅ SELL choices = uniquement les positions détenues (qty > 0)
-    # On mappe UniverseItem par ticker ET par symbol (au cas où tu as des restes en DB)
-    u_by_ticker = {it.ticker: it for it in universe}
-    u_by_symbol = {it.symbol: it for it in universe}
 
-    sell_choices = []
-    for r in perf["rows"]:
-        it = u_by_ticker.get(r.ticker) or u_by_symbol.get(r.ticker)
-        sell_choices.append(
-            {
-                "key": (it.key if it else ""),
-                "label": (f"{it.label} — {it.ticker}" if it else r.ticker),
-                "ticker": r.ticker,
-                "qty": r.qty,
-            }
-        )
+@login_required
+@require_GET
+def dashboard_fragment(request, name: str):
+    """
+    Un fragment du dashboard, en HTML (défaut) ou JSON (?format=json).
+    forecast dépend de ?y= / ?g= ; perf et universe non.
+    """
+    if name not in DASHBOARD_FRAGMENTS:
+        return JsonResponse({"ok": False, "error": "unknown fragment"}, status=404)
 
-    return render(
-        request,
-        "dividends/dividends_dashboard.html",
-        {
-            "today": today,
-            "hist_year": year,
-            "growth": growth,
-            "hist_months": hist_months,
-            "hist_total": hist_total,
-            "prev_y": year - 1,
-            "next_y": year + 1,
-            "perf": perf,
-            "finance": finance,
-            "universe": universe,
-            "active_assets": active_assets,
-            "sell_choices": sell_choices,
-        },
-    )
+    today, year, growth = _dashboard_params(request)
+    ctx = _fragment_ctx(request.user, name, today, year, growth)
+    return _fragment_response(request, name, ctx)
+
+
+def _fragment_ctx(user, name: str, today: date, year: int, growth: Decimal) -> dict:
+    perf = _perf_fragment(user)
+    if name == "perf":
+        return {"perf": perf}
+    if name == "forecast":
+        return _forecast_ctx(today, year, growth, _forecast_fragment(user, year, growth), perf)
+    return {"hist_year": year, "growth": growth, **_universe_fragment(user, perf)}
+
+
+def _fragment_response(request, name: str, ctx: dict):
+    if request.GET.get("format") == "json":
+        data = {k: v for k, v in ctx.items() if k != "today"}
+        return JsonResponse({"ok": True, "fragment": name, **data}, encoder=_FragmentEncoder)
+
+    return render(request, DASHBOARD_FRAGMENTS[name], ctx)
+
+
+class _FragmentEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if is_dataclass(o):
+            return asdict(o)
+        return super().default(o)
 
 
 @login_required
@@ -451,17 +496,13 @@ def dividends_calendar(request):
     today = timezone.localdate()
     year = _get_int(request, "y", today.year)
     month = _get_int(request, "m", today.month)
-    growth = _get_decimal(request, "g", "0")
-
-    events_year = build_year_events(request.user, year, growth_pct=growth)
-
-    start = date(year, month, 1)
-    end = date(year + (month == 12), 1 if month == 12 else month + 1, 1)
+    growth = _clamp_growth(_get_decimal(request, "g", "0"))
 
-    events_month = [e for e in events_year if start <= e.display_date < end]
-    month_total_estimated = sum((e.estimated_amount for e in events_month), Decimal("0.00"))
+    # ✅ agrégat annuel en cache : changer de mois ne reprojette pas
+    agg = year_aggregate(request.user, year, growth_pct=growth)
+    month_total_estimated = agg.month_total(month)
 
-    grid = month_grid(year, month, events_month)
+    grid = agg.month_grid(month)
 
     prev_y, prev_m = (year - 1, 12) if month == 1 else (year, month - 1)
     next_y, next_m = (year + 1, 1) if month == 12 else (year, month + 1)
@@ -492,16 +533,29 @@ def portfolio(request):
 @login_required
 @require_GET
 def api_month_details(request):
+    try:
+        y, m, growth = _month_params(request)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    return JsonResponse(_month_payload(request.user, y, m, growth))
+
+
+def _month_params(request) -> Tuple[int, int, Decimal]:
     try:
         y = int(request.GET.get("y"))
         m = int(request.GET.get("m"))
     except (TypeError, ValueError):
-        return JsonResponse({"ok": False, "error": "bad params"}, status=400)
+        raise ValueError("bad params") from None
 
-    growth = _get_decimal(request, "g", "0")
+    growth = _get_growth(request)
 
-    events = build_year_events(request.user, y, growth_pct=growth)
-    month_events = [e for e in events if e.display_date.year == y and e.display_date.month == m]
+    if not 1 <= m <= 12:
+        raise ValueError("bad params")
+    return y, m, growth
+
+
+def _month_payload(user, y: int, m: int, growth: Decimal) -> dict:
+    month_events = build_month_events(user, y, m, growth_pct=growth)
 
     payload = []
     for e in month_events:
@@ -519,7 +573,120 @@ def api_month_details(request):
         )
 
     total = sum((Decimal(item["amount"]) for item in payload), Decimal("0.00"))
-    return JsonResponse({"ok": True, "year": y, "month": m, "total": str(total), "count": len(payload), "events": payload})
+    return {"ok": True, "year": y, "month": m, "total": str(total), "count": len(payload), "events": payload}
+
+
+RANGE_MAX_YEARS = 50
+
+
+@login_required
+@require_GET
+def api_range_events(request):
+    """Projection multi-années (totaux par année et par mois) pour les graphiques long terme."""
+    try:
+        start, end, growth = _range_params(request)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    return JsonResponse(_range_payload(request.user, start, end, growth))
+
+
+def _range_params(request) -> Tuple[int, int, Decimal]:
+    today = timezone.localdate()
+    start = _get_int(request, "from", today.year)
+    end = _get_int(request, "to", start + 9)
+    if end < start or end - start + 1 > RANGE_MAX_YEARS:
+        raise ValueError(f"bad range (max {RANGE_MAX_YEARS} years)")
+    return start, end, _get_growth(request)
+
+
+def _range_payload(user, start: int, end: int, growth: Decimal) -> dict:
+    by_year = build_range_events(user, start, end, growth_pct=growth)
+
+    years = []
+    for y, events in by_year.items():
+        months = [Decimal("0.00")] * 12
+        for e in events:
+            months[e.display_date.month - 1] += e.estimated_amount
+        years.append(
+            {
+                "year": y,
+                "total": str(sum(months, Decimal("0.00"))),
+                "months": [str(v) for v in months],
+                "count": len(events),
+            }
+        )
+
+    return {"ok": True, "from": start, "to": end, "growth": str(growth), "years": years}
+
+
+GRID_MAX_POINTS = 201
+
+
+@login_required
+@require_GET
+def api_growth_grid(request):
+    """
+    Sensibilité du total annuel à la croissance : ?y=&from=0&to=10&step=0.5 (en %).
+    Une seule projection (sans croissance, en cache) puis de l'arithmétique par point.
+    """
+    try:
+        year, growths = _growth_grid_params(request)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    return JsonResponse(_growth_grid_payload(request.user, year, growths))
+
+
+def _growth_grid_params(request) -> Tuple[int, List[Decimal]]:
+    today = timezone.localdate()
+    year = _get_int(request, "y", today.year)
+    g_from = _get_growth(request, "from", "0")
+    g_to = _get_growth(request, "to", "10")
+    step = _get_decimal(request, "step", "0.5")
+    if not 0 < step <= GROWTH_MAX - GROWTH_MIN:
+        raise ValueError("bad step")
+    if g_to < g_from or (g_to - g_from) / step + 1 > GRID_MAX_POINTS:
+        raise ValueError(f"bad grid (max {GRID_MAX_POINTS} points)")
+
+    # ✅ par indice : pas d'accumulation g += step (qui peut ne plus avancer après arrondi)
+    n = int((g_to - g_from) // step) + 1
+    return year, [g_from + i * step for i in range(n)]
+
+
+def _growth_grid_payload(user, year: int, growths: List[Decimal]) -> dict:
+    grid = growth_grid(build_year_base(user, year), year, growths)
+    payload = [{k: str(v) for k, v in row.items()} for row in grid]
+    return {"ok": True, "year": year, "grid": payload}
+
+
+INSTRUMENT_SEARCH_MAX = 50
+
+
+@login_required
+@require_GET
+def api_instruments(request):
+    """Recherche par préfixe (label, ticker, ISIN) pour le champ instrument : ?q=&limit=20."""
+    return JsonResponse(_instruments_payload(*_instruments_params(request)))
+
+
+def _instruments_params(request) -> Tuple[str, int]:
+    q = (request.GET.get("q") or "").strip()
+    return q, max(1, min(_get_int(request, "limit", 20), INSTRUMENT_SEARCH_MAX))
+
+
+def _instruments_payload(q: str, limit: int) -> dict:
+    results = [
+        {
+            "key": it.key,
+            "label": it.label,
+            "ticker": it.ticker,
+            "isin": it.isin,
+            "kind": it.kind,
+            "currency": it.currency,
+            "sector": it.sector,
+        }
+        for it in search_instruments(q, limit)
+    ]
+    return {"ok": True, "q": q, "results": results}
 
 
 # =========================
@@ -531,7 +698,7 @@ def toggle_asset_from_universe(request):
     action = (request.POST.get("action") or "add").strip().lower()
     key = (request.POST.get("universe_key") or "").strip().lower()
 
-    item = UNIVERSE.get(key)
+    item = get_instrument(key)
     if not item:
         messages.error(request, "Instrument inconnu.")
         return _redirect_dashboard_with_qs(request)
@@ -574,7 +741,8 @@ def add_buy_from_universe(request):
     price = _dec(request.POST.get("price"), "0")
     d = _parse_date(request.POST.get("date") or "")
 
-    if not key or key not in UNIVERSE:
+    item = get_instrument(key)
+    if item is None:
         messages.error(request, "Instrument invalide.")
         return _redirect_dashboard_with_qs(request)
     if qty <= 0 or price <= 0:
@@ -584,7 +752,6 @@ def add_buy_from_universe(request):
         messages.error(request, "Date invalide (format: YYYY-MM-DD).")
         return _redirect_dashboard_with_qs(request)
 
-    item = UNIVERSE[key]
     asset, _ = Asset.objects.get_or_create(
         user=request.user,
         ticker=item.ticker,
@@ -617,7 +784,8 @@ def add_sell_from_universe(request):
     price = _dec(request.POST.get("price"), "0")
     d = _parse_date(request.POST.get("date") or "")
 
-    if not key or key not in UNIVERSE:
+    item = get_instrument(key)
+    if item is None:
         messages.error(request, "Instrument invalide.")
         return _redirect_dashboard_with_qs(request)
     if qty <= 0 or price <= 0:
@@ -627,7 +795,6 @@ def add_sell_from_universe(request):
         messages.error(request, "Date invalide (format: YYYY-MM-DD).")
         return _redirect_dashboard_with_qs(request)
 
-    item = UNIVERSE[key]
     try:
         asset = Asset.objects.get(user=request.user, ticker=item.ticker)
     except Asset.DoesNotExist:
@@ -640,74 +807,26 @@ def add_sell_from_universe(request):
         asset.is_active = True
     asset.save()
 
-    held = _shares_held_now(request.user, asset.id)
-    if qty > held:
-        messages.error(request, f"Vente refusée : tu veux vendre {qty} mais tu ne détiens que {held}.")
+    # ✅ contrôle + insertion sous verrou de la position (ventes concurrentes / antidatées)
+    try:
+        record_sell(asset.id, d, qty, price)
+    except OversellError as e:
+        messages.error(
+            request, f"Vente refusée : tu veux vendre {qty} mais tu ne détiens que {e.available} (au {d} et après)."
+        )
         return _redirect_dashboard_with_qs(request)
 
-    Transaction.objects.create(asset=asset, type=Transaction.SELL, date=d, quantity=qty, price=price)
     messages.success(request, f"Vente ajoutée: {item.label} ({item.ticker}) — {qty} @ {price} le {d}")
     return _redirect_dashboard_with_qs(request)
 
-from collections import defaultdict
-from decimal import Decimal
-from dividends.models import Transaction
-
-def realized_pnl_by_month(asset: Asset):
-    txs = asset.transactions.all().order_by("date", "id")
-
-    qty = Decimal("0")
-    pmp = Decimal("0")
-    realized_by_ym = defaultdict(lambda: Decimal("0"))
-
-    for tx in txs:
-        q = Decimal(tx.quantity)
-        px = Decimal(tx.price)
-        fees = Decimal(tx.fees or 0)
-
-        if tx.type == Transaction.BUY:
-            new_qty = qty + q
-            total_cost = (qty * pmp) + (q * px) + fees
-            qty = new_qty
-            pmp = total_cost / qty
-
-        else:  # SELL
-            pnl = (px - pmp) * q - fees
-            ym = tx.date.strftime("%Y-%m")
-            realized_by_ym[ym] += pnl
-            qty -= q
-            if qty == 0:
-                pmp = Decimal("0")
-
-    return dict(realized_by_ym)
-
-
-
-
-
-# dividends/views.py (ajoute en bas, ou où tu veux)
-from decimal import Decimal
-from collections import defaultdict
-
-from django.contrib.auth.decorators import login_required
-from django.shortcuts import render
-from django.utils import timezone
-
-from dividends.models import Asset
-from dividends.services.pnl import compute_position, realized_pnl_by_month
-
-
 def _q2(x: Decimal) -> Decimal:
     return (x or Decimal("0")).quantize(Decimal("0.01"))
 
 
 @login_required
 def portfolio_view(request):
-    assets = (
-        Asset.objects.filter(user=request.user, is_active=True)
-        .only("id", "ticker", "sector", "currency", "last_price", "last_price_asof")
-        .order_by("ticker")
-    )
+    # ✅ un seul moteur (services.pnl.build_portfolio) : 2 requêtes quel que soit le nombre d'assets
+    book = build_portfolio(request.user)
 
     rows = []
     totals = {
@@ -717,13 +836,8 @@ def portfolio_view(request):
         "realized": Decimal("0"),
     }
 
-    realized_months = defaultdict(lambda: Decimal("0"))
-
-    for a in assets:
-        pos = compute_position(a)
-        if pos.qty <= 0:
-            continue
-
+    for aid, pos in book.positions.items():
+        a = book.assets[aid]
         rows.append(
             {
                 "id": a.id,
@@ -731,7 +845,7 @@ def portfolio_view(request):
                 "sector": a.sector or "—",
                 "qty": pos.qty,
                 "pmp": _q2(pos.pmp),
-                "last_price": _q2(Decimal(a.last_price or 0)),
+                "last_price": _q2(Decimal(resolved_price(a) or 0)),
                 "cost_basis": _q2(pos.cost_basis),
                 "market_value": _q2(pos.market_value),
                 "unrealized": _q2(pos.unrealized_pnl),
@@ -744,11 +858,8 @@ def portfolio_view(request):
         totals["unrealized"] += pos.unrealized_pnl
         totals["realized"] += pos.realized_pnl
 
-        for ym, pnl in realized_pnl_by_month(a).items():
-            realized_months[ym] += pnl
-
     # tri des mois
-    months_sorted = sorted(realized_months.items(), key=lambda kv: kv[0])
+    months_sorted = sorted(book.realized_by_month.items(), key=lambda kv: kv[0])
     months_rows = [{"ym": ym, "pnl": _q2(pnl)} for ym, pnl in months_sorted]
 
     ctx = {
@@ -756,5 +867,105 @@ def portfolio_view(request):
         "rows": rows,
         "totals": {k: _q2(v) for k, v in totals.items()},
         "months_rows": months_rows,
+        "sectors": [
+            {"name": k, "value": _q2(v)}
+            for k, v in sorted(book.sector_totals.items(), key=lambda kv: kv[1], reverse=True)
+        ],
     }
-    return render(request, "dividends/portfolio.html", ctx)
\ No newline at end of file
+    return render(request, "dividends/portfolio.html", ctx)
+
+
+# =========================
+# Variantes async (ASGI) : calculs indépendants en parallèle
+# Activées par DIVIDENDS_ASYNC_VIEWS (urls.py) ; mêmes URLs, mêmes réponses.
+# =========================
+@lru_cache(maxsize=1)
+def _executor() -> ThreadPoolExecutor:
+    # pool borné et dédié : ses threads gardent leur connexion DB d'une requête à l'autre (CONN_MAX_AGE),
+    # au plus DIVIDENDS_ASYNC_WORKERS connexions ouvertes par process
+    return ThreadPoolExecutor(
+        max_workers=getattr(settings, "DIVIDENDS_ASYNC_WORKERS", 4), thread_name_prefix="dividends-async"
+    )
+
+
+def _with_db(fn):
+    def run(*args):
+        # comme request_started / request_finished : ne ferme que les connexions expirées ou en erreur
+        close_old_connections()
+        try:
+            return fn(*args)
+        finally:
+            close_old_connections()
+
+    return run
+
+
+def _in_thread(fn, *args):
+    # pas thread_sensitive : les appels d'une même requête tournent en parallèle dans le pool
+    return sync_to_async(_with_db(fn), thread_sensitive=False, executor=_executor())(*args)
+
+
+@login_required
+async def dividends_dashboard_async(request):
+    user = await request.auser()
+    today, year, growth = _dashboard_params(request)
+
+    # ✅ perf, prévision et référentiel ne dépendent pas l'un de l'autre : latence ~ le plus lent
+    perf, fc, _master = await asyncio.gather(
+        _in_thread(_perf_fragment, user),
+        _in_thread(_forecast_fragment, user, year, growth),
+        _in_thread(instrument_master),  # 1er accès du process : parse du référentiel
+    )
+
+    ctx = _forecast_ctx(today, year, growth, fc, perf)
+    ctx.update(await _in_thread(_universe_fragment, user, perf))
+    ctx["perf"] = perf
+
+    # rendu en sync (messages / session / user dans le template)
+    return await sync_to_async(render)(request, "dividends/dividends_dashboard.html", ctx)
+
+
+async def _json_async(request, parse, build) -> JsonResponse:
+    user = await request.auser()
+    try:
+        params = parse(request)
+    except ValueError as e:
+        return JsonResponse({"ok": False, "error": str(e)}, status=400)
+    return JsonResponse(await _in_thread(build, user, *params))
+
+
+@login_required
+@require_GET
+async def api_month_details_async(request):
+    return await _json_async(request, _month_params, _month_payload)
+
+
+@login_required
+@require_GET
+async def api_range_events_async(request):
+    return await _json_async(request, _range_params, _range_payload)
+
+
+@login_required
+@require_GET
+async def api_growth_grid_async(request):
+    return await _json_async(request, _growth_grid_params, _growth_grid_payload)
+
+
+@login_required
+@require_GET
+async def dashboard_fragment_async(request, name: str):
+    if name not in DASHBOARD_FRAGMENTS:
+        return JsonResponse({"ok": False, "error": "unknown fragment"}, status=404)
+
+    user = await request.auser()
+    today, year, growth = _dashboard_params(request)
+    ctx = await _in_thread(_fragment_ctx, user, name, today, year, growth)
+    return await sync_to_async(_fragment_response)(request, name, ctx)
+
+
+@login_required
+@require_GET
+async def api_instruments_async(request):
+    # référentiel en mémoire une fois chargé ; seul le 1er accès du process lit le fichier
+    return JsonResponse(await _in_thread(_instruments_payload, *_instruments_params(request)))